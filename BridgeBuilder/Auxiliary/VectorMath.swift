@@ -98,6 +98,9 @@ extension CGPoint {
 // MARK: Point to Line Distance
 extension CGPoint {
     /// Gets intersection of normal from point to a line.
+    ///
+    /// The intersection is clamped to the line segment between `v` and `w`, so it's the closest point
+    /// of the segment and its distance to the point is `distance(toLineSegmentOf:and:)`.
     /// https://stackoverflow.com/questions/28505344/shortest-distance-from-cgpoint-to-segment
     func normalIntersectionWithLine(of v: CGPoint, and w: CGPoint) -> CGPoint {
         let pv_dx = x - v.x
@@ -231,7 +231,7 @@ class Bridge: Gene {
             // Get vertices within range. If a point is too close to another
             // vertex, cancel the operation.
             var verticesWithinRange: [Vertex] = []
-            for vertex in graph.allVertices {
+            for vertex in graph.vertices(near: newVertexPosition, within: Gene.connectionRange.upperBound) {
                 let distanceToVertex = newVertexPosition.distance(to: vertex.position)
 
                 // If the new vertex position would be too close to another vertex,
@@ -262,7 +262,7 @@ class Bridge: Gene {
         // graph becomes solvable.
         //
         // This is only for safety, not sure if it's needed.
-        while !Simulation(graph: graph).isSolvable() {
+        while !Simulation.isSolvable(graph: graph) {
             let randomVertex = skeletonVertices.randomElement()!
 
             // Randomly chooses a point within possible connection range to the vertex.
@@ -273,17 +273,12 @@ class Bridge: Gene {
 
             // If the new vertex is too close to an edge, we don't add the vertex
             // and we continue the while loop.
-            for edge in graph.allEgdes {
-                let vertices = Array(edge.vertices)
-                let edgeIntersection = newVertexPosition.normalIntersectionWithLine(of: vertices[0].position, and: vertices[1].position)
-                let distanceToEdge = newVertexPosition.distance(to: edgeIntersection)
-                if distanceToEdge < Gene.maxDistanceToSplitEdge { continue }
-            }
+            if graph.nearestEdge(to: newVertexPosition, within: Gene.maxDistanceToSplitEdge) != nil { continue }
 
             // Stores all vertices within connection range to the point.
             // If the point is too close to another existing vertex, continue.
             var verticesWithinRange: [Vertex] = []
-            for vertex in graph.allVertices {
+            for vertex in graph.vertices(near: newVertexPosition, within: Gene.connectionRange.upperBound) {
                 let distanceToVertex = newVertexPosition.distance(to: vertex.position)
 
                 // If the new vertex position would be too close to another
@@ -29,6 +29,16 @@ class MinMaterialBridge: Bridge, Evolvable {
     /// Stores the last calculated max stress. Initializes at infinity.
     var calculatedMaxStress = CGFloat.infinity
 
+    /// The fitness is the used material under the stress limit, so guided
+    /// mutations decrease the mass, or the stresses while they exceed the limit.
+    override var sensitivityMeasure: Simulation.SensitivityMeasure { .mass(stressLimit: Double(stressLimit)) }
+
+    /// If true, the fitness evaluation sizes every edge area within
+    /// `Gene.edgeAreaRange` for the stress limit before scoring the bridge, so
+    /// the evolution only has to find the topology and geometry. The sized
+    /// areas are kept in the graph. Defaults to true.
+    var sizesAreas = true
+
     /// Initializes a minumum material bridge from a given graph. Used during
     /// bridge copy, so no checks are performed to the graph.
     /// - Parameters:
@@ -69,6 +79,24 @@ class MinMaterialBridge: Bridge, Evolvable {
 
         addWeightForces()
         addLoadForces(totalLoad: load)
+
+        // Sizes the areas in a single NusaPlus call, with the weight forces
+        // following the areas, and then sets the forces of the sized edges.
+        if sizesAreas && Gene.edgeAreaRange.lowerBound < Gene.edgeAreaRange.upperBound {
+            let sizingSimulation = Simulation(graph: graph)
+            let design = sizingSimulation.fullyStressedDesign(
+                stressLimit: Double(stressLimit),
+                areaRange: Gene.edgeAreaRange,
+                weightFactor: 9.80665 * Gene.weightMultiplier
+            )
+            for (edge, area) in zip(sizingSimulation.edges, design.areas) {
+                graph.setArea(of: edge, to: area)
+            }
+            graph.resetForces()
+            addWeightForces()
+            addLoadForces(totalLoad: load)
+        }
+
         let simulation = Simulation(graph: graph)
         simulation.solve()
 
@@ -85,11 +113,13 @@ class MinMaterialBridge: Bridge, Evolvable {
     }
 
     func copy() -> Evolvable {
-        return MinMaterialBridge(
+        let bridge = MinMaterialBridge(
             load: load,
             stressLimit: stressLimit,
             graph: graph.copy(),
             floorYPosition: floorYPosition
         )
+        bridge.sizesAreas = sizesAreas
+        return bridge
     }
 }
@@ -27,6 +27,10 @@ class MinStressBridge: Bridge, Evolvable {
     /// Stores the last calculated max stress. Initializes at infinity.
     var calculatedMaxStress = CGFloat.infinity
 
+    /// The fitness is the mean of the three most stressed edges, so guided
+    /// mutations decrease it.
+    override var sensitivityMeasure: Simulation.SensitivityMeasure { .topMeanStress(count: 3) }
+
     /// Initializes a minumum stress bridge from a given graph. Used during
     /// bridge copy, so no checks are performed to the graph.
     /// - Parameters:
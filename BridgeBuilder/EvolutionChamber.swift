@@ -8,6 +8,8 @@
 import Foundation
 import CoreGraphics
 
+import PythonKit
+
 /// Class that will perform the evolution process with a population of genes. Mutation, crossover and selection
 /// of best performing individuals will be over generations.
 class EvolutionChamber {
@@ -41,6 +43,42 @@ class EvolutionChamber {
     /// on X axis.
     var fitnessStandardDeviationAndGeneration: [CGPoint] = []
 
+    /// Saves plots of the logged bridges and statistics plots during the run.
+    /// When false, the run only writes its run log and the plots can be
+    /// rendered from it afterwards.
+    var savesPlots: Bool = false
+
+    /// Prints the NusaPlus instrumentation report of each generation after
+    /// its evolution report.
+    var isInstrumented: Bool = false
+
+    /// Log of the current run, with the fitness statistics of each generation
+    /// and the logged bridges.
+    private var runLog: RunLog?
+
+    /// Screens the offspring of each generation with a NusaPlus fitness
+    /// surrogate before simulating them. Offspring it confidently predicts
+    /// won't survive the next replacement get the predicted fitness instead of
+    /// a simulation. Defaults to false, so every individual is simulated.
+    var screensOffspring: Bool = false
+
+    /// Fraction of the offspring found hopeless by the surrogate that are
+    /// simulated anyway, so its accuracy is known. Defaults to 0.1.
+    var surrogateAuditFraction: CGFloat = 0.1
+
+    /// NusaPlus `FitnessSurrogate`, trained with the features and fitnesses of
+    /// every simulated individual.
+    private lazy var surrogate: PythonObject = NusaPlus.FitnessSurrogate()
+
+    /// Fitness of the worst individual that survives the next replacement, used
+    /// as the surrogate threshold. Nil until the population is evaluated.
+    private var survivalFitness: CGFloat?
+
+    /// Offspring screened by the surrogate in the current generation, how many
+    /// of them were not simulated, and how many of the simulated ones were
+    /// checked against their verdict and got the right one.
+    private var surrogateCounts = (screened: 0, skipped: 0, checked: 0, correct: 0)
+
     /// Index of the individual representing the 20% position of the population.
     var topPercentIndex: Int {
         Int(round(Double(populationSize) * 0.2)) - 1
@@ -105,9 +143,81 @@ class EvolutionChamber {
         }
     }
 
-    /// Saves relevant plots of a bridge.
+    /// Calculates the fitness of every individual once and sorts the
+    /// population by it, so best individuals are at the beginning of the array.
+    ///
+    /// If `screensOffspring` is true, the offspring are first screened by the
+    /// surrogate and the ones it finds hopeless only get their predicted
+    /// fitness, unless they are audited. Every simulated individual trains the
+    /// surrogate.
+    /// - Parameter offspringStart: Index of the first offspring in the
+    ///   population. Defaults to nil, for no offspring.
+    private func evaluatePopulation(offspringStart: Int? = nil) {
+        let offspringStart = offspringStart ?? population.count
+        surrogateCounts = (0, 0, 0, 0)
+        guard screensOffspring else {
+            for individual in population { _ = individual.fitness() }
+            population.sort { $0.calculatedFitness > $1.calculatedFitness }
+            return
+        }
+
+        // Features are only computed for individuals whose graphs changed,
+        // like offspring and mutated survivors.
+        let features = population.map { individual -> PythonObject in
+            if let cached = individual.cachedFeatures, cached.graph === individual.graph, cached.version == individual.graph.version {
+                return cached.features
+            }
+            let features = NusaPlus.truss_features(Simulation(graph: individual.graph).model, Double(Gene.edgeDensity))
+            individual.cachedFeatures = (individual.graph, individual.graph.version, features, false)
+            return features
+        }
+
+        // Predicted fitnesses of the offspring found hopeless, by index.
+        var predictions: [Int:CGFloat] = [:]
+        if let threshold = survivalFitness, offspringStart < population.count {
+            let screen = surrogate.screen(Array(features[offspringStart...]), Double(threshold))
+            let hopeless = [Bool](screen.hopeless.tolist())!
+            let predicted = [Double](screen.predictions.tolist())!
+            surrogateCounts.screened = hopeless.count
+            for (offset, isHopeless) in hopeless.enumerated() where isHopeless {
+                predictions[offspringStart + offset] = CGFloat(predicted[offset])
+            }
+        }
+
+        var simulatedFeatures: [PythonObject] = []
+        var simulatedFitnesses: [Double] = []
+        for (index, individual) in population.enumerated() {
+            if let prediction = predictions[index], CGFloat.random(in: 0...1) >= surrogateAuditFraction {
+                individual.calculatedFitness = prediction
+                surrogateCounts.skipped += 1
+                continue
+            }
+
+            // Unchanged individuals are only added to the surrogate once.
+            let fitness = individual.fitness()
+            if individual.cachedFeatures?.isSampled == false {
+                simulatedFeatures.append(features[index])
+                simulatedFitnesses.append(Double(fitness))
+                individual.cachedFeatures?.isSampled = true
+            }
+
+            // Simulated offspring show if the surrogate verdict was right.
+            if let threshold = survivalFitness, index >= offspringStart, surrogateCounts.screened > 0 {
+                surrogateCounts.checked += 1
+                if (predictions[index] != nil) == (fitness < threshold) { surrogateCounts.correct += 1 }
+            }
+        }
+        surrogate.add(simulatedFeatures, simulatedFitnesses)
+
+        population.sort { $0.calculatedFitness > $1.calculatedFitness }
+        let survivors = populationSize - Int(round(replacementPercentage * CGFloat(populationSize)))
+        survivalFitness = population[max(min(survivors, population.count) - 1, 0)].calculatedFitness
+    }
+
+    /// Records a bridge in the run log and, if `savesPlots` is true, saves its
+    /// relevant plots.
     /// - Parameters:
-    ///   - bridge: Bridge to be ploted.
+    ///   - bridge: Bridge to be logged and ploted.
     ///   - generation: Generation number of the bridge. Used for metadata.
     private func savePlots(ofBridge bridge: Evolvable, generation: Int) {
         guard let bridgeCopy = bridge.copy() as? Bridge else { return }
@@ -117,56 +227,78 @@ class EvolutionChamber {
         let fitness = CGFloat(round(bridge.calculatedFitness*100)/100)
         let fitnessString = String(describing: fitness).replacingOccurrences(of: ".", with: ",")
 
-        // Creates a plot with all forces, not proportional because load forces
-        // will be much greater than other weight forces.
-        let allForcesSimulation = Simulation(graph: bridgeCopy.graph)
-        allForcesSimulation.saveModelPlot(
-            toPath: Simulation.mainPlotsPath,
-            withName: "All Forces fit\(fitnessString) g\(generation)",
-            isProportional: false,
-            plotFrame: bridgeFrame
-        )
-
-        // Creates a plot of the deformed shape with stresses.
-        let deformedShapeSimulation = Simulation(graph: bridgeCopy.graph)
-        deformedShapeSimulation.solve()
-        deformedShapeSimulation.saveDeformedShapePlot(
-            toPath: Simulation.mainPlotsPath,
-            withName: "Deformed fit\(fitnessString) g\(generation)",
-            deformingFactor: 1,
-            isProportional: true,
-            showsStresses: true,
-            // oesn't really matter as long as it's a bit higher than the maximum
-            // stresses values for a set of simulations
-            stressLimit: 0.5 * 300e6,
-            plotFrame: bridgeFrame
-        )
-
-        // Creates a plot with no forces. Saves it to simple plots path as well.
-        bridgeCopy.graph.resetForces()
-        let noForcesSimulation = Simulation(graph: bridgeCopy.graph)
-        noForcesSimulation.saveModelPlot(
-            toPath: Simulation.mainPlotsPath,
-            withName: "No Forces fit\(fitnessString) g\(generation)",
-            isProportional: true,
-            plotFrame: bridgeFrame
-        )
-        noForcesSimulation.saveModelPlot(
-            toPath: Simulation.specialPlotsPath,
-            withName: "No Forces Fixed fit\(fitnessString) g\(generation)",
-            isProportional: true,
-            plotFrame: Simulation.fixedPlotFrame
-        )
+        // A single solved simulation is used for all plots. The views are
+        // drawn and saved in the background, so the evolution doesn't wait.
+        let simulation = Simulation(graph: bridgeCopy.graph)
+        simulation.solve()
 
-        // Creates load only forces model plot.
+        // Load forces alone, for the load only forces plot.
         bridgeCopy.graph.resetForces()
         bridgeCopy.addLoadForces(totalLoad: 1)
-        let loadForcesSimulation = Simulation(graph: bridgeCopy.graph)
-        loadForcesSimulation.saveModelPlot(
-            toPath: Simulation.mainPlotsPath,
-            withName: "Load Forces fit\(fitnessString) g\(generation)",
-            isProportional: false,
-            plotFrame: bridgeFrame
+        var loadForces: [UUID:CGVector] = [:]
+        for vertex in bridgeCopy.graph.allVertices {
+            if let force = vertex.force { loadForces[vertex.id] = force }
+        }
+
+        runLog?.logTruss(of: simulation, generation: generation, fitness: bridge.calculatedFitness, loadForces: loadForces)
+        guard savesPlots else { return }
+
+        simulation.savePlotsInBackground([
+            // Plot with all forces, not proportional because load forces will
+            // be much greater than other weight forces.
+            Simulation.PlotView(
+                path: Simulation.mainPlotsPath,
+                name: "All Forces fit\(fitnessString) g\(generation)",
+                isProportional: false,
+                plotFrame: bridgeFrame
+            ),
+            // Plot of the deformed shape with stresses.
+            Simulation.PlotView(
+                kind: .deformed,
+                path: Simulation.mainPlotsPath,
+                name: "Deformed fit\(fitnessString) g\(generation)",
+                isProportional: true,
+                showsStresses: true,
+                deformingFactor: 1,
+                // oesn't really matter as long as it's a bit higher than the maximum
+                // stresses values for a set of simulations
+                stressLimit: 0.5 * 300e6,
+                plotFrame: bridgeFrame
+            ),
+            // Plots with no forces. Saved to simple plots path as well.
+            Simulation.PlotView(
+                path: Simulation.mainPlotsPath,
+                name: "No Forces fit\(fitnessString) g\(generation)",
+                forces: .hidden,
+                isProportional: true,
+                plotFrame: bridgeFrame
+            ),
+            Simulation.PlotView(
+                path: Simulation.specialPlotsPath,
+                name: "No Forces Fixed fit\(fitnessString) g\(generation)",
+                forces: .hidden,
+                isProportional: true,
+                plotFrame: Simulation.fixedPlotFrame
+            ),
+            // Load only forces model plot.
+            Simulation.PlotView(
+                path: Simulation.mainPlotsPath,
+                name: "Load Forces fit\(fitnessString) g\(generation)",
+                forces: .custom(loadForces),
+                isProportional: false,
+                plotFrame: bridgeFrame
+            ),
+        ])
+    }
+
+    /// Records the fitness statistics of a generation in the run log.
+    /// - Parameter generation: Current generation of the population
+    private func logStatistics(generation: Int) {
+        runLog?.logGeneration(
+            generation,
+            bestFitness: bestIndividual.calculatedFitness,
+            fitnessMean: fitnessMeanAndGeneration.last!.y,
+            fitnessStandardDeviation: fitnessStandardDeviationAndGeneration.last!.y
         )
     }
 
@@ -181,6 +313,17 @@ class EvolutionChamber {
         print("Current Top Fitnesses Mean: \(currentTopFitnessesMean)" )
         print("Best Fitness Material: \(bestIndividual.usedMaterial)")
         print("Best Fitness Max Stress: \(bestIndividual.calculatedMaxStress)")
+        let solveCache = Simulation.solveCacheInfo()
+        print("Solve Cache Hits/Misses: \(solveCache.hits)/\(solveCache.misses)")
+        if screensOffspring {
+            let counts = surrogateCounts
+            let skipRate = counts.screened > 0 ? round(1000 * CGFloat(counts.skipped) / CGFloat(counts.screened)) / 10 : 0
+            let accuracy = counts.checked > 0 ? "\(round(1000 * CGFloat(counts.correct) / CGFloat(counts.checked)) / 10)%" : "-"
+            print("Surrogate Skip Rate: \(skipRate)% (\(counts.skipped)/\(counts.screened)), Accuracy: \(accuracy) (\(counts.correct)/\(counts.checked))")
+        }
+        if isInstrumented {
+            print(Simulation.instrumentationReport(reset: true))
+        }
     }
 
     private func plotStatistics(generation: Int) {
@@ -272,8 +415,12 @@ class EvolutionChamber {
     func run() {
         // Sort the population according to the fitness before starting the
         // evolutionary loop.
-        population.sort { $0.fitness() > $1.fitness() }
+        evaluatePopulation()
 
+        Simulation.enableInstrumentation(isInstrumented)
+        let runLog = RunLog()
+        self.runLog = runLog
+        print("Run Log: \(runLog.path)")
 
         // Saves plots of the worst individual and 3 random individuals.
         let worstIndividualCopy = population.last!.copy()
@@ -302,6 +449,7 @@ class EvolutionChamber {
             CGPoint(x: 0, y: Array(population.map { $0.calculatedFitness }[0...topPercentIndex]).standardDeviation())
         )
 
+        logStatistics(generation: 0)
         evolutionReport(generation: 0)
 
         for currentGeneration in 1...generationLimit {
@@ -317,6 +465,7 @@ class EvolutionChamber {
             // Add new individuals by copying the best ones or via crossover of
             // the best individuals until the population size reaches it's
             // original value.
+            let offspringStart = population.count
             while population.count < populationSize {
                 let crossoverProbability = 0.95 //0.95
                 if CGFloat.random(in: 0...1) <= crossoverProbability {
@@ -339,7 +488,7 @@ class EvolutionChamber {
 
             // Sort population by fitness, so best individuals are at the
             // beginning of the array.
-            population.sort { $0.fitness() > $1.fitness() }
+            evaluatePopulation(offspringStart: offspringStart)
 
             // If there is a new best individual, save it.
             if (population.first!.calculatedFitness - bestIndividual.calculatedFitness) > 0.0001 {
@@ -356,12 +505,13 @@ class EvolutionChamber {
             fitnessStandardDeviationAndGeneration.append(
                 CGPoint(x: CGFloat(currentGeneration), y: Array(population.map { $0.calculatedFitness }[0...topPercentIndex]).standardDeviation())
             )
+            logStatistics(generation: currentGeneration)
             evolutionReport(generation: currentGeneration)
 
             // Every 50 generations create statistics plots.
             if (currentGeneration != 0) && (currentGeneration % 50 == 0) {
                 dataReport()
-                plotStatistics(generation: currentGeneration)
+                if savesPlots { plotStatistics(generation: currentGeneration) }
             }
         }
 
@@ -369,8 +519,13 @@ class EvolutionChamber {
         // the plot it.
         if (generationLimit % 50) != 0 {
             dataReport()
-            plotStatistics(generation: generationLimit)
+            if savesPlots { plotStatistics(generation: generationLimit) }
         }
+
+        // Waits for the bridges plots still being saved in the background.
+        Simulation.waitForBackgroundPlots()
+        runLog.close()
+        self.runLog = nil
     }
 
 }
@@ -46,9 +46,7 @@ extension Gene {
 
         // Array of vertices of the donnor graph within random distance from the
         // random vertex, including the random vertex itself.
-        let donnorVerticesWithinDistance = donnorGraph.allVertices.filter {
-            randomVertex.position.distance(to: $0.position) <= randomDistance
-        }
+        let donnorVerticesWithinDistance = donnorGraph.vertices(near: randomVertex.position, within: randomDistance)
 
         // A subgraph copy that we will try to move to the gene's graph.
         let donnorSubgraph = Graph()
@@ -70,6 +68,7 @@ extension Gene {
                 isXEvolutionFixed: donnorVertex.isXEvolutionFixed,
                 isYEvolutionFixed: donnorVertex.isYEvolutionFixed
             )
+            vertexCopy.displacement = donnorVertex.displacement
             originalToCopyVertices[donnorVertex] = vertexCopy
             partialDonnorEdges.append(contentsOf: donnorGraph.edges(of: donnorVertex))
         }
@@ -95,125 +94,120 @@ extension Gene {
                 area: donnorEdge.area)
         }
 
-        // Removes vertices that are in the same area of the subgraph on a copy
-        // of the gene's graph.
-        let graphCopy = graph.copy()
-        let verticesToRemove = graphCopy.allVertices.filter {
-            randomVertex.position.distance(to: $0.position) <= randomDistance
-        }
-        for vertexToRemove in verticesToRemove {
-            graphCopy.remove(vertex: vertexToRemove)
-        }
+        // The subgraph replaces the vertices in its area in a transaction,
+        // which is rolled back if the resulting graph is not valid.
+        return graph.transaction {
+            // Removes vertices that are in the same area of the subgraph.
+            let verticesToRemove = graph.vertices(near: randomVertex.position, within: randomDistance)
+            for vertexToRemove in verticesToRemove {
+                graph.remove(vertex: vertexToRemove)
+            }
 
-        // Vertices and edges of the gene's graph after removing nodes in the
-        // subgraph area.
-        let originalVertices = graphCopy.allVertices
-        let originalEdges = graphCopy.allEgdes
+            // Vertices and edges of the gene's graph after removing nodes in the
+            // subgraph area are the ones not in the subgraph.
+            let isOriginal = { (vertex: Vertex) in donnorSubgraph.adjacencyList[vertex] == nil }
 
-        // Copies subgraph to the gene's graph copy.
-        for subgraphVertex in donnorSubgraph.allVertices {
-            assert(graphCopy.adjacencyList[subgraphVertex] == nil, "Tried to replace an existing value when copying the subgraph to the graph in crossover.")
-            graphCopy.adjacencyList[subgraphVertex] = donnorSubgraph.adjacencyList[subgraphVertex]
-        }
+            // Copies subgraph to the gene's graph.
+            for subgraphVertex in donnorSubgraph.allVertices {
+                graph.insert(subgraphVertex, edges: donnorSubgraph.edges(of: subgraphVertex))
+            }
 
-        // Dictionary indicating vertices that could not be added to the graph
-        // because they were too close to an existing vertex or edge. A true
-        // value indicates it was removed.
-        var subgraphRemovedVertices: Set<Vertex> = []
-
-        // If a new vertex is too close to an existing original vertex, remove
-        // that new vertex and save it to a dictionary of removed vertices.
-        for subgraphVertex in donnorSubgraph.allVertices {
-            for originalVertex in originalVertices {
-                if subgraphVertex.position.distance(to: originalVertex.position) < Gene.minVertexDistance {
-                    graphCopy.remove(vertex: subgraphVertex)
+            // Dictionary indicating vertices that could not be added to the graph
+            // because they were too close to an existing vertex or edge. A true
+            // value indicates it was removed.
+            var subgraphRemovedVertices: Set<Vertex> = []
+
+            // If a new vertex is too close to an existing original vertex, remove
+            // that new vertex and save it to a dictionary of removed vertices.
+            for subgraphVertex in donnorSubgraph.allVertices {
+                let closeVertices = graph.vertices(near: subgraphVertex.position, within: Gene.minVertexDistance)
+                if closeVertices.contains(where: { isOriginal($0) && subgraphVertex.position.distance(to: $0.position) < Gene.minVertexDistance }) {
+                    graph.remove(vertex: subgraphVertex)
                     subgraphRemovedVertices.insert(subgraphVertex)
                 }
             }
-        }
 
-        // If a new vertex is too close to an existing original edge, remove
-        // that new vertex. It's safe to remove an already removed vertex.
-        for subgraphVertex in donnorSubgraph.allVertices {
-            for originalEdge in originalEdges {
-                let vertices = Array(originalEdge.vertices)
-                let edgeIntersection = subgraphVertex.position.normalIntersectionWithLine(of: vertices[0].position, and: vertices[1].position)
-                let distanceToEdge = subgraphVertex.position.distance(to: edgeIntersection)
-                if distanceToEdge < Gene.maxDistanceToSplitEdge {
-                    graphCopy.remove(vertex: subgraphVertex)
+            // If a new vertex is too close to an existing original edge, remove
+            // that new vertex. It's safe to remove an already removed vertex.
+            for subgraphVertex in donnorSubgraph.allVertices {
+                let closeEdges = graph.edges(near: subgraphVertex.position, within: Gene.maxDistanceToSplitEdge)
+                let isCloseToOriginalEdge = closeEdges.contains { edge in
+                    let vertices = Array(edge.vertices)
+                    return isOriginal(vertices[0]) && isOriginal(vertices[1])
+                        && subgraphVertex.position.distance(toLineSegmentOf: vertices[0].position, and: vertices[1].position) < Gene.maxDistanceToSplitEdge
+                }
+                if isCloseToOriginalEdge {
+                    graph.remove(vertex: subgraphVertex)
                     subgraphRemovedVertices.insert(subgraphVertex)
                 }
             }
-        }
 
-        // If no vertices could be added, the operation failed.
-        let addedVertices = Set(donnorSubgraph.allVertices).subtracting(subgraphRemovedVertices)
-        if addedVertices.isEmpty { return false }
-
-        // Connect new added vertices to from 1 to 3 vertices within range that
-        // are outside the subgraph.
-        for addedVertex in addedVertices {
-            var newVertexConnections = 0
-            let newVertexConnectionsLimit = Int.random(in: 1...3)
-            for originalVertex in originalVertices {
-                if newVertexConnections == newVertexConnectionsLimit {
-                    break }
-                let distanceToVertex = addedVertex.position.distance(to: originalVertex.position)
-                if Gene.connectionRange.contains(distanceToVertex) {
-                    graphCopy.addEdge(
-                        between: addedVertex,
-                        and: originalVertex,
-                        elasticity: Gene.edgeElasticity,
-                        area: RandomCGFloat.normal(in: Gene.edgeAreaRange)
-                    )
-                    newVertexConnections += 1
+            // If no vertices could be added, the operation failed.
+            let addedVertices = Set(donnorSubgraph.allVertices).subtracting(subgraphRemovedVertices)
+            if addedVertices.isEmpty { return false }
+
+            // Connect new added vertices to from 1 to 3 vertices within range that
+            // are outside the subgraph.
+            for addedVertex in addedVertices {
+                var newVertexConnections = 0
+                let newVertexConnectionsLimit = Int.random(in: 1...3)
+                let originalVertices = graph.vertices(near: addedVertex.position, within: Gene.connectionRange.upperBound).filter(isOriginal)
+                for originalVertex in originalVertices {
+                    if newVertexConnections == newVertexConnectionsLimit {
+                        break }
+                    let distanceToVertex = addedVertex.position.distance(to: originalVertex.position)
+                    if Gene.connectionRange.contains(distanceToVertex) {
+                        graph.addEdge(
+                            between: addedVertex,
+                            and: originalVertex,
+                            elasticity: Gene.edgeElasticity,
+                            area: RandomCGFloat.normal(in: Gene.edgeAreaRange)
+                        )
+                        newVertexConnections += 1
+                    }
                 }
             }
-        }
 
-        // Checks if every singly-axis-evolution-fixed vertex is connected to
-        // at least one other evolution fixed vertex on the perpendicular axis
-        // with a greater axis value and one with a smaller axis value. This
-        // guarantees a continuous line across the evolution free axis.
-        let singlyEvolutionFixedAxisVertices = graphCopy.allVertices.filter {
-            if $0.isXEvolutionFixed && !$0.isYEvolutionFixed { return true }
-            if $0.isYEvolutionFixed && !$0.isXEvolutionFixed { return true }
-            return false
-        }
+            // Checks if every singly-axis-evolution-fixed vertex is connected to
+            // at least one other evolution fixed vertex on the perpendicular axis
+            // with a greater axis value and one with a smaller axis value. This
+            // guarantees a continuous line across the evolution free axis.
+            let singlyEvolutionFixedAxisVertices = graph.allVertices.filter {
+                if $0.isXEvolutionFixed && !$0.isYEvolutionFixed { return true }
+                if $0.isYEvolutionFixed && !$0.isXEvolutionFixed { return true }
+                return false
+            }
 
-        for vertex in singlyEvolutionFixedAxisVertices {
-            if vertex.isXEvolutionFixed {
-                let evolutionFixedNeighbors = graphCopy.neighbors(of: vertex).filter {
-                    $0.isXEvolutionFixed
+            for vertex in singlyEvolutionFixedAxisVertices {
+                if vertex.isXEvolutionFixed {
+                    let evolutionFixedNeighbors = graph.neighbors(of: vertex).filter {
+                        $0.isXEvolutionFixed
+                    }
+                    print(evolutionFixedNeighbors.count, "fixed neighbors")
+                    guard evolutionFixedNeighbors.contains(where: {
+                        $0.position.y > vertex.position.y
+                    }) else { return false }
+                    guard evolutionFixedNeighbors.contains(where:  {
+                        $0.position.y < vertex.position.y
+                    }) else { return false }
                 }
-                print(evolutionFixedNeighbors.count, "fixed neighbors")
-                guard evolutionFixedNeighbors.contains(where: {
-                    $0.position.y > vertex.position.y
-                }) else { return false }
-                guard evolutionFixedNeighbors.contains(where:  {
-                    $0.position.y < vertex.position.y
-                }) else { return false }
-            }
-            if vertex.isYEvolutionFixed {
-                let evolutionFixedNeighbors = graphCopy.neighbors(of: vertex).filter {
-                    $0.isYEvolutionFixed
+                if vertex.isYEvolutionFixed {
+                    let evolutionFixedNeighbors = graph.neighbors(of: vertex).filter {
+                        $0.isYEvolutionFixed
+                    }
+                    guard evolutionFixedNeighbors.contains(where: {
+                        $0.position.x > vertex.position.x
+                    }) else { return false }
+                    guard evolutionFixedNeighbors.contains(where: {
+                        $0.position.x < vertex.position.x
+                    }) else { return false }
                 }
-                guard evolutionFixedNeighbors.contains(where: {
-                    $0.position.x > vertex.position.x
-                }) else { return false }
-                guard evolutionFixedNeighbors.contains(where: {
-                    $0.position.x < vertex.position.x
-                }) else { return false }
             }
-        }
 
-        // If the new graph with the addition of the subgraph is unstable or is
-        // not solvable, cancel the operation. Otherwise, update the gene's
-        // graph.
-        if graphCopy.isUnstable() { return false }
-        guard Simulation(graph: graphCopy).isSolvable() else { return false }
-        
-        graph = graphCopy
-        return true
+            // If the new graph with the addition of the subgraph is unstable or is
+            // not solvable, cancel the operation. Otherwise, keep it.
+            if graph.isUnstable() { return false }
+            return Simulation.isSolvable(graph: graph)
+        }
     }
 }
@@ -11,6 +11,8 @@
 import Foundation
 import CoreGraphics
 
+import PythonKit
+
 // MARK: Vertices Within Range
 
 extension Gene {
@@ -28,7 +30,9 @@ extension Gene {
         // If the point is too close to another existing vertex, return nil.
         var verticesWithinRange: [Vertex] = []
 
-        for vertex in Set(graph.allVertices).subtracting(Set(verticesToIgnore)) {
+        // Vertices closer than the connection range are near the point too, so
+        // only the vertices near it need to be checked.
+        for vertex in graph.vertices(near: point, within: Gene.connectionRange.upperBound) where !verticesToIgnore.contains(vertex) {
             let distanceToVertex = point.distance(to: vertex.position)
 
             // If the new vertex position would be too close to another vertex,
@@ -74,17 +78,16 @@ extension Gene {
     ///     other two edges connected to the desired position
     ///   - position: The position of the new vertex. Expected to be on the
     ///     original edge line.
-    ///   - graph: Graph which we will try to add the vertex to.
     ///   - shouldIgnoreSolvability: If true, does not check if graph is solvable
     ///     after the operation. Defaults to false.
-    /// - Returns: A graph with the new vertex if the operation was successful.
-    ///   Otherwise, nil.
-    private func tryToAddVertexBySplitting(edge: Edge, at position: CGPoint, of graph: Graph, shouldIgnoreSolvability: Bool = false) -> Graph? {
+    /// - Returns: True if the vertex was added. Otherwise, false and the graph is
+    ///   left unchanged.
+    private func tryToAddVertexBySplitting(edge: Edge, at position: CGPoint, shouldIgnoreSolvability: Bool = false) -> Bool {
         // Stores all vertices within connection range to the new vertex position.
         // If the new vertex would be too close to another existing vertex, the
         // vertices array will be nil and the operation will be cancelled.
         guard let verticesWithinRange = getVerticesWithinRange(to: position, of: graph) else {
-            return nil
+            return false
         }
 
         // There should be at least 3 vertices within range of the new vertex.
@@ -92,7 +95,7 @@ extension Gene {
         // more connection will be required for triangulation of the new vertex.
         // More than 3 connections may be needed, so a vertex triangulation check
         // will be performed before adding the new vertex.
-        guard verticesWithinRange.count >= 3 else { return nil }
+        guard verticesWithinRange.count >= 3 else { return false }
 
         assert(edge.vertices.isSubset(of: Set(verticesWithinRange)), "Original vertices of edge that would be split are not part of vertices within connection range of the new vertex.")
         //Original edge vertices.
@@ -103,28 +106,29 @@ extension Gene {
             $0 != edgeVertices[0] && $0 != edgeVertices[1]
         }
 
-        let graphCopy = graph.copy()
-        graphCopy.remove(edge: edge)
+        // The edge is split in a transaction, which is rolled back if the
+        // resulting graph is not rigid.
+        return graph.transaction {
+            graph.remove(edge: edge)
 
-        let isXEvolutionFixed = edgeVertices.allSatisfy { $0.isXEvolutionFixed }
-        let isYEvolutionFixed = edgeVertices.allSatisfy { $0.isYEvolutionFixed }
+            let isXEvolutionFixed = edgeVertices.allSatisfy { $0.isXEvolutionFixed }
+            let isYEvolutionFixed = edgeVertices.allSatisfy { $0.isYEvolutionFixed }
 
-        let newVertex = addVertex(to: graphCopy, at: position, connectedTo: verticesToConnect, withXEvolutionFixed: isXEvolutionFixed, withYEvolutionFixed: isYEvolutionFixed)
+            let newVertex = addVertex(at: position, connectedTo: verticesToConnect, withXEvolutionFixed: isXEvolutionFixed, withYEvolutionFixed: isYEvolutionFixed)
 
-        // Adds connection from new vertex to original edge vertice, maintaining
-        // original edge area.
-        graphCopy.addEdge(between: newVertex, and: edgeVertices[0], elasticity: Gene.edgeElasticity, area: edge.area)
-        graphCopy.addEdge(between: newVertex, and: edgeVertices[1], elasticity: Gene.edgeElasticity, area: edge.area)
+            // Adds connection from new vertex to original edge vertice, maintaining
+            // original edge area.
+            graph.addEdge(between: newVertex, and: edgeVertices[0], elasticity: Gene.edgeElasticity, area: edge.area)
+            graph.addEdge(between: newVertex, and: edgeVertices[1], elasticity: Gene.edgeElasticity, area: edge.area)
 
-        // Checks if the graph copy is rigid before assigning it to the gene graph.
-        // If it is not rigid, cancel the operation.
-        if !shouldIgnoreSolvability {
-            if graphCopy.isUnstable() { return nil }
-            guard graphCopy.isVertexTriangulated(newVertex) else { return nil }
-            guard Simulation(graph: graphCopy).isSolvable() else { return nil }
+            // Checks if the graph is rigid. If it is not, cancel the operation.
+            if !shouldIgnoreSolvability {
+                if graph.isUnstable() { return false }
+                guard graph.isVertexTriangulated(newVertex) else { return false }
+                guard Simulation.isSolvable(graph: graph) else { return false }
+            }
+            return true
         }
-
-        return graphCopy
     }
 
     /// Tries to create a random new vertex connected to at least two other vertices respecting maximum
@@ -133,10 +137,8 @@ extension Gene {
     ///   after the operation. Defaults to false.
     /// - Returns: True if a vertex was successfully created. False it fails to do so.
     private func tryToAddRandomVertex(shouldIgnoreSolvability: Bool = false) -> Bool {
-        let graphCopy = graph.copy()
-
         // Randomly chooses a vertex, if the graph is not empty
-        guard let randomVertex = graphCopy.allVertices.randomElement() else { return false }
+        guard let randomVertex = graph.allVertices.randomElement() else { return false }
 
         // Randomly chooses a point within possible connection range to the vertex.
         let randomDistance = CGFloat.random(in: Gene.connectionRange)
@@ -147,24 +149,16 @@ extension Gene {
         // Stores all vertices within connection range to the new vertex position.
         // If the new vertex would be too close to another existing vertex, the
         // vertices array will be nil and the operation will be cancelled.
-        guard var verticesWithinRange = getVerticesWithinRange(to: newVertexPosition, of: graphCopy) else {
+        guard var verticesWithinRange = getVerticesWithinRange(to: newVertexPosition, of: graph) else {
             return false
         }
 
         // If the new vertex is too close to an edge, try to add the vertex by
-        // spliting the existing edge and connecting it to at least two vertices.
-        for edge in graphCopy.allEgdes {
+        // spliting the closest edge and connecting it to at least two vertices.
+        if let edge = graph.nearestEdge(to: newVertexPosition, within: Gene.maxDistanceToSplitEdge) {
             let vertices = Array(edge.vertices)
             let edgeIntersection = newVertexPosition.normalIntersectionWithLine(of: vertices[0].position, and: vertices[1].position)
-            let distanceToEdge = newVertexPosition.distance(to: edgeIntersection)
-            if distanceToEdge < Gene.maxDistanceToSplitEdge {
-                if let newGraph = tryToAddVertexBySplitting(edge: edge, at: edgeIntersection, of: graphCopy) {
-                    graph = newGraph
-                    return true
-                } else {
-                    return false
-                }
-            }
+            return tryToAddVertexBySplitting(edge: edge, at: edgeIntersection)
         }
 
         // If there are less than two possible connections to the new vertex,
@@ -191,15 +185,13 @@ extension Gene {
                 verticesToConnect.append(verticesWithinRange.removeFirst())
             }
         }
-        addVertex(to: graphCopy, at: newVertexPosition, connectedTo: Array(verticesToConnect))
 
-        // If the new graph is solvable, assign it to the gene's graph and return
-        // true. Otherwise, cancel the operation and return false.
-        if !shouldIgnoreSolvability {
-            guard Simulation(graph: graph).isSolvable() else { return false }
+        // If the graph with the new vertex is solvable, keep it and return true.
+        // Otherwise, roll back the operation and return false.
+        return graph.transaction {
+            addVertex(at: newVertexPosition, connectedTo: Array(verticesToConnect))
+            return shouldIgnoreSolvability || Simulation.isSolvable(graph: graph)
         }
-        graph = graphCopy
-        return true
     }
 
     /// Adds a vertex to a graph at a given position and connect the edge with other given existing vertices.
@@ -273,18 +265,17 @@ extension Gene {
         }
 
         let neighbors = graph.neighbors(of: vertex)
-        let graphCopy = graph.copy()
-        graphCopy.remove(vertex: vertex)
-
-        //Checks if the graph copy is rigid before assigning it to the gene graph.
-        if graphCopy.isUnstable() { return false }
-        for neighbor in neighbors {
-            guard graphCopy.isVertexTriangulated(neighbor) else { return false }
+        return graph.transaction {
+            graph.remove(vertex: vertex)
+
+            // Checks if the graph is still rigid. Otherwise, the removal is
+            // rolled back.
+            if graph.isUnstable() { return false }
+            for neighbor in neighbors {
+                guard graph.isVertexTriangulated(neighbor) else { return false }
+            }
+            return Simulation.isSolvable(graph: graph)
         }
-        guard Simulation(graph: graphCopy).isSolvable() else { return false }
-
-        graph = graphCopy
-        return true
     }
 
     /// Tries to remove a simulation fixed vertex and connect its evolution fixed neighbors
@@ -313,32 +304,30 @@ extension Gene {
         }
         let meanEdgeArea = (evolutionFixedEdges[0].area + evolutionFixedEdges[1].area)/2
 
-        // Remove the vertex and its edges on the graph copy.
-        let graphCopy = graph.copy()
-        graphCopy.remove(vertex: vertex)
-
-        // If the distance between the evolution fixed vertices is within range
-        // and the vertices are not already connected, add the edge.
+        // The evolution fixed vertices can only be connected if the distance
+        // between them is within range.
         guard evolutionFixedNeighbors[0].position.distance(to: evolutionFixedNeighbors[1].position) <= Gene.maxEdgeLength else { return false }
 
-        if !graph.areVerticesNeighbors(evolutionFixedNeighbors[0], evolutionFixedNeighbors[1]) {
-            graphCopy.addEdge(between: evolutionFixedNeighbors[0], and: evolutionFixedNeighbors[1], elasticity: Gene.edgeElasticity, area: meanEdgeArea)
-        }
+        return graph.transaction {
+            // Remove the vertex and its edges and, if the evolution fixed
+            // vertices are not already connected, add the edge.
+            graph.remove(vertex: vertex)
+            if !graph.areVerticesNeighbors(evolutionFixedNeighbors[0], evolutionFixedNeighbors[1]) {
+                graph.addEdge(between: evolutionFixedNeighbors[0], and: evolutionFixedNeighbors[1], elasticity: Gene.edgeElasticity, area: meanEdgeArea)
+            }
 
-        // Check if all original neighbors of the removed vertex are still
-        // rigid before assigning the graph copy to the gene graph. If
-        // vertices are not fully triangulated, cancel the operation.
-        //
-        // Check if is unstable won't hurt but is not really needed. In the end
-        // we are removing 1 edge and 1 vertex. So the graph will pass the test.
-        if graphCopy.isUnstable() { return false }
-        for neighbor in neighbors {
-            guard graphCopy.isVertexTriangulated(neighbor) else { return false }
+            // Check if all original neighbors of the removed vertex are still
+            // rigid. If vertices are not fully triangulated, the operation is
+            // rolled back.
+            //
+            // Check if is unstable won't hurt but is not really needed. In the end
+            // we are removing 1 edge and 1 vertex. So the graph will pass the test.
+            if graph.isUnstable() { return false }
+            for neighbor in neighbors {
+                guard graph.isVertexTriangulated(neighbor) else { return false }
+            }
+            return Simulation.isSolvable(graph: graph)
         }
-        guard Simulation(graph: graphCopy).isSolvable() else { return false }
-
-        graph = graphCopy
-        return true
     }
 }
 
@@ -408,10 +397,15 @@ extension Gene {
 
     /// Removes a random edge from the graph while maintaining all vertices triangulated.
     func removeRandomEdge() {
+        // The current graph is factorized once, so each tryout only needs a
+        // low rank update to know if the graph stays solvable without an edge.
+        let simulation = Simulation(graph: graph)
+        let solvedTruss = simulation.solvedTruss()
+
         var didRemoveEdge = false
         var counter = 0
         while !didRemoveEdge {
-            didRemoveEdge = tryToRemoveRandomEdge()
+            didRemoveEdge = tryToRemoveRandomEdge(simulation: simulation, solvedTruss: solvedTruss)
 
             counter += 1
             if counter >= Gene.tryoutLimit {
@@ -424,8 +418,12 @@ extension Gene {
     }
 
     /// Tries to remove a random edge from the graph while maintaining all vertices triangulated.
+    /// - Parameters:
+    ///   - simulation: Simulation of the current graph.
+    ///   - solvedTruss: NusaPlus `SolvedTruss` of the simulation, used to check
+    ///     the solvability of the graph without the edge.
     /// - Returns: True if the operation succeeds. Otherwise false.
-    private func tryToRemoveRandomEdge() -> Bool {
+    private func tryToRemoveRandomEdge(simulation: Simulation, solvedTruss: PythonObject) -> Bool {
         // Chooses a random edge form the graph if the graph is not empty.
         guard let randomEdge = graph.allEgdes.randomElement() else { return false }
 
@@ -437,18 +435,23 @@ extension Gene {
         if vertices[0].isXEvolutionFixed && vertices[1].isXEvolutionFixed { return false }
         if vertices[0].isYEvolutionFixed && vertices[1].isYEvolutionFixed { return false }
 
-        let graphCopy = graph.copy()
-        graphCopy.remove(edge: randomEdge)
+        return graph.transaction {
+            graph.remove(edge: randomEdge)
 
-        //Checks if the graph copy is rigid before assigning it to the gene graph.
-        if graphCopy.isUnstable() { return false }
-        for vertex in vertices {
-            guard graphCopy.isVertexTriangulated(vertex) else { return false }
-        }
-        guard Simulation(graph: graphCopy).isSolvable() else { return false }
+            // Checks if the graph is still rigid. Otherwise, the removal is
+            // rolled back.
+            if graph.isUnstable() { return false }
+            for vertex in vertices {
+                guard graph.isVertexTriangulated(vertex) else { return false }
+            }
 
-        graph = graphCopy
-        return true
+            // The factorized graph can only be updated if it's solvable itself.
+            // Otherwise, the graph is checked from scratch.
+            if let index = simulation.edges.firstIndex(where: { $0 === randomEdge }), Bool(solvedTruss.is_solvable)! {
+                return Bool(solvedTruss.is_solvable_without_edge(index))!
+            }
+            return Simulation.isSolvable(graph: graph)
+        }
     }
 }
 
@@ -460,10 +463,13 @@ extension Gene {
     /// Moves a random vertex while respecting its evolution fixed axis and keeping all of its neighbors
     /// within connection range.
     func moveRandomVertex() {
+        // Guided moves compute the gradients once for all tryouts.
+        let gradients = CGFloat.random(in: 0...1) < Gene.sensitivityGuidance ? descentGradients()?.vertices : nil
+
         var didMoveVertex = false
         var counter = 0
         while !didMoveVertex {
-            didMoveVertex = tryToMoveRandomVertex()
+            didMoveVertex = tryToMoveRandomVertex(gradients: gradients)
 
             counter += 1
             if counter >= Gene.tryoutLimit {
@@ -477,8 +483,11 @@ extension Gene {
 
     /// Tries to move a random vertex while respecting its evolution fixed axis and keeping all of its neighbors
     /// within connection range.
+    /// - Parameter gradients: Gradients of `sensitivityMeasure` for each vertex. If
+    ///   given, the vertex moves against its gradient instead of in a random
+    ///   direction.
     /// - Returns: True if a vertex was moved. False if the operation could not be completed.
-    private func tryToMoveRandomVertex() -> Bool {
+    private func tryToMoveRandomVertex(gradients: [Vertex:CGVector]? = nil) -> Bool {
 
         // Chooses a random vertex if the graph is not empty.
         guard let randomVertex = graph.allVertices.randomElement() else { return false }
@@ -490,12 +499,24 @@ extension Gene {
         // Saves position of random vertex before trying to move it.
         let originalPosition = randomVertex.position
 
+        // The offset angle is random, unless the vertex has a gradient along
+        // its free axes. Then it points against the gradient, with a spread
+        // of 45 degrees to each side so guided moves still explore.
+        var angle = CGFloat.random(in: 0...(2 * .pi))
+        if var gradient = gradients?[randomVertex] {
+            if randomVertex.isXEvolutionFixed { gradient.dx = 0 }
+            if randomVertex.isYEvolutionFixed { gradient.dy = 0 }
+            if gradient.length > 0 {
+                angle = (gradient * -1).angle + CGFloat.random(in: -(.pi/4)...(.pi/4))
+            }
+        }
+
         // Randomly creates a position offset. The radius is a random number
         // between 0 and the max edge length following a half normal distribution,
         // so changes are smoother.
         var offset = PolarPoint(
             radius: RandomCGFloat.halfNormal(in: 0...Gene.maxEdgeLength),
-            angle: CGFloat.random(in: 0...(2 * .pi))
+            angle: angle
         ).cgPoint
 
         // Constrains offset according to evolution fixed axis of the random vetex.
@@ -504,7 +525,7 @@ extension Gene {
 
         // Adds the position offset to the random vertex before checking if the
         // new position is valid.
-        randomVertex.position = randomVertex.position + offset
+        graph.move(randomVertex, to: randomVertex.position + offset)
 
         // Checks if all neighbors of the random vertex are still within connection
         // range. If they are, return true. If they aren't, reset the vertex
@@ -512,7 +533,7 @@ extension Gene {
         for neighbor in graph.neighbors(of: randomVertex) {
             let distanceToNeighbor = randomVertex.position.distance(to: neighbor.position)
             if !Gene.connectionRange.contains(distanceToNeighbor) {
-                randomVertex.position = originalPosition
+                graph.move(randomVertex, to: originalPosition)
                 return false
             }
         }
@@ -530,11 +551,50 @@ extension Gene {
         // Chooses a random edge if the graph is not empty
         guard let randomEdge = graph.allEgdes.randomElement() else { return }
 
+        // A guided change moves the area against its gradient: the new area is
+        // between the current one and the range bound in that direction, more
+        // likely close to the current one.
+        if CGFloat.random(in: 0...1) < Gene.sensitivityGuidance,
+           let gradient = descentGradients()?.edges[randomEdge], gradient != 0 {
+            let area = CGFloat(randomEdge.area)
+            if gradient < 0 {
+                graph.setArea(of: randomEdge, to: RandomCGFloat.halfNormal(in: area...Gene.edgeAreaRange.upperBound))
+            } else {
+                graph.setArea(of: randomEdge, to: RandomCGFloat.reversedHalfNormal(in: Gene.edgeAreaRange.lowerBound...area))
+            }
+            return
+        }
+
         // Randomly chooses an area offset subtracted by the current edge area.
         // So, when it's added to the current edge area, the resulting value is
         // within the edge area range.
         let areaOffset = RandomCGFloat.halfNormal(in: Gene.edgeAreaRange) - randomEdge.area
-        randomEdge.area += areaOffset
+        graph.setArea(of: randomEdge, to: randomEdge.area + areaOffset)
     }
 }
 
+// MARK: - Sensitivities
+
+extension Gene {
+
+    /// Gradients that guided mutations descend, with the current forces of the
+    /// graph: the ones of `sensitivityMeasure` or, for a mass measure whose stress
+    /// limit is exceeded, the ones of the stress constraint.
+    /// - Returns: Gradients of each vertex position and edge area. Nil if the
+    ///   graph is not solvable.
+    func descentGradients() -> (vertices: [Vertex:CGVector], edges: [Edge:Double])? {
+        let simulation = Simulation(graph: graph)
+        // The check keeps the factorization, which the sensitivities reuse.
+        guard simulation.checkAndSolve() else { return nil }
+
+        let sensitivities = simulation.sensitivities(measure: sensitivityMeasure)
+        var descended = sensitivities.objective
+        if let constraint = sensitivities.constraint, constraint.value > 0 {
+            descended = constraint
+        }
+
+        let vertices = Dictionary(uniqueKeysWithValues: zip(simulation.vertices, descended.vertexGradients))
+        let edges = Dictionary(uniqueKeysWithValues: zip(simulation.edges, descended.areaGradients))
+        return (vertices, edges)
+    }
+}
@@ -8,6 +8,8 @@
 import Foundation
 import CoreGraphics
 
+import PythonKit
+
 /// Truss model/gene of a structure. A class that allows the creation, mutation and crossover of graphs while
 /// keeping them rigid trusses. Maximum edge length and minimum distances between vertices are also
 /// followed.
@@ -78,6 +80,24 @@ class Gene {
     /// debugging.
     static var logFailures = false
 
+    /// Probability that `moveRandomVertex()` and `varyRandomEdgeArea()` follow the
+    /// sensitivities of `sensitivityMeasure` instead of a random direction.
+    ///
+    /// Guided changes are more likely to improve the fitness, while random ones
+    /// keep exploring. Defaults to 0.5. Zero turns guided changes off.
+    static var sensitivityGuidance: CGFloat = 0.5
+
+    /// Measure of the truss that guided vertex moves and area changes try to
+    /// decrease. Genes whose fitness depends on another measure override it.
+    ///
+    /// Defaults to the maximum stress.
+    var sensitivityMeasure: Simulation.SensitivityMeasure { .maxStress }
+
+    /// NusaPlus surrogate features of the graph, with the graph and its version they were computed
+    /// for and whether they were added to the surrogate with the fitness. `EvolutionChamber` reuses
+    /// them until the graph changes. Copies don't keep them.
+    var cachedFeatures: (graph: Graph, version: Int, features: PythonObject, isSampled: Bool)?
+
     /// Creates a truss gene with a starting graph.
     /// - Parameters:
     ///   - graph: A starting graph which should already model a rigid truss. It should follow
@@ -21,6 +21,9 @@ class Edge {
     var elasticity: Double
 
     /// Cross sectional area of the edge.
+    ///
+    /// Areas of edges of a graph should be changed with `Graph.setArea(of:to:)`, so the changes are
+    /// part of its transactions and dirty set.
     var area: Double
 
     /// Current length of the edge.
@@ -12,7 +12,76 @@ import CoreGraphics
 class Graph {
 
     /// Adjacency list of the graph. Vertices are the keys and the values are Edges of the key Vertex.
-    var adjacencyList: [Vertex:[Edge]] = [:]
+    ///
+    /// It's only changed through the graph methods, which keep the spatial grid up to date.
+    private(set) var adjacencyList: [Vertex:[Edge]] = [:]
+
+    /// Side of the cells of the spatial grid that indexes the vertices and edges of the graph, so range
+    /// and proximity queries only look at the cells around a point instead of the whole graph.
+    ///
+    /// Queries work with any distance, but with cells as large as the maximum edge length, vertices
+    /// within connection range of a point are always in the 3x3 cells around it.
+    let cellSize: CGFloat
+
+    /// Vertices in each cell of the spatial grid.
+    private var vertexGrid: [GridCell:[Vertex]] = [:]
+
+    /// Cell of the spatial grid of each vertex.
+    private var vertexCells: [Vertex:GridCell] = [:]
+
+    /// Edges in each cell of the spatial grid. An edge is in every cell its bounding box overlaps.
+    private var edgeGrid: [GridCell:[Edge]] = [:]
+
+    /// Change of the graph recorded in the undo log, with what is needed to undo it.
+    private enum Change {
+        case createdVertex(Vertex)
+        case insertedVertex(Vertex)
+        case removedVertex(Vertex)
+        case movedVertex(Vertex, from: CGPoint)
+        case addedEdge(Edge)
+        case removedEdge(Edge, positions: [(vertex: Vertex, index: Int)])
+        case resizedEdge(Edge, from: Double)
+        case dirtiedVertex(Vertex)
+        case dirtiedEdge(Edge)
+    }
+
+    /// Changes made to the graph since the outermost open transaction began, in order.
+    private var undoLog: [Change] = []
+
+    /// Undo log length when each open transaction began, from the outermost to the innermost.
+    private var transactionStarts: [Int] = []
+
+    /// True while a transaction is rolled back, so undoing changes doesn't log them again.
+    private var isRollingBack = false
+
+    /// Number of changes made to the graph, rolled back ones included, so values computed from the
+    /// graph can be cached until it changes.
+    private(set) var version = 0
+
+    /// True if the graph keeps a dirty set for an incremental solver to consume with
+    /// `takeDirtySet()`. Defaults to false, so graphs without a consumer don't keep references to
+    /// every vertex and edge they changed. Turning it off clears the dirty set.
+    var tracksDirtySet = false {
+        didSet {
+            if !tracksDirtySet {
+                dirtyVertexSet.removeAll()
+                dirtyEdgeSet.removeAll()
+            }
+        }
+    }
+
+    /// Vertices created, inserted, removed or moved since the dirty set was last taken.
+    private var dirtyVertexSet: Set<Vertex> = []
+
+    /// Edges added, removed, moved or resized since the dirty set was last taken. Edges are keyed by
+    /// identity, because their hashes change with their areas.
+    private var dirtyEdgeSet: [ObjectIdentifier:Edge] = [:]
+
+    /// Creates an empty graph.
+    /// - Parameter cellSize: Side of the spatial grid cells. Defaults to `Gene.maxEdgeLength`.
+    init(cellSize: CGFloat = Gene.maxEdgeLength) {
+        self.cellSize = cellSize
+    }
 
     /// Vertices of the graph, which are the keys of the adjacency list.
     var allVertices: [Vertex] {
@@ -65,9 +134,58 @@ class Graph {
             id: id
         )
         adjacencyList[vertex] = []
+        index(vertex)
+        record(.createdVertex(vertex))
+        markDirty(vertex)
         return vertex
     }
 
+    /// Inserts a vertex from another graph with its edges, like the vertices of a subgraph copied
+    /// during crossover. Edges are only indexed once both of their vertices are in the graph.
+    /// - Parameters:
+    ///   - vertex: Vertex to be inserted. It must not be in the graph.
+    ///   - edges: Edges of the vertex.
+    func insert(_ vertex: Vertex, edges: [Edge]) {
+        assert(adjacencyList[vertex] == nil, "Tried to insert a vertex that is already in the graph.")
+        adjacencyList[vertex] = edges
+        index(vertex)
+        for edge in edges where adjacencyList[vertex.neighbor(fromEdge: edge)] != nil {
+            index(edge)
+        }
+        record(.insertedVertex(vertex))
+        markDirty(vertex)
+        for edge in edges { markDirty(edge) }
+    }
+
+    /// Moves a vertex of the graph, keeping the spatial grid up to date. Vertices of a graph should
+    /// only be moved with it.
+    /// - Parameters:
+    ///   - vertex: Vertex of the graph to be moved.
+    ///   - position: New position of the vertex.
+    func move(_ vertex: Vertex, to position: CGPoint) {
+        let edges = edges(of: vertex)
+        record(.movedVertex(vertex, from: vertex.position))
+        markDirty(vertex)
+        for edge in edges { markDirty(edge) }
+
+        for edge in edges { unindex(edge) }
+        unindex(vertex)
+        vertex.position = position
+        index(vertex)
+        for edge in edges { index(edge) }
+    }
+
+    /// Changes the cross sectional area of an edge of the graph, so the change is part of the open
+    /// transaction and the dirty set.
+    /// - Parameters:
+    ///   - edge: Edge of the graph to be resized.
+    ///   - area: New cross sectional area of the edge.
+    func setArea(of edge: Edge, to area: Double) {
+        record(.resizedEdge(edge, from: edge.area))
+        markDirty(edge)
+        edge.area = area
+    }
+
     /// Returns the edges for a given edge of the graph
     /// - Parameter vertex: The vertex of which we want to find it's edges.
     func edges(of vertex: Vertex) -> [Edge] {
@@ -104,8 +222,15 @@ class Graph {
         for edge in adjacencyList[vertex] ?? [] {
             remove(edge: edge)
         }
-        // Then removes the vertex itself from the adjacency list.
-        adjacencyList.removeValue(forKey: vertex)
+        // Then removes the vertex itself from the adjacency list. The vertex
+        // of the graph is logged, which may not be the given one if it came
+        // from a copy.
+        if let vertexIndex = adjacencyList.index(forKey: vertex) {
+            let graphVertex = adjacencyList.remove(at: vertexIndex).key
+            record(.removedVertex(graphVertex))
+            markDirty(graphVertex)
+        }
+        unindex(vertex)
     }
 
     /// Adds an undirected edge between two vertices. Order of vertices doesn't matter.
@@ -120,6 +245,9 @@ class Graph {
 
         adjacencyList[vertexA]?.append(edge)
         adjacencyList[vertexB]?.append(edge)
+        index(edge)
+        record(.addedEdge(edge))
+        markDirty(edge)
     }
 
     /// Performs various sanity checks before adding a new edge to the graph.
@@ -148,8 +276,23 @@ class Graph {
     /// If the edge does not exist, then nothing is done.
     /// - Parameter edge: edge to be removed from the graph.
     func remove(edge: Edge) {
+        // The edge of the graph and its positions in the edges of its vertices
+        // are logged, so a rollback puts it back where it was.
+        var removedEdge: Edge?
+        var positions: [(vertex: Vertex, index: Int)] = []
         for vertex in edge.vertices {
-            adjacencyList[vertex] = adjacencyList[vertex]?.filter { $0 != edge }
+            guard let vertexIndex = adjacencyList.index(forKey: vertex) else { continue }
+            let graphVertex = adjacencyList[vertexIndex].key
+            if let edgeIndex = adjacencyList[graphVertex]?.firstIndex(of: edge) {
+                removedEdge = adjacencyList[graphVertex]?.remove(at: edgeIndex)
+                positions.append((graphVertex, edgeIndex))
+            }
+        }
+        unindex(edge)
+
+        if let removedEdge = removedEdge {
+            record(.removedEdge(removedEdge, positions: positions))
+            markDirty(removedEdge)
         }
     }
 
@@ -239,13 +382,277 @@ extension Graph {
     }
 }
 
+// MARK: - Spatial Grid
+extension Graph {
+
+    /// Cell of the spatial grid, by its integer coordinates.
+    struct GridCell: Hashable {
+        let x: Int
+        let y: Int
+    }
+
+    /// Gets the vertices within a distance of a point, looking only at the grid cells around it.
+    /// - Parameters:
+    ///   - point: Point from which the distances are measured.
+    ///   - distance: Maximum distance of a vertex to the point, inclusive.
+    /// - Returns: Vertices within the distance of the point, in no particular order.
+    func vertices(near point: CGPoint, within distance: CGFloat) -> [Vertex] {
+        var vertices: [Vertex] = []
+        for cellVertices in cells(of: vertexGrid, around: point, within: distance) {
+            for vertex in cellVertices where point.distance(to: vertex.position) <= distance {
+                vertices.append(vertex)
+            }
+        }
+        return vertices
+    }
+
+    /// Gets the edges within a distance of a point, measured to their line segments, looking only
+    /// at the grid cells around it. The distance is the one to the `normalIntersectionWithLine`
+    /// of an edge, which is clamped to the segment, so an edge can only be near a point if its
+    /// bounding box is.
+    /// - Parameters:
+    ///   - point: Point from which the distances are measured.
+    ///   - distance: Maximum distance of an edge to the point, inclusive.
+    /// - Returns: Edges within the distance of the point, in no particular order.
+    func edges(near point: CGPoint, within distance: CGFloat) -> [Edge] {
+        // Edges are in every cell they overlap, so they may be found more than once.
+        var foundEdges: Set<ObjectIdentifier> = []
+        var edges: [Edge] = []
+        for cellEdges in cells(of: edgeGrid, around: point, within: distance) {
+            for edge in cellEdges where foundEdges.insert(ObjectIdentifier(edge)).inserted {
+                let vertices = Array(edge.vertices)
+                if point.distance(toLineSegmentOf: vertices[0].position, and: vertices[1].position) <= distance {
+                    edges.append(edge)
+                }
+            }
+        }
+        return edges
+    }
+
+    /// Gets the edge closest to a point, if it's within a distance of it.
+    /// - Parameters:
+    ///   - point: Point from which the distances are measured.
+    ///   - distance: Maximum distance of the edge to the point, inclusive.
+    /// - Returns: Closest edge to the point, or nil if no edge is within the distance.
+    func nearestEdge(to point: CGPoint, within distance: CGFloat) -> Edge? {
+        return edges(near: point, within: distance).min { edgeA, edgeB in
+            let verticesA = Array(edgeA.vertices)
+            let verticesB = Array(edgeB.vertices)
+            return point.distance(toLineSegmentOf: verticesA[0].position, and: verticesA[1].position)
+                < point.distance(toLineSegmentOf: verticesB[0].position, and: verticesB[1].position)
+        }
+    }
+
+    /// Gets the contents of the grid cells that overlap the square around a point. If the square
+    /// has more cells than the grid has contents, all contents are returned instead.
+    private func cells<Element>(of grid: [GridCell:[Element]], around point: CGPoint, within distance: CGFloat) -> [[Element]] {
+        let minCell = cell(of: CGPoint(x: point.x - distance, y: point.y - distance))
+        let maxCell = cell(of: CGPoint(x: point.x + distance, y: point.y + distance))
+        let cellCount = (maxCell.x - minCell.x + 1) * (maxCell.y - minCell.y + 1)
+        guard cellCount <= grid.count else { return Array(grid.values) }
+
+        var contents: [[Element]] = []
+        for x in minCell.x...maxCell.x {
+            for y in minCell.y...maxCell.y {
+                if let elements = grid[GridCell(x: x, y: y)] { contents.append(elements) }
+            }
+        }
+        return contents
+    }
+
+    /// Gets the grid cell that contains a point.
+    private func cell(of point: CGPoint) -> GridCell {
+        return GridCell(x: Int((point.x / cellSize).rounded(.down)), y: Int((point.y / cellSize).rounded(.down)))
+    }
+
+    /// Gets the grid cells overlapped by the bounding box of an edge.
+    private func cells(of edge: Edge) -> [GridCell] {
+        let vertices = Array(edge.vertices)
+        let cellA = cell(of: vertices[0].position)
+        let cellB = cell(of: vertices[1].position)
+        var cells: [GridCell] = []
+        for x in min(cellA.x, cellB.x)...max(cellA.x, cellB.x) {
+            for y in min(cellA.y, cellB.y)...max(cellA.y, cellB.y) {
+                cells.append(GridCell(x: x, y: y))
+            }
+        }
+        return cells
+    }
+
+    /// Adds a vertex to the grid cell of its position.
+    private func index(_ vertex: Vertex) {
+        let cell = cell(of: vertex.position)
+        vertexGrid[cell, default: []].append(vertex)
+        vertexCells[vertex] = cell
+    }
+
+    /// Removes a vertex from its grid cell, if it's in the grid.
+    private func unindex(_ vertex: Vertex) {
+        guard let cell = vertexCells.removeValue(forKey: vertex) else { return }
+        vertexGrid[cell]?.removeAll { $0 == vertex }
+        if vertexGrid[cell]?.isEmpty == true { vertexGrid.removeValue(forKey: cell) }
+    }
+
+    /// Adds an edge to the grid cells it overlaps.
+    private func index(_ edge: Edge) {
+        for cell in cells(of: edge) {
+            edgeGrid[cell, default: []].append(edge)
+        }
+    }
+
+    /// Removes an edge from the grid cells it overlaps. Edges are compared by value, like in
+    /// `remove(edge:)`, because their hashes change with their areas.
+    private func unindex(_ edge: Edge) {
+        for cell in cells(of: edge) {
+            edgeGrid[cell]?.removeAll { $0 == edge }
+            if edgeGrid[cell]?.isEmpty == true { edgeGrid.removeValue(forKey: cell) }
+        }
+    }
+}
+
+// MARK: - Transactions
+extension Graph {
+
+    /// True if there is an open transaction.
+    var isInTransaction: Bool {
+        return !transactionStarts.isEmpty
+    }
+
+    /// Begins a transaction. Changes made through the graph methods until the transaction is committed
+    /// or rolled back are logged, so they can be undone without copying the graph.
+    ///
+    /// Transactions can be nested. Committing an inner transaction keeps its changes in the outer one,
+    /// which can still roll them back.
+    func beginTransaction() {
+        transactionStarts.append(undoLog.count)
+    }
+
+    /// Commits the innermost open transaction, keeping its changes.
+    func commitTransaction() {
+        assert(isInTransaction, "Tried to commit a transaction that was not begun.")
+        transactionStarts.removeLast()
+        if transactionStarts.isEmpty { undoLog.removeAll(keepingCapacity: true) }
+    }
+
+    /// Rolls back the innermost open transaction, undoing its changes in reverse order. Vertices and
+    /// edges are restored as the same objects, in the same order of the adjacency list.
+    func rollbackTransaction() {
+        assert(isInTransaction, "Tried to roll back a transaction that was not begun.")
+        let start = transactionStarts.removeLast()
+
+        isRollingBack = true
+        for change in undoLog[start...].reversed() {
+            undo(change)
+        }
+        isRollingBack = false
+        undoLog.removeSubrange(start...)
+        version += 1
+    }
+
+    /// Makes changes to the graph in a transaction, which is committed if they succeed and rolled back
+    /// otherwise.
+    /// - Parameter changes: Changes to the graph. Returns true if they succeeded.
+    /// - Returns: The result of the changes.
+    @discardableResult
+    func transaction(_ changes: () -> Bool) -> Bool {
+        beginTransaction()
+        let didSucceed = changes()
+        if didSucceed {
+            commitTransaction()
+        } else {
+            rollbackTransaction()
+        }
+        return didSucceed
+    }
+
+    /// Vertices created, inserted, removed or moved since the dirty set was last taken. Vertices no
+    /// longer in the adjacency list were removed.
+    var dirtyVertices: Set<Vertex> {
+        return dirtyVertexSet
+    }
+
+    /// Edges added, removed, moved or resized since the dirty set was last taken. Edges no longer in
+    /// the edges of their vertices were removed.
+    var dirtyEdges: [Edge] {
+        return Array(dirtyEdgeSet.values)
+    }
+
+    /// Takes the dirty set, which has the vertices and edges changed since it was last taken, so
+    /// incremental solvers only update the parts of a model that changed. Only changes made while
+    /// `tracksDirtySet` is true are in it.
+    /// - Returns: Dirty vertices and edges, which are then cleared.
+    func takeDirtySet() -> (vertices: Set<Vertex>, edges: [Edge]) {
+        let dirtySet = (vertices: dirtyVertexSet, edges: Array(dirtyEdgeSet.values))
+        dirtyVertexSet.removeAll()
+        dirtyEdgeSet.removeAll()
+        return dirtySet
+    }
+
+    /// Counts a change of the graph and appends it to the undo log, if there is an open transaction.
+    private func record(_ change: Change) {
+        version += 1
+        guard isInTransaction && !isRollingBack else { return }
+        undoLog.append(change)
+    }
+
+    /// Adds a vertex to the dirty set, if it's tracked, logging it so a rollback also restores the
+    /// dirty set.
+    private func markDirty(_ vertex: Vertex) {
+        guard tracksDirtySet, !isRollingBack, dirtyVertexSet.insert(vertex).inserted else { return }
+        record(.dirtiedVertex(vertex))
+    }
+
+    /// Adds an edge to the dirty set, if it's tracked, logging it so a rollback also restores the
+    /// dirty set.
+    private func markDirty(_ edge: Edge) {
+        guard tracksDirtySet, !isRollingBack, dirtyEdgeSet.updateValue(edge, forKey: ObjectIdentifier(edge)) == nil else { return }
+        record(.dirtiedEdge(edge))
+    }
+
+    /// Undoes a change of the undo log. Changes must be undone in reverse order.
+    private func undo(_ change: Change) {
+        switch change {
+        case .createdVertex(let vertex), .insertedVertex(let vertex):
+            // Edges of an inserted vertex were indexed if their neighbors were
+            // in the graph. Created vertices have no edges left.
+            for edge in adjacencyList[vertex] ?? [] where adjacencyList[vertex.neighbor(fromEdge: edge)] != nil {
+                unindex(edge)
+            }
+            adjacencyList.removeValue(forKey: vertex)
+            unindex(vertex)
+        case .removedVertex(let vertex):
+            // Its edges are restored by the changes logged before.
+            adjacencyList[vertex] = []
+            index(vertex)
+        case .movedVertex(let vertex, let position):
+            move(vertex, to: position)
+        case .addedEdge(let edge):
+            for vertex in edge.vertices {
+                adjacencyList[vertex]?.removeAll { $0 === edge }
+            }
+            unindex(edge)
+        case .removedEdge(let edge, let positions):
+            for position in positions.reversed() {
+                adjacencyList[position.vertex]?.insert(edge, at: position.index)
+            }
+            if edge.vertices.allSatisfy({ adjacencyList[$0] != nil }) { index(edge) }
+        case .resizedEdge(let edge, let area):
+            edge.area = area
+        case .dirtiedVertex(let vertex):
+            dirtyVertexSet.remove(vertex)
+        case .dirtiedEdge(let edge):
+            dirtyEdgeSet.removeValue(forKey: ObjectIdentifier(edge))
+        }
+    }
+}
+
 // MARK: Copy
 extension Graph {
 
     /// Creates a graph copy by value, including the IDs of the vertices from the original graph.
     /// - Returns: A copy by value of the graph that has no references to the original object.
     func copy() -> Graph {
-        let graphCopy = Graph()
+        let graphCopy = Graph(cellSize: cellSize)
 
         // A dictionary that relates an original vertex to its copy. Used to
         // create edges copies with reference to the new vertices instead of the
@@ -264,6 +671,7 @@ extension Graph {
                 force: vertex.force,
                 id: vertex.id
             )
+            vertexCopy.displacement = vertex.displacement
             originalToCopyVertices[vertex] = vertexCopy
         }
 
@@ -279,6 +687,9 @@ extension Graph {
             )
         }
 
+        // A copy starts with nothing dirty and tracks its dirty set like the
+        // original.
+        graphCopy.tracksDirtySet = tracksDirtySet
         return graphCopy
     }
 }
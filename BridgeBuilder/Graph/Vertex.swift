@@ -18,6 +18,9 @@ class Vertex {
     let id: UUID
 
     /// Position in space of the vertex.
+    ///
+    /// Vertices of a graph should be moved with `Graph.move(_:to:)`, which keeps the graph spatial
+    /// grid up to date.
     var position = CGPoint()
 
     /// True if the x coordinate of the vertex should be fixed during simulation. Vertex may still be able to
@@ -49,6 +52,11 @@ class Vertex {
     /// Force that will be applied to the node during simulation.
     var force: CGVector? = nil
 
+    /// Displacement of the node in the last simulation of its graph, or of the
+    /// graph it was copied from. Used as the starting point of the iterative
+    /// solver (see `Simulation.solver`).
+    var displacement: CGVector? = nil
+
     /// Last four digits from the id of the Vertex. Used for debug and visualization porpuses.
     var shortID: String {
         String(id.uuidString.suffix(2))
@@ -1,38 +1,75 @@
 # This file modifies some of Nusa's functions. New functionality is added, like
 # plotting models showing stresses and proportions between areas and forces.
+#
+# The solver lives in NusaPlusCore, which only needs NumPy and SciPy, and is
+# imported from here. nusa and matplotlib are only imported when a nusa model
+# is built or something is plotted, since importing them (nusa imports
+# matplotlib.pyplot) takes much longer than importing everything else.
+
+from NusaPlusCore import *
+from NusaPlusCore import _instrumented, _model_arrays, _model_stresses, _node_displacements, _spawn_context, _element_geometry, _assemble_stiffness, _write_results
+import collections
+import concurrent.futures
+import itertools
+import os
 
-from nusa import *
-import matplotlib.cm as cm
-import matplotlib.markers as markers
-import math
-import sys
+import numpy as np
 
 #from .core import Element, Node, Model
 
 # Plots deformed shape of a truss model and colors the elements according to
 # their stresses. A color bar scale still needs to be added.
+#
+# Elements are drawn as LineCollections and nodes and constraints with a single
+# plot call each, so the time to plot doesn't grow with one artist per element.
+@_instrumented("plot_deformed_shape")
 def plot_deformed_shape(truss_model, deform_factor=1.0, is_proportional=True, shows_stresses=False, maximum_stress=0, fixed_frame=[]):
+    snapshot = _plot_snapshot(truss_model, with_stresses=True)
+    return _plot_deformed_snapshot(snapshot, deform_factor, is_proportional, shows_stresses, maximum_stress, fixed_frame)
+
+# Plots truss model with proportional thicknessess and proportial forces arrows.
+@_instrumented("plot_model")
+def plot_model(truss_model, is_proportional=True, fixed_frame=[]):
+    return _plot_model_snapshot(_plot_snapshot(truss_model), is_proportional, fixed_frame)
+
+# Snapshot of a truss model as the plot functions see it: forces are the
+# current node forces (reactions included after nusa's solve()) and constraints
+# are the displacements equal to zero.
+def _plot_snapshot(truss_model, with_stresses=False):
+    if isinstance(truss_model, TrussArrays):
+        forces = truss_model.nodal_forces if truss_model.is_solved else truss_model.forces
+        displacements = _node_displacements(truss_model)
+        stresses = _model_stresses(truss_model) if with_stresses else None
+        return TrussSnapshot(truss_model.coords.copy(), displacements, forces.reshape(-1, 2).copy(), displacements == 0,
+                             truss_model.connectivity.astype(np.int64), truss_model.areas.copy(), stresses)
+
+    nodes = sorted(truss_model.get_nodes(), key=lambda node: node.label)
+    elements = list(truss_model.get_elements())
+    coords = np.array([(node.x, node.y) for node in nodes], dtype=float).reshape(-1, 2)
+    displacements = np.array([(node.ux, node.uy) for node in nodes], dtype=float).reshape(-1, 2)
+    forces = np.array([(node.fx, node.fy) for node in nodes], dtype=float).reshape(-1, 2)
+    connectivity = np.array([[node.label for node in element.get_nodes()] for element in elements], dtype=np.int64).reshape(-1, 2)
+    areas = np.array([element.A for element in elements], dtype=float)
+    stresses = _model_stresses(truss_model) if with_stresses else None
+    return TrussSnapshot(coords, displacements, forces, displacements == 0, connectivity, areas, stresses)
+
+def _plot_deformed_snapshot(snapshot, deform_factor=1.0, is_proportional=True, shows_stresses=False, maximum_stress=0, fixed_frame=[]):
+    import matplotlib as mpl
+    import matplotlib.cm as cm
     import matplotlib.pyplot as plt
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
-    df = deform_factor*truss_model._calculate_deformed_factor()
+    coords, displacements, _, fixed, connectivity, areas, stresses = snapshot
+    df = deform_factor*_deformed_factor(coords, displacements)
     #cmap = cm.get_cmap('jet') #'RdBu', 'coolwarm' is diverging with 0 on color value 0.5
     cmap = cm.get_cmap('cool') #'plasma', 'cool'
     #cmap = cm.get_cmap('viridis')
 
-    def get_abs_stress(element):
-        return abs(element.s)
     if maximum_stress != 0:
         maxStress = maximum_stress
     else:
-        stresses = list(map(get_abs_stress,truss_model.get_elements()))
-        maxStress = max(stresses)
-
-    def get_area(element: Truss):
-        return element.A
-    crossAreas = list(map(get_area,truss_model.get_elements()))
-    minArea = min(crossAreas)
+        maxStress = np.abs(stresses).max()
 
     #set this for best visuals.
     thinnestLine = 1.5
@@ -47,137 +84,120 @@ def plot_deformed_shape(truss_model, deform_factor=1.0, is_proportional=True, sh
     ax.plot([9999999,9999999],[9999999,9999999],'-', color='gray', label='Original', linewidth=1.5)
     ax.plot([9999999,9999999],[9999999,9999999],'--', color=cmap(0.5), label='Deformed', linewidth=1.5)
     ax.legend(loc='upper left')
-    
-    for elm in truss_model.get_elements():
-
-        #sqrt because we display thickness, which is proportional to sqrt of area.
-        #it would be ok to drop sqrt in order to exagerate the visual difference.
-        widthMultiplier = 1
-        if is_proportional:
-            widthMultiplier = math.sqrt(elm.A/minArea)
-        lineWidth = thinnestLine * widthMultiplier
-
-        ni,nj = elm.get_nodes()
-        x, y = [ni.x,nj.x], [ni.y,nj.y]
-        xx = [ni.x+ni.ux*df, nj.x+nj.ux*df]
-        yy = [ni.y+ni.uy*df, nj.y+nj.uy*df]
 
-        ##maxStress -> color 1 or -1; 0 stress -> color 0.5
-        #colorValue = elm.s * 0.5 / maxStress
+    lineWidths = thinnestLine * _width_multipliers(areas, is_proportional)
+    deformed = coords + displacements*df
 
-        ##maxStress -> color 1; 0 stress -> color 0
+    ##maxStress -> color 1 or -1; 0 stress -> color 0.5
+    #colorValue = elm.s * 0.5 / maxStress
 
-        color = 'red'
-        markerColor = 'red'
-        if shows_stresses:
-            colorValue = elm.s / (2*maxStress) + 0.5
-            color = cmap(colorValue)
-            markerColor = 'blue'
+    ##maxStress -> color 1; 0 stress -> color 0
 
-        #ax.plot(x, y, 'o', color='gray', zorder=10)
-        ax.plot(xx, yy, 'bo', markerfacecolor = markerColor, markeredgecolor=markerColor, zorder=11)
-        ax.plot(x,y,'-', color='gray', linewidth=lineWidth, zorder=1)
-        ax.plot(xx,yy,'--', color=color, linewidth=lineWidth, zorder=2)
+    colors = 'red'
+    markerColor = 'red'
+    if shows_stresses:
+        colors = cmap(stresses / (2*maxStress) + 0.5)
+        markerColor = 'blue'
 
-        for nd in (ni,nj):
-            if nd.ux == 0 and nd.uy == 0:
-                # Plots two triangles instead of a single marker for double
-                # constraint using.
-                #_draw_constraint(truss_model, ax,nd.x,nd.y)
-                _draw_xconstraint(truss_model, ax,nd.x,nd.y)
-                _draw_yconstraint(truss_model, ax,nd.x,nd.y)
-            else:
-                if nd.ux == 0: _draw_xconstraint(truss_model, ax,nd.x,nd.y)
-                if nd.uy == 0: _draw_yconstraint(truss_model, ax,nd.x,nd.y)
-
-    if fixed_frame:
-        plt.xlim((fixed_frame[0], fixed_frame[1]))
-        plt.ylim((fixed_frame[2], fixed_frame[3]))
-        plt.gca().set_aspect('equal', adjustable='box')
-    else:
-        x0,x1,y0,y1 = truss_model.rect_region()
-        plt.xlim((x0,x1))
-        plt.ylim((y0,y1))
-        plt.axis('equal')
+    #ax.plot(x, y, 'o', color='gray', zorder=10)
+    nodes = np.unique(connectivity)
+    ax.plot(deformed[nodes,0], deformed[nodes,1], 'bo', markerfacecolor = markerColor, markeredgecolor=markerColor, zorder=11)
+    _add_lines(ax, coords[connectivity], colors='gray', linewidths=lineWidths, zorder=1)
+    _add_lines(ax, deformed[connectivity], colors=colors, linewidths=lineWidths, linestyles='--', zorder=2)
 
+    _draw_constraints(ax, coords[nodes], fixed[nodes])
+    _set_plot_frame(coords, fixed_frame)
     return fig
 
-# Plots truss model with proportional thicknessess and proportial forces arrows.
-def plot_model(truss_model, is_proportional=True, fixed_frame=[]):
+def _plot_model_snapshot(snapshot, is_proportional=True, fixed_frame=[]):
     import matplotlib.pyplot as plt
     plt.tight_layout(pad=1.3)
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
-    def get_force(node: Node):
-        return (node.fx, node.fy)
-    forces = list(map(get_force,truss_model.get_nodes()))
-    forces = [component for force in forces for component in force]
+    coords, _, forces, fixed, connectivity, areas, _ = snapshot
+    nodes = np.unique(connectivity)
 
     #removes zeros from list
-    forces = [i for i in forces if i != 0]
-    minForce = abs(min(forces, default=1, key=abs))
-
-    def get_area(element: Truss):
-        return element.A
-    crossAreas = list(map(get_area,truss_model.get_elements()))
-    minArea = min(crossAreas, default=1)
+    nonzeroForces = np.abs(forces[forces != 0])
+    minForce = nonzeroForces.min() if len(nonzeroForces) > 0 else 1
 
     #set this for best visuals.
     thinnestLine = 1.5
 
-    for elm in truss_model.get_elements():
-        ni, nj = elm.get_nodes()
+    ax.plot(coords[nodes,0], coords[nodes,1], 'bo', zorder=10)
+    _add_lines(ax, coords[connectivity], colors='b', linewidths=thinnestLine * _width_multipliers(areas, is_proportional), zorder=1)
 
-        #sqrt because we display thickness, which is proportional to sqrt of area.
-        #it is ok to drop sqrt in order to exagerate the visual difference.
-        widthMultiplier = 1
+    # The arrow size depends on the whole model, so it's computed only once.
+    arrowSize = _arrow_size(coords)
+    for node in nodes:
+        fx, fy = forces[node]
+        if fx == 0 and fy == 0: continue
         if is_proportional:
-            widthMultiplier = math.sqrt(elm.A/minArea)
-        lineWidth = thinnestLine * widthMultiplier
+            fxMultiplier, fyMultiplier = fx/minForce, fy/minForce
+        else:
+            fxMultiplier, fyMultiplier = np.sign(fx), np.sign(fy)
+        _draw_force(None, ax, coords[node,0], coords[node,1], fxMultiplier, fyMultiplier, arrowSize)
 
-        ax.plot([ni.x,nj.x],[ni.y,nj.y], 'bo', zorder=10)
-        ax.plot([ni.x,nj.x],[ni.y,nj.y],"b-", linewidth=lineWidth, zorder=1)
-
-        for nd in (ni,nj):
-            fxMultiplier = 1
-            if nd.fx == 0: fxMultiplier = 0
-            if nd.fx < 0: fxMultiplier = -1
-            fyMultiplier = 1
-            if nd.fy == 0: fyMultiplier = 0
-            if nd.fy < 0: fyMultiplier = -1
-
-            if is_proportional:
-                fxMultiplier = nd.fx/minForce
-                fyMultiplier = nd.fy/minForce
-            if nd.fx != 0 or nd.fy != 0: _draw_force(truss_model,ax,nd.x,nd.y,fxMultiplier,fyMultiplier)
-
-            if nd.ux == 0 and nd.uy == 0:
-                # Plots two triangles instead of a single marker for double
-                # constraint using.
-                #_draw_constraint(truss_model, ax,nd.x,nd.y)
-                _draw_xconstraint(truss_model, ax,nd.x,nd.y)
-                _draw_yconstraint(truss_model, ax,nd.x,nd.y)
-            else:
-                if nd.ux == 0: _draw_xconstraint(truss_model, ax,nd.x,nd.y)
-                if nd.uy == 0: _draw_yconstraint(truss_model, ax,nd.x,nd.y)
+    _draw_constraints(ax, coords[nodes], fixed[nodes])
+    _set_plot_frame(coords, fixed_frame)
+    return fig
 
+def _set_plot_frame(coords, fixed_frame):
+    import matplotlib.pyplot as plt
     if fixed_frame:
         plt.xlim((fixed_frame[0], fixed_frame[1]))
         plt.ylim((fixed_frame[2], fixed_frame[3]))
         plt.gca().set_aspect('equal', adjustable='box')
     else:
-        x0,x1,y0,y1 = truss_model.rect_region()
+        x0,x1,y0,y1 = _rect_region(coords)
         plt.xlim((x0,x1))
         plt.ylim((y0,y1))
         plt.axis('equal')
 
-    return fig
+# Same as nusa's TrussModel.rect_region(), from node coordinates.
+def _rect_region(coords, factor=7.0):
+    xmn, ymn = coords.min(axis=0)
+    xmx, ymx = coords.max(axis=0)
+    kx = (xmx-xmn)/factor
+    ky = (ymx-ymn)/factor
+    return xmn-kx, xmx+kx, ymn-ky, ymx+ky
+
+# Same as nusa's TrussModel._calculate_deformed_factor(), from node coordinates
+# and displacements.
+def _deformed_factor(coords, displacements):
+    x0,x1,y0,y1 = _rect_region(coords)
+    uxMax, uyMax = np.abs(displacements).max(axis=0)
+    sf = 1.5e-2
+    if uxMax == 0 and uyMax == 0:
+        return 1.0
+    if uxMax == 0:
+        return sf*(y1-y0)/uyMax
+    if uyMax == 0:
+        return sf*(x1-x0)/uxMax
+    return np.mean([sf*(x1-x0)/uxMax, sf*(y1-y0)/uyMax])
+
+#sqrt because we display thickness, which is proportional to sqrt of area.
+#it is ok to drop sqrt in order to exagerate the visual difference.
+def _width_multipliers(areas, is_proportional):
+    if not is_proportional or len(areas) == 0:
+        return np.ones(len(areas))
+    return np.sqrt(areas/areas.min())
+
+# Adds all element segments to the axes as a single LineCollection, styled like
+# the lines of ax.plot().
+def _add_lines(axes, segments, **properties):
+    from matplotlib.collections import LineCollection
+    lines = LineCollection(segments, capstyle='projecting', joinstyle='round', **properties)
+    axes.add_collection(lines)
+    axes.autoscale_view()
+    return lines
 
 '''
 # Plots deformed shape of a truss model and colors the elements according to
 # their stresses. A color bar scale still needs to be added.
 def plot_deformed_shape_stress(truss_model,dfactor=1.0):
+    import matplotlib.cm as cm
     import matplotlib.pyplot as plt
     fig = plt.figure()
     ax = fig.add_subplot(111)
@@ -216,13 +236,13 @@ def plot_deformed_shape_stress(truss_model,dfactor=1.0):
 
 '''
 # Plots truss model with proportional thicknessess.
-def plot_proportional_area_model(truss_model: TrussModel):
+def plot_proportional_area_model(truss_model: "TrussModel"):
     import matplotlib.pyplot as plt
 
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
-    def get_area(element: Truss):
+    def get_area(element: "Truss"):
         return element.A
     crossAreas = list(map(get_area,truss_model.get_elements()))
     minArea = min(crossAreas)
@@ -252,20 +272,38 @@ def plot_proportional_area_model(truss_model: TrussModel):
     ax.set_ylim(y0,y1)
 '''
 
-def _draw_force(truss_model,axes,x,y,fxMultiplier,fyMultiplier):
-    minArrowSize = _calculate_arrow_size(truss_model)
+def _draw_force(truss_model,axes,x,y,fxMultiplier,fyMultiplier,arrowSize=None):
+    minArrowSize = arrowSize if arrowSize is not None else _calculate_arrow_size(truss_model)
     HW = minArrowSize/5.0
     HL = minArrowSize/3.0
     arrow_props = dict(head_width=HW, head_length=HL, fc='r', ec='r', zorder=5)
     axes.arrow(x, y, fxMultiplier*minArrowSize, fyMultiplier*minArrowSize, **arrow_props)
 
+# Draws the constraint markers of all nodes with one plot call per marker, and
+# a single marker per constrained direction of each node.
+def _draw_constraints(axes, coords, fixed):
+    import matplotlib.markers as markers
+    x, y = coords[:,0], coords[:,1]
+    xFixed = fixed[:,0]
+    yFixed = fixed[:,1]
+    for fixed, marker in (
+        (xFixed & (x <= 0), markers.CARETRIGHT),
+        (xFixed & (x > 0), markers.CARETLEFT),
+        (yFixed & (y <= 0), markers.CARETUP),
+        (yFixed & (y > 0), markers.CARETDOWN)
+    ):
+        if fixed.any():
+            axes.plot(x[fixed], y[fixed], linestyle='', marker = marker, color = "green", markersize=10, alpha=0.6, zorder=20)
+
 def _draw_xconstraint(truss_model,axes,x,y):
+    import matplotlib.markers as markers
     if x<=0:
         axes.plot(x, y, marker = markers.CARETRIGHT, color = "green", markersize=10, alpha=0.6, zorder=20)
     else :
         axes.plot(x, y, marker = markers.CARETLEFT, color = "green", markersize=10, alpha=0.6, zorder=20)
 
 def _draw_yconstraint(truss_model,axes,x,y):
+    import matplotlib.markers as markers
     if y<=0:
         axes.plot(x, y, marker = markers.CARETUP, color = "green", markersize=10, alpha=0.6, zorder=20)
     else:
@@ -276,45 +314,417 @@ def _draw_constraint(truss_model,axes,x,y):
     axes.plot(x, y, marker = marker, color = "green", markersize=10, alpha=0.6)
 
 def _calculate_arrow_size(truss_model):
-    x0,x1,y0,y1 = truss_model.rect_region(factor=10)
+    return _arrow_size(np.array([(node.x, node.y) for node in truss_model.get_nodes()], dtype=float))
+
+def _arrow_size(coords):
+    x0,x1,y0,y1 = _rect_region(coords, factor=10)
     sf = 5e-2
     kfx = sf*(x1-x0)
     kfy = sf*(y1-y0)
     return np.mean([kfx,kfy])
 
-# Detects is an input truss model is solvable by checking if the K2S (stiffness
-# matrix has a non-huge or non-infinite condition number. If the condition number
-# is not huge or infinite, then the structure is well behaved. The matrix has
-# non-zero determinant and its inverse can be computed.
+# ---------------------------------------------------------------------------
+# Plates.
+# ---------------------------------------------------------------------------
+
+# Plots values of a plate solved by solve_plate() over its mesh, like nusa's
+# LinearTriangleModel.plot_nsol(). values has one value per point (filled
+# contours) or one per cell (flat colored triangles), for example
+# solution.nodal_von_mises or solution.element_von_mises. A single Triangulation
+# is drawn, so meshes with 100k cells plot quickly.
+def plot_plate(points, cells, values, name="seqv", units="Pa"):
+    import matplotlib.pyplot as plt
+    import matplotlib.tri as tri
+
+    coords = np.asarray(points, dtype=float).reshape(len(points), -1)[:, :2]
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, 3)
+    values = np.asarray(values, dtype=float)
+    triangulation = tri.Triangulation(coords[:,0], coords[:,1], cells)
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    if len(values) == len(cells):
+        plot = ax.tripcolor(triangulation, facecolors=values, cmap="jet")
+    else:
+        plot = ax.tricontourf(triangulation, values, cmap="jet")
+    fig.colorbar(plot)
+    x0,x1,y0,y1 = _rect_region(coords)
+    ax.set_xlim(x0,x1)
+    ax.set_ylim(y0,y1)
+    ax.set_aspect("equal")
+    ax.set_title("{0} (Max:{1:0.3e}, Min:{2:0.3e}) Units: {3}  ".format(name, values.max(), values.min(), units))
+    return fig
+
+# ---------------------------------------------------------------------------
+# Nusa models.
+# ---------------------------------------------------------------------------
+
+# Builds a nusa TrussModel from flat arrays in a single call, instead of one
+# add_node(), add_element(), add_force() and add_constraint() call for every
+# node and element. Node i gets label i and element k gets label k, so the
+# order of the arrays is kept in the model.
+#
+# - coords: x and y of the nodes, as a (n, 2) array or a flat one.
+# - connectivity: node indices of the elements, as a (m, 2) array or a flat one.
+# - E, A: elasticity and area of the elements. E may also be a single value.
+# - fixed_dofs: degrees of freedom with zero displacement, 2*i for the x of node
+#   i and 2*i+1 for its y.
+# - nodal_forces: fx and fy of the nodes, as a (n, 2) array or a flat one.
 #
-# If the condition number of the matrix is a huge number or infinite, then the
-# matrix is ill-behaved. The matrix is non-reversable, its determinant is zero and
-# it's called singular. In this case, it is not solvable because the truss is
-# probably not stable/rigid.
+# The model is an ArrayTrussModel, which never builds nusa's dense global
+# matrix unless it is asked for.
+@_instrumented("build_model_from_arrays")
+def build_model_from_arrays(coords, connectivity, E, A, fixed_dofs, nodal_forces):
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    connectivity = np.asarray(connectivity, dtype=np.int64).reshape(-1, 2)
+    areas = np.asarray(A, dtype=float).reshape(-1)
+    elasticities = np.broadcast_to(np.asarray(E, dtype=float), areas.shape).copy()
+    forces = np.asarray(nodal_forces, dtype=float).reshape(-1)
+    known = np.full(2*len(coords), np.nan)
+    known[np.asarray(fixed_dofs, dtype=np.int64).reshape(-1)] = 0.0
+    return _build_array_model(coords, connectivity, elasticities, areas, known, forces)
+
+# Nusa model of a TrussArrays, with its results if it's solved. It's the
+# inverse of TrussArrays.from_model().
+def model_from_truss_arrays(truss_arrays):
+    coords, connectivity, elasticities, areas, known, forces = truss_arrays.model_arrays()
+    truss_model = _build_array_model(coords, connectivity.astype(np.int64), elasticities.copy(), areas.copy(), known.copy(), forces.copy())
+    if truss_arrays.is_solved:
+        directions, stiffnesses, _ = _element_geometry(truss_model.coords, truss_model.connectivity, truss_model.elasticities, truss_model.areas)
+        _write_results(truss_model, truss_arrays.displacements, truss_arrays.nodal_forces, truss_model.connectivity,
+                       directions, stiffnesses, truss_model.areas, np.flatnonzero(np.isnan(known)))
+        truss_model.element_forces = truss_arrays.element_forces.copy()
+        truss_model.element_stresses = truss_arrays.element_stresses.copy()
+    return truss_model
+
+# ArrayTrussModel with the given arrays. Known displacements may be any value,
+# not only zero.
+def _build_array_model(coords, connectivity, elasticities, areas, known, forces):
+    from nusa import Node, Truss
+    truss_model = _array_truss_model_class()(coords, connectivity, elasticities, areas, known, forces)
+    nodes = [Node((x, y)) for x, y in coords]
+    for node in nodes:
+        truss_model.add_node(node)
+    for (i, j), elasticity, area in zip(connectivity, elasticities, areas):
+        truss_model.add_element(Truss((nodes[i], nodes[j]), elasticity, area))
+
+    # Same node and model state add_force() and add_constraint() would leave.
+    for label, node in enumerate(nodes):
+        node.fx, node.fy = forces[2*label], forces[2*label + 1]
+        truss_model.F[label] = {"fx": node.fx, "fy": node.fy}
+        truss_model.U[label] = {"ux": np.nan, "uy": np.nan}
+        for offset, key in enumerate(("ux", "uy")):
+            if not np.isnan(known[2*label + offset]):
+                setattr(node, key, known[2*label + offset])
+                truss_model.U[label][key] = known[2*label + offset]
+    return truss_model
+
+# TrussModel created by build_model_from_arrays(). It keeps the arrays it was
+# built from, so the sparse solver doesn't need to read them back from the
+# nodes and elements, and it assembles nusa's dense global matrix KG only if
+# something (like nusa's own solve()) uses it.
 #
-# -- From: Basics of Finite Element Method — Direct Stiffness Method Part 1 --
-# "The attribute that stiffness matrix is symmetric comes from the Maxwell’s
-# Reciprocal Theorem which states that for any linear elastic body, displacement
-# produced at any point A due to certain load applied at point B should be equal
-# to displacement produced at point B when same load is applied at Point A.
+# The class derives from nusa's TrussModel, so it's created when it's first
+# needed and available as NusaPlus.ArrayTrussModel from then on.
+_ArrayTrussModel = None
+
+def _array_truss_model_class():
+    global _ArrayTrussModel
+    if _ArrayTrussModel is not None:
+        return _ArrayTrussModel
+    from nusa import TrussModel
+
+    class ArrayTrussModel(TrussModel):
+        def __init__(self, coords, connectivity, elasticities, areas, known_displacements, forces):
+            TrussModel.__init__(self)
+            self.coords = coords
+            self.connectivity = connectivity
+            self.elasticities = elasticities
+            self.areas = areas
+            self.known_displacements = known_displacements
+            self.forces = forces
+            self.IS_KG_BUILDED = True
+            self._KG = None
+
+        def model_arrays(self):
+            return self.coords, self.connectivity, self.elasticities, self.areas, self.known_displacements, self.forces
+
+        @property
+        def KG(self):
+            if self._KG is None:
+                directions, stiffnesses, _ = _element_geometry(self.coords, self.connectivity, self.elasticities, self.areas)
+                self._KG = _assemble_stiffness(len(self.forces), self.connectivity, directions, stiffnesses).toarray()
+            return self._KG
+
+        @KG.setter
+        def KG(self, value):
+            self._KG = value
+
+    # Named like a module level class, so its models can be pickled.
+    ArrayTrussModel.__module__ = __name__
+    ArrayTrussModel.__qualname__ = "ArrayTrussModel"
+    _ArrayTrussModel = ArrayTrussModel
+    return ArrayTrussModel
+
+# Names that used to come from `from nusa import *` (like TrussModel, Node or
+# plt) and ArrayTrussModel are still NusaPlus attributes, but nusa is only
+# imported when one of them is used.
+def __getattr__(name):
+    if name == "ArrayTrussModel":
+        return _array_truss_model_class()
+    if name.startswith("__"):
+        raise AttributeError(name)
+    import nusa
+    try:
+        return getattr(nusa, name)
+    except AttributeError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name)) from None
+
+# ---------------------------------------------------------------------------
+# Background rendering.
 #
-# Since we have assumed the truss member to be linear elastic, the Maxwell’s
-# Reciprocal Theorem applies here and hence the stiffness matrix is symmetric.
-# This, however, is not always true! The stiffness matric tends to get
-# un-symmetric when material behaves in-elastically or has local instability,
-# for example in problems involving damage and failure."
-# -- End of quote.
+# Saving plots of a truss means drawing several views of the same solution and
+# writing each of them as PDF and PNG at 300 dpi, which takes much longer than
+# solving it. render_views() takes a single snapshot of a solved model and
+# sends it with the views to a small pool of worker processes, which draw and
+# write the files while the caller goes on.
+# ---------------------------------------------------------------------------
+
+# Maximum number of worker processes drawing plots and of view batches waiting
+# for them. When there are more, render_views() waits for the oldest one, so
+# plots can't pile up in memory faster than they are written.
+RENDER_PROCESSES = 1
+MAX_PENDING_RENDERS = 8
+
+# Draws views of a truss model and saves each of them as a PDF and a PNG in a
+# background process. The model is read only once, so it can be changed or
+# solved again as soon as this returns.
 #
-# The code for this function is extracted from the beginning of the _experimental.py
-# solve() function. There, la.solve(self.K2S,self.F2S) can throw an error if the first
-# parameter is a singular or non square matrix.
-def isModelSolvable(trussModel):
-    trussModel.VU = [node[key] for node in trussModel.U.values() for key in ("ux","uy")]
-    trussModel.VF = [node[key] for node in trussModel.F.values() for key in ("fx","fy")]
-    knw = [pos for pos,value in enumerate(trussModel.VU) if not value is np.nan]
-    trussModel.K2S = np.delete(np.delete(trussModel.KG,knw,0),knw,1)
-
-    if la.cond(trussModel.K2S) < 1/sys.float_info.epsilon:
-        return True
+# - views: sequence of dictionaries, one per plot, with the keys:
+#   * "path": path of the files, without the extension.
+#   * "kind": "model" (default) for plot_model() or "deformed" for
+#     plot_deformed_shape(). Deformed views need a solved model.
+#   * "forces": forces drawn in model views. "applied" (default) draws the
+#     applied forces, "none" draws no forces and an array of nodal forces, as
+#     in build_model_from_arrays(), draws those forces instead.
+#   * "is_proportional", "fixed_frame", "deform_factor", "shows_stresses" and
+#     "maximum_stress": arguments of the plot functions, with the same defaults.
+#   * "formats" and "dpi": extensions of the saved files and their resolution,
+#     ("pdf", "png") and 300 by default.
+# - processes: number of worker processes, RENDER_PROCESSES by default. 0 draws
+#   and saves the views in this process before returning.
+#
+# Errors of the workers are raised by a later call to render_views() or by
+# wait_for_renders().
+@_instrumented("render_views")
+def render_views(truss_model, views, processes=None):
+    _render_views(truss_snapshot(truss_model), views, processes)
+
+def _render_views(snapshot, views, processes=None):
+    views = [dict(view) for view in views]
+    processes = RENDER_PROCESSES if processes is None else processes
+    if processes == 0:
+        _render_snapshot_views(snapshot, views)
+        return
+
+    while len(_pending_renders) >= MAX_PENDING_RENDERS:
+        _pending_renders.popleft().result()
+    _pending_renders.append(_get_render_pool(processes).submit(_render_snapshot_views, snapshot, views))
+
+# Waits until all views given to render_views() are saved.
+def wait_for_renders():
+    while _pending_renders:
+        _pending_renders.popleft().result()
+
+# Waits for the pending views and stops the worker processes of render_views().
+def shutdown_render_pool():
+    global _render_pool, _render_pool_processes
+    try:
+        wait_for_renders()
+    finally:
+        if _render_pool is not None:
+            _render_pool.shutdown()
+        _render_pool = None
+        _render_pool_processes = 0
+
+_render_pool = None
+_render_pool_processes = 0
+_pending_renders = collections.deque()
+
+def _get_render_pool(processes):
+    global _render_pool, _render_pool_processes
+    if _render_pool is None or _render_pool_processes != processes:
+        shutdown_render_pool()
+        _render_pool = concurrent.futures.ProcessPoolExecutor(processes, mp_context=_spawn_context(), initializer=_start_render_worker)
+        _render_pool_processes = processes
+    return _render_pool
+
+# Workers only write files, so they use a non interactive backend.
+def _start_render_worker():
+    import matplotlib as mpl
+    mpl.use("agg")
+
+def _render_snapshot_views(snapshot, views):
+    import matplotlib.pyplot as plt
+    for view in views:
+        if view.get("kind", "model") == "deformed":
+            figure = _plot_deformed_snapshot(snapshot, view.get("deform_factor", 1.0), view.get("is_proportional", True),
+                                             view.get("shows_stresses", False), view.get("maximum_stress", 0), view.get("fixed_frame", []))
+        else:
+            forces = view.get("forces", "applied")
+            if isinstance(forces, str):
+                forces = snapshot.forces if forces == "applied" else np.zeros_like(snapshot.forces)
+            else:
+                forces = np.asarray(forces, dtype=float).reshape(-1, 2)
+            figure = _plot_model_snapshot(snapshot._replace(forces=forces), view.get("is_proportional", True), view.get("fixed_frame", []))
+
+        for extension in view.get("formats", ("pdf", "png")):
+            figure.savefig(view["path"] + "." + extension, dpi=view.get("dpi", 300))
+        # plot_model() may leave an empty figure behind, so all are closed.
+        plt.close("all")
+
+# Plots EvolutionChamber saves for its bridges, by name. "forces": "load" draws
+# the logged load forces.
+RUN_LOG_VIEWS = {
+    "All Forces": {"is_proportional": False},
+    "Deformed": {"kind": "deformed", "shows_stresses": True, "maximum_stress": 0.5 * 300e6},
+    "No Forces": {"forces": "none"},
+    "Load Forces": {"forces": "load", "is_proportional": False},
+}
+
+# Renders plots of the trusses of a run log into a folder, with the names
+# EvolutionChamber used to give them.
+#
+# - generations: generations whose best truss is rendered. By default, all
+#   logged trusses are rendered.
+# - views: names of the RUN_LOG_VIEWS to render, or a dictionary of views as
+#   in render_views() without their paths. By default, all RUN_LOG_VIEWS.
+# - fixed_frame: frame of all plots, [minX, maxX, minY, maxY]. By default, each
+#   plot is framed around its truss.
+# - processes: number of worker processes, all cores by default.
+#
+# Returns the number of rendered trusses.
+def replay_run_log(path, output_path, generations=None, views=None, fixed_frame=[], dpi=300, formats=("pdf", "png"), processes=None):
+    log = RunLog(path)
+    if generations is None:
+        indices = range(len(log))
+    else:
+        indices = sorted({index for index in map(log.best_truss_index, generations) if index is not None})
+    if views is None or not isinstance(views, dict):
+        views = {name: RUN_LOG_VIEWS[name] for name in (views or RUN_LOG_VIEWS)}
+
+    processes = processes or os.cpu_count() or 1
+    for index in indices:
+        truss = log.truss(index)
+        # Dots of the fitness are replaced with commas, because dots mess with
+        # file names.
+        fitness = str(round(truss.fitness, 2)).replace(".", ",")
+        truss_views = []
+        for name, view in views.items():
+            view = dict(view, dpi=dpi, formats=formats, path=os.path.join(output_path, "%s fit%s g%d" % (name, fitness, truss.generation)))
+            view.setdefault("fixed_frame", fixed_frame)
+            # Views that need results or load forces the truss wasn't logged
+            # with are skipped.
+            if view.get("kind") == "deformed" and truss.snapshot.stresses is None:
+                continue
+            if isinstance(view.get("forces"), str) and view["forces"] == "load":
+                if truss.load_forces is None:
+                    continue
+                view["forces"] = truss.load_forces
+            truss_views.append(view)
+        _render_views(truss.snapshot, truss_views, processes)
+    wait_for_renders()
+    return len(indices)
+
+# Renders one frame per logged generation, showing the best truss of the
+# generation with a fixed frame, to be assembled into an animation. Frames are
+# saved as "frame 00000.png", "frame 00001.png" and so on, from the first
+# logged generation with a truss.
+#
+# - view: view as in render_views(), "No Forces" of RUN_LOG_VIEWS by default.
+#
+# Returns the number of frames.
+def replay_animation(path, output_path, fixed_frame, view=None, dpi=150, processes=None):
+    log = RunLog(path)
+    view = dict(RUN_LOG_VIEWS["No Forces"] if view is None else view, fixed_frame=fixed_frame, dpi=dpi, formats=("png",))
+    indices = [log.best_truss_index(generation) for generation in log.statistics.generations]
+    indices = [index for index in indices if index is not None]
+
+    # Consecutive frames usually show the same truss, so their views are sent
+    # to the workers together with a single snapshot.
+    processes = processes or os.cpu_count() or 1
+    frame = 0
+    for index, group in itertools.groupby(indices):
+        truss = log.truss(index)
+        views = []
+        for _ in group:
+            views.append(dict(view, path=os.path.join(output_path, "frame %05d" % frame)))
+            frame += 1
+        _render_views(truss.snapshot, views, processes)
+    wait_for_renders()
+    return frame
+
+# Saves the best fitness, fitness mean and fitness standard deviation plots of
+# a run log, like EvolutionChamber's statistics plots.
+def plot_run_statistics(path, output_path, dpi=300, formats=("pdf", "png")):
+    import matplotlib.pyplot as plt
+    generations, best, means, deviations = RunLog(path).statistics
+    if len(generations) == 0:
+        return
+
+    # Best fitness markers are only shown where it improves, and the diamond on
+    # the last generation.
+    improves = np.r_[True, np.diff(best) != 0]
+    improves[-1] = True
+    plots = [
+        ("Best Fitness", "Best fitness evolution", generations[improves], best[improves], True),
+        ("Fitness Mean", "Fitness mean evolution top20%", generations, means, False),
+        ("Fitness Standard Deviation", "Fitness standard deviation evolution top20%", generations, deviations, False),
+    ]
+    for label, name, x, y, shows_markers in plots:
+        figure = plt.figure()
+        axes = figure.add_subplot(111)
+        axes.set_xlabel("Generation")
+        axes.set_ylabel(label)
+        axes.ticklabel_format(style="sci", axis="y", scilimits=[0,0])
+        axes.plot(x, y, color="b")
+        if shows_markers:
+            axes.scatter(x[-1], y[-1], marker="D", color="b")
+            axes.scatter(x[:-1], y[:-1], marker="o", color="b")
+        for extension in formats:
+            figure.savefig(os.path.join(output_path, "%s g%d.%s" % (name, generations[-1], extension)), dpi=dpi)
+        plt.close(figure)
+
+# Renders the plots of a run log from the command line, for example:
+#   python NusaPlus.py "Run.bblog" plots --generations 0 50 100
+#   python NusaPlus.py "Run.bblog" frames --animation --frame -1 11 -2 6
+def _replay_main(arguments=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Renders the plots of a BridgeBuilder run log.")
+    parser.add_argument("log", help="path of the run log")
+    parser.add_argument("output", help="folder where the plots are saved")
+    parser.add_argument("--generations", type=int, nargs="+", help="generations to render, all logged bridges by default")
+    parser.add_argument("--views", nargs="+", choices=list(RUN_LOG_VIEWS), help="plots to render, all by default")
+    parser.add_argument("--animation", action="store_true", help="renders one frame per generation instead")
+    parser.add_argument("--frame", type=float, nargs=4, default=[], metavar=("MIN_X", "MAX_X", "MIN_Y", "MAX_Y"), help="fixed frame of the plots")
+    parser.add_argument("--dpi", type=int, help="resolution of the images")
+    parser.add_argument("--processes", type=int, help="number of worker processes, all cores by default")
+    arguments = parser.parse_args(arguments)
+
+    import matplotlib as mpl
+    mpl.use("agg")
+    os.makedirs(arguments.output, exist_ok=True)
+    if arguments.animation:
+        if not arguments.frame:
+            parser.error("--animation requires --frame")
+        count = replay_animation(arguments.log, arguments.output, arguments.frame, dpi=arguments.dpi or 150, processes=arguments.processes)
+        print("Rendered %d frames." % count)
     else:
-        return False
+        count = replay_run_log(arguments.log, arguments.output, arguments.generations, arguments.views, arguments.frame,
+                               dpi=arguments.dpi or 300, processes=arguments.processes)
+        plot_run_statistics(arguments.log, arguments.output, dpi=arguments.dpi or 300)
+        print("Rendered %d bridges." % count)
+    shutdown_render_pool()
+
+if __name__ == "__main__":
+    _replay_main()
@@ -0,0 +1,2371 @@
+# Solver core of NusaPlus. It only needs NumPy and SciPy, so worker processes
+# and scripts that only check solvability and compute stresses don't import
+# nusa and matplotlib, which take most of NusaPlus' import time. Models are
+# read through their nodes and elements (or their arrays) and solved models get
+# their results like nusa writes them, without importing nusa.
+#
+# NusaPlus imports everything from this file, so NusaPlus users don't need to
+# import it themselves.
+
+import collections
+import functools
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.shared_memory as shared_memory
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+import numpy.linalg as la
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_la
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+# ---------------------------------------------------------------------------
+# Instrumentation.
+#
+# Call counts and wall times of the main NusaPlus functions, sizes of the
+# factorized matrices and counters like solvability rejects and solve cache
+# hits, so a slow generation can be explained. It's disabled by default and
+# then every instrumented call only checks a global, so it costs next to
+# nothing. Enable it with enable_instrumentation(), read it with
+# instrumentation_snapshot() and start over with reset_instrumentation(), for
+# example once per generation.
+# ---------------------------------------------------------------------------
+
+# Maximum number of call times kept per function for the percentiles. Calls
+# beyond it replace random kept ones (reservoir sampling), so the percentiles
+# stay representative without keeping every call.
+INSTRUMENTATION_SAMPLES = 4096
+
+class _Instrumentation:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calls = collections.Counter()
+        self.total_times = collections.Counter()
+        self.max_times = {}
+        self.samples = collections.defaultdict(list)
+        self.counters = collections.Counter()
+        self.sizes = {}
+        self.random = np.random.default_rng(0)
+
+    def add_time(self, name, seconds):
+        self.calls[name] += 1
+        self.total_times[name] += seconds
+        self.max_times[name] = max(seconds, self.max_times.get(name, 0))
+        samples = self.samples[name]
+        if len(samples) < INSTRUMENTATION_SAMPLES:
+            samples.append(seconds)
+        else:
+            index = self.random.integers(self.calls[name])
+            if index < INSTRUMENTATION_SAMPLES:
+                samples[index] = seconds
+
+    def add_size(self, name, size):
+        count, total, maximum = self.sizes.get(name, (0, 0, 0))
+        self.sizes[name] = (count + 1, total + size, max(maximum, size))
+
+_instrumentation = None
+
+# Starts or stops the instrumentation. Enabling it again keeps what was
+# recorded.
+def enable_instrumentation(enabled=True):
+    global _instrumentation
+    if not enabled:
+        _instrumentation = None
+    elif _instrumentation is None:
+        _instrumentation = _Instrumentation()
+
+def is_instrumentation_enabled():
+    return _instrumentation is not None
+
+# Forgets everything recorded so far, if the instrumentation is enabled.
+def reset_instrumentation():
+    global _instrumentation
+    if _instrumentation is not None:
+        _instrumentation = _Instrumentation()
+
+# Everything recorded since the instrumentation was enabled or reset, as a
+# dictionary of plain Python values:
+#
+# - "enabled" and "elapsed": whether it's enabled and the seconds since then.
+# - "timers": calls, total, mean, p50, p90, p99 and max seconds of each
+#   instrumented function.
+# - "counters": event counts, like "solvability.rejected" or "solve_cache.hits".
+# - "sizes": count, mean and max of the recorded sizes, like the degrees of
+#   freedom and nonzeros of factorized matrices.
+# - "rates": solvability reject rate and solve cache hit rate, None when there
+#   was nothing to count.
+#
+# reset=True resets the instrumentation after taking the snapshot.
+def instrumentation_snapshot(reset=False):
+    instrumentation = _instrumentation
+    if instrumentation is None:
+        return {"enabled": False, "elapsed": 0.0, "timers": {}, "counters": {}, "sizes": {}, "rates": {}}
+
+    timers = {}
+    for name, calls in instrumentation.calls.items():
+        total = instrumentation.total_times[name]
+        p50, p90, p99 = np.percentile(instrumentation.samples[name], [50, 90, 99])
+        timers[name] = {"calls": calls, "total": total, "mean": total/calls, "p50": float(p50),
+                        "p90": float(p90), "p99": float(p99), "max": instrumentation.max_times[name]}
+    counters = dict(instrumentation.counters)
+    sizes = {name: {"count": count, "mean": total/count, "max": maximum} for name, (count, total, maximum) in instrumentation.sizes.items()}
+
+    def rate(part, whole):
+        return part/whole if whole else None
+
+    checks = counters.get("solvability.accepted", 0) + counters.get("solvability.rejected", 0)
+    lookups = counters.get("solve_cache.hits", 0) + counters.get("solve_cache.misses", 0)
+    factorization_lookups = counters.get("factorization_cache.hits", 0) + counters.get("factorization_cache.misses", 0)
+    rates = {
+        "solvability_reject": rate(counters.get("solvability.rejected", 0), checks),
+        "solve_cache_hit": rate(counters.get("solve_cache.hits", 0), lookups),
+        "factorization_cache_hit": rate(counters.get("factorization_cache.hits", 0), factorization_lookups),
+    }
+
+    snapshot = {"enabled": True, "elapsed": time.perf_counter() - instrumentation.started,
+                "timers": timers, "counters": counters, "sizes": sizes, "rates": rates}
+    if reset:
+        reset_instrumentation()
+    return snapshot
+
+# Short text report of a snapshot, with one line per timer and a line with the
+# counters and rates, for logs.
+def format_instrumentation(snapshot):
+    if not snapshot["enabled"]:
+        return "Instrumentation disabled."
+    lines = ["%-40s %8s %10s %10s %10s %10s" % ("function", "calls", "total ms", "mean ms", "p90 ms", "max ms")]
+    for name, timer in sorted(snapshot["timers"].items(), key=lambda item: -item[1]["total"]):
+        lines.append("%-40s %8d %10.1f %10.3f %10.3f %10.3f" % (name, timer["calls"], 1e3*timer["total"],
+                     1e3*timer["mean"], 1e3*timer["p90"], 1e3*timer["max"]))
+    for name, size in sorted(snapshot["sizes"].items()):
+        lines.append("%s: mean %.0f, max %.0f over %d" % (name, size["mean"], size["max"], size["count"]))
+    values = ["%s %d" % item for item in sorted(snapshot["counters"].items())]
+    values += ["%s rate %.1f%%" % (name, 100*value) for name, value in sorted(snapshot["rates"].items()) if value is not None]
+    if values:
+        lines.append(", ".join(values))
+    return "\n".join(lines)
+
+# Decorator that times the calls of a function under a name when the
+# instrumentation is enabled.
+def _instrumented(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _instrumentation is None:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                # The instrumentation may have been disabled during the call.
+                if _instrumentation is not None:
+                    _instrumentation.add_time(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+# Counts an event when the instrumentation is enabled.
+def _count(name, count=1):
+    if _instrumentation is not None:
+        _instrumentation.counters[name] += count
+
+# Records a size, like the dimension of a matrix, when the instrumentation is
+# enabled.
+def _record_size(name, size):
+    if _instrumentation is not None:
+        _instrumentation.add_size(name, size)
+
+# Detects is an input truss model is solvable by checking if the K2S (stiffness
+# matrix has a non-huge or non-infinite condition number. If the condition number
+# is not huge or infinite, then the structure is well behaved. The matrix has
+# non-zero determinant and its inverse can be computed.
+#
+# If the condition number of the matrix is a huge number or infinite, then the
+# matrix is ill-behaved. The matrix is non-reversable, its determinant is zero and
+# it's called singular. In this case, it is not solvable because the truss is
+# probably not stable/rigid.
+#
+# -- From: Basics of Finite Element Method — Direct Stiffness Method Part 1 --
+# "The attribute that stiffness matrix is symmetric comes from the Maxwell’s
+# Reciprocal Theorem which states that for any linear elastic body, displacement
+# produced at any point A due to certain load applied at point B should be equal
+# to displacement produced at point B when same load is applied at Point A.
+#
+# Since we have assumed the truss member to be linear elastic, the Maxwell’s
+# Reciprocal Theorem applies here and hence the stiffness matrix is symmetric.
+# This, however, is not always true! The stiffness matric tends to get
+# un-symmetric when material behaves in-elastically or has local instability,
+# for example in problems involving damage and failure."
+# -- End of quote.
+#
+# The code for this function is extracted from the beginning of the _experimental.py
+# solve() function. There, la.solve(self.K2S,self.F2S) can throw an error if the first
+# parameter is a singular or non square matrix.
+#
+# The condition number check needs nusa's dense KG and a full SVD, so it is
+# only used with method="condition". By default the answer comes from the much
+# cheaper factorization in check_solvability(), where `tolerance` is the
+# inverse of the largest accepted condition number.
+#
+# Both checks are preceded by check_model_rigidity(), which rejects mechanisms
+# from the topology and supports alone. Most unsolvable trusses created by the
+# evolution are mechanisms, so the numeric check rarely has to run for them.
+@_instrumented("isModelSolvable")
+def isModelSolvable(trussModel, method="factorization", tolerance=1e-12):
+    if not check_model_rigidity(trussModel).is_rigid:
+        _count("solvability.rejected")
+        _count("solvability.rigidity_rejected")
+        return False
+    if method == "condition":
+        is_solvable = _isModelSolvableByCondition(trussModel)
+    else:
+        is_solvable = check_solvability(trussModel, tolerance).is_solvable
+    _count("solvability.accepted" if is_solvable else "solvability.rejected")
+    return bool(is_solvable)
+
+@_instrumented("isModelSolvable.condition")
+def _isModelSolvableByCondition(trussModel):
+    trussModel.VU = [node[key] for node in trussModel.U.values() for key in ("ux","uy")]
+    trussModel.VF = [node[key] for node in trussModel.F.values() for key in ("fx","fy")]
+    knw = [pos for pos,value in enumerate(trussModel.VU) if not value is np.nan]
+    trussModel.K2S = np.delete(np.delete(trussModel.KG,knw,0),knw,1)
+
+    if la.cond(trussModel.K2S) < 1/sys.float_info.epsilon:
+        return True
+    else:
+        return False
+
+# ---------------------------------------------------------------------------
+# Sparse truss solver.
+#
+# Nusa's TrussModel.solve() assembles a dense global stiffness matrix one
+# element at a time and solves it with la.solve, so its cost grows cubically
+# with the number of nodes. The functions below assemble the same matrix from
+# coordinate and connectivity arrays with NumPy, solve it with scipy.sparse and
+# write the results back into the nusa model, so plots and reports keep working.
+# ---------------------------------------------------------------------------
+
+# Gathers the arrays that describe a truss model. Nodes are indexed by their
+# nusa label, so the degrees of freedom of node i are 2*i (ux) and 2*i+1 (uy),
+# exactly like in nusa's global matrix. Known displacements are the values set
+# by add_constraint() and unknown ones are nan. Models built from arrays (like
+# NusaPlus' ArrayTrussModel) return the arrays they were built from with their
+# model_arrays() method.
+def _model_arrays(truss_model):
+    model_arrays = getattr(truss_model, "model_arrays", None)
+    if model_arrays is not None:
+        return model_arrays()
+
+    nodes = sorted(truss_model.get_nodes(), key=lambda node: node.label)
+    elements = list(truss_model.get_elements())
+    coords = np.array([(node.x, node.y) for node in nodes], dtype=float).reshape(-1, 2)
+    connectivity = np.array([[node.label for node in element.get_nodes()] for element in elements], dtype=np.int64).reshape(-1, 2)
+    elasticities = np.array([element.E for element in elements], dtype=float)
+    areas = np.array([element.A for element in elements], dtype=float)
+
+    known = _known_displacements(truss_model, len(nodes))
+
+    forces = np.zeros(2*len(nodes))
+    for label, force in getattr(truss_model, "F", {}).items():
+        forces[2*label] = force["fx"]
+        forces[2*label + 1] = force["fy"]
+
+    return coords, connectivity, elasticities, areas, known, forces
+
+# Reads the known displacements of a nusa model from U, where add_constraint()
+# sets them, so constraints and nodes added at any time are used. Writing the
+# results replaces the nan values of U with the computed displacements, so
+# _write_results() stores the known displacements and the ones it wrote first:
+# values of U that are still the written ones keep the stored constraints.
+def _known_displacements(truss_model, number_of_nodes):
+    stored = getattr(truss_model, "known_displacements", None)
+    written = getattr(truss_model, "written_displacements", None)
+    known = np.full(2*number_of_nodes, np.nan)
+    if stored is not None:
+        count = min(len(stored), len(known))
+        known[:count] = stored[:count]
+    for label, displacements in getattr(truss_model, "U", {}).items():
+        for offset, key in enumerate(("ux", "uy")):
+            dof = 2*label + offset
+            value = displacements[key]
+            if value is np.nan or dof >= len(known):
+                continue
+            if written is not None and dof < len(written) and value == written[dof]:
+                continue
+            known[dof] = value
+    return known
+
+# Direction vectors b = [-C, -S, C, S] and axial stiffnesses k = EA/L of all
+# elements. The element stiffness matrix is k*b*b^T and the element force is
+# k*b.u, which is nusa's Truss.get_element_stiffness() and Truss.f.
+def _element_geometry(coords, connectivity, elasticities, areas):
+    delta = coords[connectivity[:,1]] - coords[connectivity[:,0]]
+    lengths = np.hypot(delta[:,0], delta[:,1])
+    cosines = delta[:,0]/lengths
+    sines = delta[:,1]/lengths
+    directions = np.column_stack((-cosines, -sines, cosines, sines))
+    stiffnesses = elasticities*areas/lengths
+    return directions, stiffnesses, lengths
+
+# Global degrees of freedom of each element, in the order ux_i, uy_i, ux_j, uy_j.
+def _element_dofs(connectivity):
+    i, j = connectivity[:,0], connectivity[:,1]
+    return np.column_stack((2*i, 2*i+1, 2*j, 2*j+1))
+
+# Assembles the global stiffness matrix in COO format from all 4x4 element
+# matrices at once. Duplicated entries are summed by the CSR conversion.
+def _assemble_stiffness(number_of_dofs, connectivity, directions, stiffnesses):
+    blocks = stiffnesses[:,None,None] * directions[:,:,None] * directions[:,None,:]
+    dofs = _element_dofs(connectivity)
+    rows = np.repeat(dofs, 4, axis=1)
+    cols = np.tile(dofs, (1, 4))
+    return sparse.coo_matrix(
+        (blocks.ravel(), (rows.ravel(), cols.ravel())),
+        shape=(number_of_dofs, number_of_dofs)
+    ).tocsr()
+
+# Sparse LU factorization of a symmetric reduced stiffness matrix. Rows and
+# columns are first reordered with reverse Cuthill-McKee, which keeps the
+# nonzeros of a truss close to the diagonal and the factors small. No pivoting
+# is done, so for a symmetric positive definite matrix this is an LDL^T
+# factorization.
+#
+# Band orderings fill in too much for large 2D meshes, like plates, so
+# ordering="minimum_degree" lets SuperLU order them by minimum degree instead.
+class _Factorization:
+    @_instrumented("factorization")
+    def __init__(self, matrix, ordering="reverse_cuthill_mckee"):
+        _record_size("factorization.dofs", matrix.shape[0])
+        _record_size("factorization.nonzeros", matrix.nnz)
+        if ordering == "minimum_degree":
+            self.permutation = np.arange(matrix.shape[0])
+            permuted, permc_spec = matrix.tocsc(), "MMD_AT_PLUS_A"
+        else:
+            self.permutation = reverse_cuthill_mckee(matrix, symmetric_mode=True)
+            permuted, permc_spec = matrix[self.permutation][:, self.permutation].tocsc(), "NATURAL"
+        try:
+            self.lu = sparse_la.splu(permuted, permc_spec=permc_spec, diag_pivot_thresh=0, options=dict(SymmetricMode=True))
+        except RuntimeError:
+            # Same error la.solve raises for a singular matrix.
+            raise la.LinAlgError("Singular matrix")
+
+    def solve(self, rhs):
+        solution = np.empty_like(rhs, dtype=float)
+        solution[self.permutation] = self.lu.solve(rhs[self.permutation])
+        return solution
+
+    # Approximate memory used by the factors, a value and an index per nonzero.
+    @property
+    def nbytes(self):
+        return 12*(self.lu.L.nnz + self.lu.U.nnz) + self.permutation.nbytes
+
+# Solves a truss model with the sparse solver and writes displacements,
+# reactions, element forces and element stresses back into the model. The
+# results are the same as the ones from nusa's TrussModel.solve(): node ux, uy
+# get the displacements, node fx, fy get K*U and the elements .f and .s
+# properties are computed from the new displacements. Element forces and
+# stresses are also stored as arrays in truss_model.element_forces and
+# truss_model.element_stresses.
+@_instrumented("solve_model")
+def solve_model(truss_model, use_cache=True):
+    coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+    directions, stiffnesses, _ = _element_geometry(coords, connectivity, elasticities, areas)
+    free = np.flatnonzero(np.isnan(known))
+
+    # Identical trusses are solved only once, see _SolveCache.
+    if use_cache:
+        key, dofs = _truss_key(coords, connectivity, elasticities, areas, known, forces)
+        entry = _solve_cache.get(key)
+        if entry is not None:
+            displacements, nodal_forces = (_from_canonical(values, dofs) for values in entry)
+            _write_results(truss_model, displacements, nodal_forces, connectivity, directions, stiffnesses, areas, free)
+            return
+
+    stiffness = _assemble_stiffness(len(forces), connectivity, directions, stiffnesses)
+
+    # As in nusa, known displacements are removed from the system. A truss
+    # accepted by check_and_solve() reuses the factorization of the check.
+    displacements = np.where(np.isnan(known), 0.0, known)
+    if len(free) > 0:
+        factorization = _checked_factorization(coords, connectivity, elasticities, areas, known) if use_cache else None
+        if factorization is None:
+            factorization = _Factorization(stiffness[free][:, free])
+        displacements[free] = factorization.solve(forces[free])
+    nodal_forces = stiffness @ displacements
+
+    if use_cache:
+        _solve_cache.put(key, (displacements[dofs], nodal_forces[dofs]))
+    _write_results(truss_model, displacements, nodal_forces, connectivity, directions, stiffnesses, areas, free)
+
+# Solves a truss model for several load cases with a single factorization of
+# its stiffness matrix. load_cases holds one vector of nodal forces per case,
+# with the same layout as the degrees of freedom (fx and fy of node i at 2*i
+# and 2*i+1). The displacements set by the model constraints are applied to
+# every case. The model itself is not changed.
+#
+# Returns a LoadCases tuple with the displacements and element stresses of each
+# case, one case per row.
+LoadCases = collections.namedtuple("LoadCases", ["displacements", "element_stresses"])
+
+@_instrumented("solve_load_cases")
+def solve_load_cases(truss_model, load_cases):
+    coords, connectivity, elasticities, areas, known, _ = _model_arrays(truss_model)
+    load_cases = np.asarray(load_cases, dtype=float).reshape(-1, len(known))
+    prescribed = np.repeat(known[:,None], len(load_cases), axis=1)
+    system = _LoadCasesSystem(coords, connectivity, elasticities, areas, known)
+    displacements = system.solve(load_cases.T, prescribed)
+    return LoadCases(displacements.T, system.element_stresses(displacements).T)
+
+# Largest multiplier λ of a load case that keeps every element stress within
+# the stress limit when it is added to a base case: |σ_base + λ*σ_unit| <= limit.
+# Each element bounds λ to an interval, so the answer is the upper end of the
+# intersection of all intervals, which is found in closed form instead of by
+# trial and error. Returns -inf if no multiplier satisfies all elements and
+# inf if the load case doesn't stress any element.
+def maximum_load_multiplier(base_stresses, unit_stresses, stress_limit):
+    base_stresses = np.asarray(base_stresses, dtype=float)
+    unit_stresses = np.asarray(unit_stresses, dtype=float)
+    loaded = unit_stresses != 0
+    if np.any(np.abs(base_stresses[~loaded]) > stress_limit):
+        return -np.inf
+
+    bounds = np.stack((
+        (stress_limit - base_stresses[loaded]) / unit_stresses[loaded],
+        (-stress_limit - base_stresses[loaded]) / unit_stresses[loaded]
+    ))
+    upper = bounds.max(axis=0).min(initial=np.inf)
+    lower = bounds.min(axis=0).max(initial=-np.inf)
+    return float(upper) if lower <= upper else -np.inf
+
+# Finds the largest multiple of unit_forces that a truss model supports on top
+# of its own forces (usually the self weight) without any element stress going
+# above stress_limit. Both load cases are solved with one factorization and the
+# multiplier comes from maximum_load_multiplier(). When it is finite the model
+# is left solved for its forces plus the maximum load, so stresses, plots and
+# reports show the truss at its limit.
+@_instrumented("maximum_load")
+def maximum_load(truss_model, unit_forces, stress_limit, use_cache=True):
+    coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+    unit_forces = np.asarray(unit_forces, dtype=float).reshape(-1)
+
+    if use_cache:
+        key, dofs = _truss_key(coords, connectivity, elasticities, areas, known, forces, unit_forces, stress_limit)
+        entry = _solve_cache.get(key)
+        if entry is not None:
+            multiplier, solution, nodal_forces = entry
+            if np.isfinite(multiplier):
+                directions, stiffnesses, _ = _element_geometry(coords, connectivity, elasticities, areas)
+                _write_results(truss_model, _from_canonical(solution, dofs), _from_canonical(nodal_forces, dofs), connectivity, directions, stiffnesses, areas)
+            return float(multiplier)
+
+    # The constraint displacements belong to the base case only, so the unit
+    # case can be scaled and added to it.
+    prescribed = np.column_stack((known, np.where(np.isnan(known), np.nan, 0.0)))
+    factorization = _checked_factorization(coords, connectivity, elasticities, areas, known) if use_cache else None
+    system = _LoadCasesSystem(coords, connectivity, elasticities, areas, known, factorization)
+    displacements = system.solve(np.column_stack((forces, unit_forces)), prescribed)
+    stresses = system.element_stresses(displacements)
+
+    multiplier = maximum_load_multiplier(stresses[:,0], stresses[:,1], stress_limit)
+    solution = displacements[:,0] + multiplier*displacements[:,1] if np.isfinite(multiplier) else displacements[:,0]
+    nodal_forces = system.stiffness @ solution
+    if use_cache:
+        _solve_cache.put(key, (np.float64(multiplier), solution[dofs], nodal_forces[dofs]))
+    if np.isfinite(multiplier):
+        _write_results(truss_model, solution, nodal_forces, connectivity, system.directions, system.stiffnesses, areas)
+    return multiplier
+
+# Stiffness matrix of a model factorized once and shared by several load cases.
+# An existing factorization of the same matrix can be given, like the ones kept
+# by check_and_solve().
+class _LoadCasesSystem:
+    def __init__(self, coords, connectivity, elasticities, areas, known, factorization=None):
+        self.connectivity = connectivity
+        self.areas = areas
+        self.directions, self.stiffnesses, self.lengths = _element_geometry(coords, connectivity, elasticities, areas)
+        self.stiffness = _assemble_stiffness(len(known), connectivity, self.directions, self.stiffnesses)
+        self.free = np.flatnonzero(np.isnan(known))
+        self.factorization = None
+        if len(self.free) > 0:
+            self.factorization = factorization or _Factorization(self.stiffness[self.free][:, self.free])
+
+    # Solves all columns of forces at once. prescribed has the known
+    # displacements of each case and nan for the unknown ones.
+    def solve(self, forces, prescribed):
+        displacements = np.where(np.isnan(prescribed), 0.0, prescribed)
+        if self.factorization is not None:
+            rhs = forces[self.free] - self.stiffness[self.free] @ displacements
+            displacements[self.free] = self.factorization.solve(rhs)
+        return displacements
+
+    def element_stresses(self, displacements):
+        element_displacements = displacements[_element_dofs(self.connectivity)]
+        forces = self.stiffnesses[:,None] * np.einsum("ij,ijk->ik", self.directions, element_displacements)
+        return forces / self.areas[:,None]
+
+# Writes solved displacements, nodal forces and element results into a model.
+# Models with a set_results() method, like TrussArrays, get them as arrays.
+# Nusa models also get the displacements of the `free` degrees of freedom in
+# solved_u, like nusa's solve() leaves them.
+def _write_results(truss_model, displacements, nodal_forces, connectivity, directions, stiffnesses, areas, free=None):
+    element_displacements = displacements[_element_dofs(connectivity)]
+    element_forces = stiffnesses * np.einsum("ij,ij->i", directions, element_displacements)
+    set_results = getattr(truss_model, "set_results", None)
+    if set_results is not None:
+        set_results(displacements, nodal_forces, element_forces, element_forces / areas)
+        return
+
+    truss_model.known_displacements = _known_displacements(truss_model, len(displacements)//2)
+    truss_model.written_displacements = displacements.copy()
+    truss_model.U = {}
+    truss_model.NF = {}
+    for node in truss_model.get_nodes():
+        label = node.label
+        node.ux, node.uy = displacements[2*label], displacements[2*label + 1]
+        node.fx, node.fy = nodal_forces[2*label], nodal_forces[2*label + 1]
+        truss_model.U[label] = {"ux": node.ux, "uy": node.uy}
+        truss_model.NF[label] = {"fx": node.fx, "fy": node.fy}
+    truss_model.VU = list(displacements)
+    truss_model.element_forces = element_forces
+    truss_model.element_stresses = element_forces / areas
+    if free is not None:
+        truss_model.solved_u = displacements[free]
+
+# Result of stress_summary(). stresses holds the signed stress of every element
+# in label order and the other fields summarize their absolute values.
+StressSummary = collections.namedtuple("StressSummary", ["stresses", "max_stress", "mean_stress", "top_mean_stress"])
+
+# Gets all element stresses of a solved model as a contiguous float64 array,
+# together with the maximum absolute stress, the mean absolute stress and the
+# mean of the `top_count` largest absolute stresses. It's meant to be called
+# once after solving, instead of reading the .s property of every element.
+@_instrumented("stress_summary")
+def stress_summary(truss_model, top_count=3):
+    stresses = getattr(truss_model, "element_stresses", None)
+    if stresses is None:
+        stresses = [element.s for element in truss_model.get_elements()]
+    return _summarize_stresses(stresses, top_count)
+
+def _summarize_stresses(stresses, top_count):
+    stresses = np.ascontiguousarray(stresses, dtype=np.float64)
+    if len(stresses) == 0:
+        return StressSummary(stresses, 0.0, 0.0, 0.0)
+
+    magnitudes = np.abs(stresses)
+    # np.partition puts the largest values at the end without sorting them.
+    count = max(1, min(int(top_count), len(magnitudes)))
+    top = np.partition(magnitudes, len(magnitudes) - count)[-count:]
+    return StressSummary(stresses, float(magnitudes.max()), float(magnitudes.mean()), float(top.mean()))
+
+# ---------------------------------------------------------------------------
+# Truss arrays.
+#
+# A nusa TrussModel has a Node and a Truss object per node and element, with
+# dictionaries of forces and displacements besides, and the evolution creates
+# and discards thousands of them every generation. TrussArrays keeps the same
+# truss in a few contiguous arrays and is accepted by every NusaPlus function
+# that takes a truss model, so most trusses never need nusa objects.
+# ---------------------------------------------------------------------------
+
+# Truss as a struct of arrays. Node i is the node with nusa label i and element
+# k the element with label k:
+#
+# - coords: (n, 2) float64 node coordinates.
+# - connectivity: (m, 2) int32 node indices of the elements.
+# - elasticities, areas: (m,) float64 element properties.
+# - known_displacements: (2n,) float64 prescribed displacements, nan for free
+#   degrees of freedom, ordered like nusa's (ux and uy of node i at 2*i and
+#   2*i+1).
+# - forces: (2n,) float64 applied nodal forces.
+# - displacements, nodal_forces: (2n,) float64 results (reactions included in
+#   nodal_forces), or None before the truss is solved.
+# - element_forces, element_stresses: (m,) float64 results, or None.
+#
+# to_model() and from_model() convert it to and from a nusa model without
+# losing anything, results included, and to_bytes() and from_bytes() to and
+# from a compact binary form.
+class TrussArrays:
+    __slots__ = ("coords", "connectivity", "elasticities", "areas", "known_displacements", "forces",
+                 "displacements", "nodal_forces", "element_forces", "element_stresses")
+
+    _MAGIC = b"BBTRUSS1"
+    _HEADER = struct.Struct("<8sqq?7x")
+
+    def __init__(self, coords, connectivity, elasticities, areas, known_displacements, forces):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.connectivity = np.ascontiguousarray(connectivity, dtype=np.int32).reshape(-1, 2)
+        self.areas = np.ascontiguousarray(areas, dtype=np.float64).reshape(-1)
+        self.elasticities = np.ascontiguousarray(np.broadcast_to(np.asarray(elasticities, dtype=np.float64), self.areas.shape))
+        self.known_displacements = np.ascontiguousarray(known_displacements, dtype=np.float64).reshape(-1)
+        self.forces = np.ascontiguousarray(forces, dtype=np.float64).reshape(-1)
+        self.displacements = None
+        self.nodal_forces = None
+        self.element_forces = None
+        self.element_stresses = None
+
+    # Same arguments as NusaPlus' build_model_from_arrays().
+    @classmethod
+    def from_arrays(cls, coords, connectivity, E, A, fixed_dofs, nodal_forces):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        known = np.full(2*len(coords), np.nan)
+        known[np.asarray(fixed_dofs, dtype=np.int64).reshape(-1)] = 0.0
+        return cls(coords, connectivity, E, A, known, nodal_forces)
+
+    # Arrays of a nusa model (or of any model NusaPlus accepts). The results of
+    # a solved model, by nusa or by NusaPlus, are read from its nodes.
+    @classmethod
+    def from_model(cls, truss_model):
+        coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+        arrays = cls(coords, connectivity, elasticities, areas, known, forces)
+        if isinstance(truss_model, TrussArrays):
+            if truss_model.is_solved:
+                arrays.set_results(truss_model.displacements, truss_model.nodal_forces,
+                                   truss_model.element_forces, truss_model.element_stresses)
+            return arrays
+
+        nodes = sorted(truss_model.get_nodes(), key=lambda node: node.label)
+        displacements = np.array([(node.ux, node.uy) for node in nodes], dtype=float).reshape(-1)
+        if len(nodes) > 0 and not np.isnan(displacements).any():
+            nodal_forces = np.array([(node.fx, node.fy) for node in nodes], dtype=float).reshape(-1)
+            element_forces = getattr(truss_model, "element_forces", None)
+            if element_forces is None:
+                directions, stiffnesses, _ = _element_geometry(arrays.coords, arrays.connectivity, arrays.elasticities, arrays.areas)
+                element_forces = stiffnesses * np.einsum("ij,ij->i", directions, displacements[_element_dofs(arrays.connectivity)])
+            arrays.set_results(displacements, nodal_forces, element_forces, np.asarray(element_forces) / arrays.areas)
+        return arrays
+
+    # Nusa model with the same nodes, elements, constraints, forces and
+    # results, for code that needs nusa objects. It's built by NusaPlus, so
+    # this imports nusa.
+    def to_model(self):
+        import NusaPlus
+        return NusaPlus.model_from_truss_arrays(self)
+
+    def model_arrays(self):
+        return self.coords, self.connectivity, self.elasticities, self.areas, self.known_displacements, self.forces
+
+    def set_results(self, displacements, nodal_forces, element_forces, element_stresses):
+        self.displacements = np.ascontiguousarray(displacements, dtype=np.float64)
+        self.nodal_forces = np.ascontiguousarray(nodal_forces, dtype=np.float64)
+        self.element_forces = np.ascontiguousarray(element_forces, dtype=np.float64)
+        self.element_stresses = np.ascontiguousarray(element_stresses, dtype=np.float64)
+
+    @property
+    def is_solved(self):
+        return self.displacements is not None
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__ if getattr(self, name) is not None)
+
+    # Binary form: a header with the number of nodes and elements and whether
+    # there are results, followed by the raw little-endian arrays in __slots__
+    # order.
+    def to_bytes(self):
+        parts = [self._HEADER.pack(self._MAGIC, len(self.coords), len(self.connectivity), self.is_solved)]
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                parts.append(value.astype(value.dtype.newbyteorder("<"), copy=False).tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, number_of_nodes, number_of_elements, is_solved = cls._HEADER.unpack_from(data)
+        if magic != cls._MAGIC:
+            raise ValueError("not TrussArrays data")
+        shapes = {"coords": (number_of_nodes, 2), "connectivity": (number_of_elements, 2)}
+        values = {}
+        offset = cls._HEADER.size
+        for name in cls.__slots__[:6] + (cls.__slots__[6:] if is_solved else ()):
+            dtype = np.dtype("<i4" if name == "connectivity" else "<f8")
+            shape = shapes.get(name, (number_of_elements,) if name in ("elasticities", "areas", "element_forces", "element_stresses") else (2*number_of_nodes,))
+            count = int(np.prod(shape))
+            values[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape).copy()
+            offset += count*dtype.itemsize
+        arrays = cls(*(values[name] for name in cls.__slots__[:6]))
+        if is_solved:
+            arrays.set_results(*(values[name] for name in cls.__slots__[6:]))
+        return arrays
+
+# ---------------------------------------------------------------------------
+# Solvability.
+# ---------------------------------------------------------------------------
+
+# Result of check_solvability(). unrestrained_dofs holds (node label, "ux" or
+# "uy") pairs of the degrees of freedom that are not held by the structure.
+Solvability = collections.namedtuple("Solvability", ["is_solvable", "unrestrained_dofs"])
+
+# Detects if a truss model is solvable from a factorization of its sparse
+# reduced stiffness matrix, which is much cheaper than the SVD behind la.cond.
+#
+# A rigid and well supported truss has a symmetric positive definite reduced
+# stiffness matrix. When the truss is a mechanism (or is not supported enough)
+# some nodes can move without deforming any element, which are eigenvectors of
+# the matrix with zero, or round-off small, eigenvalues.
+#
+# Instead of the full SVD, the condition number is estimated like LAPACK does:
+# the largest eigenvalue comes from a few matrix products and the smallest ones
+# from a few solves with the factorization (inverse iteration), which converge
+# very fast precisely when the matrix is singular. Modes with an eigenvalue
+# below `tolerance` times the largest one are mechanisms, and the degrees of
+# freedom that take part in them are reported as unrestrained.
+#
+# The default tolerance rejects condition numbers above 1e12. The old check
+# accepted anything below 1/epsilon (about 4.5e15), which is so close to
+# round-off that singular trusses sometimes passed it.
+@_instrumented("check_solvability")
+def check_solvability(truss_model, tolerance=1e-12):
+    coords, connectivity, elasticities, areas, known, _ = _model_arrays(truss_model)
+    directions, stiffnesses, _ = _element_geometry(coords, connectivity, elasticities, areas)
+    stiffness = _assemble_stiffness(len(known), connectivity, directions, stiffnesses)
+    free = np.flatnonzero(np.isnan(known))
+    return _reduced_solvability(stiffness[free][:, free], free, tolerance)
+
+def _reduced_solvability(reduced_stiffness, free, tolerance, factorization=None):
+    size = reduced_stiffness.shape[0]
+    if size == 0:
+        return Solvability(True, [])
+
+    largest = _largest_eigenvalue(reduced_stiffness)
+    if largest <= 0:
+        return Solvability(False, [_dof_key(dof) for dof in free])
+
+    # A singular matrix can have exactly zero pivots, which SuperLU refuses. A
+    # round-off sized shift is enough to factorize it, and inverse iteration
+    # still converges to the same mechanisms.
+    if factorization is None:
+        try:
+            factorization = _Factorization(reduced_stiffness)
+        except la.LinAlgError:
+            shift = sys.float_info.epsilon * largest
+            factorization = _Factorization(reduced_stiffness + shift*sparse.identity(size, format="csr"))
+
+    values, modes = _smallest_eigenpairs(reduced_stiffness, factorization, count=min(4, size))
+    mechanisms = modes[:, values <= tolerance*largest]
+
+    # Degrees of freedom that move noticeably in any mechanism.
+    moving = np.zeros(size, dtype=bool)
+    for mode in mechanisms.T:
+        moving |= np.abs(mode) > 1e-2*np.abs(mode).max()
+    unrestrained_dofs = [_dof_key(dof) for dof in free[moving]]
+    return Solvability(len(unrestrained_dofs) == 0, unrestrained_dofs)
+
+# Converts a global degree of freedom index into a (node label, "ux"/"uy") pair.
+def _dof_key(dof):
+    return (int(dof)//2, ("ux", "uy")[int(dof) % 2])
+
+# Largest eigenvalue of a symmetric positive semi-definite matrix estimated by
+# power iteration. A rough value is enough to scale the tolerance.
+def _largest_eigenvalue(matrix, iterations=12):
+    vector = np.random.default_rng(0).random(matrix.shape[0])
+    value = 0.0
+    for _ in range(iterations):
+        product = matrix @ vector
+        norm = la.norm(product)
+        if norm == 0:
+            return 0.0
+        value = vector @ product / (vector @ vector)
+        vector = product / norm
+    return value
+
+# Smallest eigenpairs of a symmetric matrix by block inverse iteration with an
+# existing factorization, followed by a Rayleigh-Ritz step on the original
+# matrix. Eigenvalues are returned in ascending order.
+def _smallest_eigenpairs(matrix, factorization, count, iterations=4):
+    block = np.random.default_rng(0).random((matrix.shape[0], count)) - 0.5
+    for _ in range(iterations):
+        block = factorization.solve(block)
+        block, _ = la.qr(block)
+    values, vectors = la.eigh(block.T @ (matrix @ block))
+    return values, block @ vectors
+
+# ---------------------------------------------------------------------------
+# Combinatorial rigidity.
+# ---------------------------------------------------------------------------
+
+# Result of check_rigidity(). redundant_edges holds the indices of the edges
+# that could be removed without losing rigidity (statically indeterminate
+# members).
+Rigidity = collections.namedtuple("Rigidity", ["is_rigid", "redundant_edges"])
+
+# Decides if a truss is rigid and well supported from its topology alone with
+# the (2,3) pebble game of Jacobs and Hendrickson, without building any matrix.
+#
+# By Laman's theorem a planar bar framework in generic position is rigid when
+# it has 2V-3 independent bars, and the pebble game finds these bars in
+# O(V*E). Supports are handled by adding the ground as a rigid triangle of
+# three extra nodes: a fixed x displacement becomes a bar between the node and
+# the first ground node, a fixed y displacement a bar to the second one. The
+# truss is then solvable only if the whole framework, ground included, is
+# rigid.
+#
+# A truss that fails this check is always a mechanism. A truss that passes it
+# may still be singular because of its geometry (collinear or parallel bars),
+# so the numeric check is still needed for those.
+#
+# - number_of_nodes: nodes are numbered from 0 to number_of_nodes-1.
+# - edges: sequence of (node a, node b) pairs.
+# - constrained_dofs: global degrees of freedom with a fixed displacement,
+#   2*node for x and 2*node+1 for y.
+@_instrumented("check_rigidity")
+def check_rigidity(number_of_nodes, edges, constrained_dofs):
+    game = _PebbleGame(number_of_nodes + 3)
+    ground = (number_of_nodes, number_of_nodes + 1, number_of_nodes + 2)
+    for a, b in ((0, 1), (1, 2), (0, 2)):
+        game.add_edge(ground[a], ground[b])
+    for dof in constrained_dofs:
+        game.add_edge(int(dof)//2, ground[int(dof) % 2])
+
+    redundant_edges = [index for index, (a, b) in enumerate(edges) if not game.add_edge(int(a), int(b))]
+    is_rigid = game.independent_edges == 2*(number_of_nodes + 3) - 3
+    return Rigidity(bool(is_rigid), redundant_edges)
+
+# Same as check_rigidity() for the nodes, elements and constraints of a nusa
+# TrussModel.
+def check_model_rigidity(truss_model):
+    _, connectivity, _, _, known, _ = _model_arrays(truss_model)
+    return check_rigidity(len(known)//2, connectivity, np.flatnonzero(~np.isnan(known)))
+
+# Pebble game for (2,3)-sparse graphs. Every node starts with two pebbles and an
+# edge is independent only if four pebbles can be gathered on its endpoints.
+# Independent edges are kept oriented away from the node whose pebble covers
+# them, and pebbles are moved by reversing paths of these edges.
+class _PebbleGame:
+    def __init__(self, number_of_nodes):
+        self.pebbles = [2] * number_of_nodes
+        self.covered = [[] for _ in range(number_of_nodes)]
+        self.independent_edges = 0
+
+    # Adds an edge and returns True if it is independent from the ones added
+    # before. Redundant edges are not kept.
+    def add_edge(self, a, b):
+        if a == b:
+            return False
+        while self.pebbles[a] < 2 and self._gather_pebble(a, b):
+            pass
+        while self.pebbles[b] < 2 and self._gather_pebble(b, a):
+            pass
+        if self.pebbles[a] + self.pebbles[b] < 4:
+            return False
+
+        self.pebbles[a] -= 1
+        self.covered[a].append(b)
+        self.independent_edges += 1
+        return True
+
+    # Looks for a free pebble reachable from root without passing through
+    # blocked and brings it to root by reversing the path to it.
+    def _gather_pebble(self, root, blocked):
+        parents = {root: None, blocked: None}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for neighbour in self.covered[node]:
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = node
+                if self.pebbles[neighbour] > 0:
+                    self.pebbles[neighbour] -= 1
+                    self.pebbles[root] += 1
+                    while neighbour != root:
+                        parent = parents[neighbour]
+                        self.covered[parent].remove(neighbour)
+                        self.covered[neighbour].append(parent)
+                        neighbour = parent
+                    return True
+                stack.append(neighbour)
+        return False
+
+# ---------------------------------------------------------------------------
+# Solve cache.
+#
+# The evolution keeps unchanged copies of the best individuals and sorts the
+# population by fitness every generation, so the same truss is often solved
+# many times. Results of solve_model() and maximum_load() are kept in a least
+# recently used cache, keyed by a hash of everything that defines the truss.
+# ---------------------------------------------------------------------------
+
+# Coordinates closer than this are considered equal by the cache key, so tiny
+# round-off differences between copies of a truss don't cause cache misses.
+SOLVE_CACHE_COORDINATE_QUANTUM = 1e-9
+
+# Counters and size of the solve cache, returned by solve_cache_info().
+SolveCacheInfo = collections.namedtuple("SolveCacheInfo", ["hits", "misses", "entries", "bytes", "max_bytes"])
+
+# Least recently used cache of solve results with a memory limit. Entries are
+# tuples of arrays and their size is what counts towards max_bytes, unless
+# another `sizeof` function is given. Hits and misses are counted by the
+# instrumentation under `name`.
+class _SolveCache:
+    def __init__(self, max_bytes, name="solve_cache", sizeof=None):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.sizeof = sizeof or _entry_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            _count(self.name + ".misses")
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        _count(self.name + ".hits")
+        return entry
+
+    def put(self, key, entry):
+        size = self.sizeof(entry)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= self.sizeof(entry)
+
+def _entry_bytes(entry):
+    return sum(np.asarray(values).nbytes for values in entry)
+
+_solve_cache = _SolveCache(max_bytes=64*1024**2)
+
+# Gets the hit and miss counters and the memory used by the solve cache.
+def solve_cache_info():
+    return SolveCacheInfo(_solve_cache.hits, _solve_cache.misses, len(_solve_cache.entries), _solve_cache.bytes, _solve_cache.max_bytes)
+
+# Removes all cached results and resets the counters. If max_bytes is given it
+# becomes the new memory limit of the cache. The factorizations kept by
+# check_and_solve() are removed too.
+def clear_solve_cache(max_bytes=None):
+    _solve_cache.clear()
+    _factorization_cache.clear()
+    if max_bytes is not None:
+        _solve_cache.max_bytes = max_bytes
+
+# Canonical hash of a truss. Nodes are sorted by their quantized coordinates
+# and elements by their sorted canonical node indices, so the key doesn't
+# depend on labels or on the order nodes and elements were added. Arrays in
+# `extra` with one value per degree of freedom are permuted like the forces,
+# other values are hashed as they are.
+#
+# Returns the key and the degrees of freedom in canonical order, used to store
+# results independently of the labels with _from_canonical().
+def _truss_key(coords, connectivity, elasticities, areas, known, forces, *extra):
+    quantized = np.round(coords / SOLVE_CACHE_COORDINATE_QUANTUM).astype(np.int64)
+    order = np.lexsort((quantized[:,1], quantized[:,0]))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    elements = np.sort(rank[connectivity], axis=1)
+    element_order = np.lexsort((areas, elasticities, elements[:,1], elements[:,0]))
+    dofs = np.column_stack((2*order, 2*order + 1)).ravel()
+
+    values = [quantized[order], elements[element_order], elasticities[element_order], areas[element_order], known[dofs], forces[dofs]]
+    for value in extra:
+        value = np.asarray(value, dtype=float)
+        values.append(value[dofs] if value.shape == forces.shape else value)
+
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        value = np.ascontiguousarray(value)
+        digest.update(np.array(value.shape, dtype=np.int64).tobytes())
+        digest.update(value.tobytes())
+    return digest.digest(), dofs
+
+# Puts values stored in canonical degree of freedom order back in label order.
+def _from_canonical(values, dofs):
+    result = np.empty_like(values)
+    result[dofs] = values
+    return result
+
+# ---------------------------------------------------------------------------
+# Fused check and solve.
+#
+# The evolution checks every mutated truss with isModelSolvable() and then
+# solves the accepted ones again to get their fitness, with different forces.
+# check_and_solve() assembles and factorizes the stiffness matrix once, uses
+# the factorization both for the solvability check and for the solution, and
+# keeps it, so solving the same structure later with other forces (see
+# solve_model() and maximum_load()) costs only a back substitution.
+# ---------------------------------------------------------------------------
+
+# Result of check_and_solve(). status is "solved", "mechanism" when the truss
+# is rejected by check_rigidity() from its topology and supports alone, or
+# "singular" when the numeric check rejects it. unrestrained_dofs holds the
+# (node label, "ux"/"uy") pairs found by the numeric check, like in
+# Solvability. displacements (one per degree of freedom) and element_stresses
+# (one per element) are None unless the truss was solved.
+CheckedSolve = collections.namedtuple("CheckedSolve", ["status", "unrestrained_dofs", "displacements", "element_stresses"])
+
+# Factorizations of trusses accepted by check_and_solve(), keyed by
+# _structure_key(). Entries are (factorization, tolerance) pairs, with the
+# tolerance the truss was accepted with.
+_factorization_cache = _SolveCache(max_bytes=64*1024**2, name="factorization_cache", sizeof=lambda entry: entry[0].nbytes)
+
+# Checks if a truss model is solvable and, if it is, solves it with the same
+# factorization, writing the results into the model like solve_model() does.
+# The check is the same as isModelSolvable(): check_model_rigidity() and then
+# check_solvability() with `tolerance`.
+@_instrumented("check_and_solve")
+def check_and_solve(truss_model, tolerance=1e-12, use_cache=True):
+    coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+    if not check_rigidity(len(coords), connectivity, np.flatnonzero(~np.isnan(known))).is_rigid:
+        _count("solvability.rejected")
+        _count("solvability.rigidity_rejected")
+        return CheckedSolve("mechanism", [], None, None)
+
+    structure_key = _structure_key(coords, connectivity, elasticities, areas, known)
+    entry = _factorization_cache.get(structure_key) if use_cache else None
+    factorization = entry[0] if entry is not None else None
+    try:
+        system = _LoadCasesSystem(coords, connectivity, elasticities, areas, known, factorization)
+    except la.LinAlgError:
+        system = None
+
+    # A cached factorization was already accepted, unless with a looser tolerance.
+    if entry is None or entry[1] < tolerance:
+        if system is None:
+            directions, stiffnesses, _ = _element_geometry(coords, connectivity, elasticities, areas)
+            stiffness = _assemble_stiffness(len(known), connectivity, directions, stiffnesses)
+            free = np.flatnonzero(np.isnan(known))
+            solvability = _reduced_solvability(stiffness[free][:, free], free, tolerance)
+            _count("solvability.rejected")
+            return CheckedSolve("singular", solvability.unrestrained_dofs, None, None)
+        solvability = _reduced_solvability(system.stiffness[system.free][:, system.free], system.free, tolerance, system.factorization)
+        if not solvability.is_solvable:
+            _count("solvability.rejected")
+            return CheckedSolve("singular", solvability.unrestrained_dofs, None, None)
+        if use_cache and system.factorization is not None:
+            _factorization_cache.put(structure_key, (system.factorization, tolerance))
+    _count("solvability.accepted")
+
+    displacements = system.solve(forces[:,None], known[:,None])[:,0]
+    nodal_forces = system.stiffness @ displacements
+    if use_cache:
+        key, dofs = _truss_key(coords, connectivity, elasticities, areas, known, forces)
+        _solve_cache.put(key, (displacements[dofs], nodal_forces[dofs]))
+    _write_results(truss_model, displacements, nodal_forces, connectivity, system.directions, system.stiffnesses, areas, system.free)
+    return CheckedSolve("solved", [], displacements, truss_model.element_stresses)
+
+# Factorization kept by check_and_solve() for a truss, or None if the truss
+# wasn't accepted by it.
+def _checked_factorization(coords, connectivity, elasticities, areas, known):
+    entry = _factorization_cache.get(_structure_key(coords, connectivity, elasticities, areas, known))
+    return entry[0] if entry is not None else None
+
+# Hash of everything that defines the stiffness matrix of a truss, with nodes
+# and elements in their given order, since a factorization depends on it.
+def _structure_key(coords, connectivity, elasticities, areas, known):
+    digest = hashlib.blake2b(digest_size=16)
+    for value in (coords, connectivity, elasticities, areas, known):
+        value = np.ascontiguousarray(value)
+        digest.update(np.array(value.shape, dtype=np.int64).tobytes())
+        digest.update(value.tobytes())
+    return digest.digest()
+
+# ---------------------------------------------------------------------------
+# Iterative solver.
+#
+# Mutated and crossed over trusses are almost the same as their parents, and so
+# are their displacements. solve_model_iterative() solves the reduced stiffness
+# system with the preconditioned conjugate gradient method, starting from given
+# displacements, like the ones of the parent mapped onto the child's nodes, so
+# a child close to its parent converges in a few iterations and no matrix is
+# factorized (except for an incomplete one with preconditioner="ilu").
+# ---------------------------------------------------------------------------
+
+# Result of solve_model_iterative(). iterations is the number of conjugate
+# gradient iterations, stress_change the largest element stress change of the
+# last one and converged is False if max_iterations was reached first.
+IterativeSolve = collections.namedtuple("IterativeSolve", ["iterations", "converged", "stress_change"])
+
+# Solves a truss model with the preconditioned conjugate gradient method and
+# writes the results into the model like solve_model() does.
+#
+# - initial_displacements: one value per degree of freedom to start from, in
+#   the order of the node labels. Known displacements and nan values are
+#   ignored (nan starts from zero). None starts from zero displacements.
+# - preconditioner: "ilu", an incomplete factorization L*D*L^T of the
+#   stiffness matrix, or "jacobi", its diagonal. The diagonal costs nothing to
+#   build, but long trusses are badly conditioned and need far more iterations
+#   with it.
+# - tol: the iterations stop once they change no element stress by more than
+#   tol times the largest absolute stress, or once the residual forces are
+#   round-off.
+# - max_iterations: defaults to twice the number of unknown displacements.
+#
+# Raises la.LinAlgError, like solve_model(), when the stiffness matrix is found
+# to be singular.
+@_instrumented("solve_model_iterative")
+def solve_model_iterative(truss_model, initial_displacements=None, preconditioner="ilu", tol=1e-6, max_iterations=None):
+    coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+    directions, stiffnesses, lengths = _element_geometry(coords, connectivity, elasticities, areas)
+    stiffness = _assemble_stiffness(len(known), connectivity, directions, stiffnesses)
+    free = np.flatnonzero(np.isnan(known))
+    displacements = np.where(np.isnan(known), 0.0, known)
+    if initial_displacements is not None:
+        initial = np.asarray(initial_displacements, dtype=float)[free]
+        displacements[free] = np.where(np.isnan(initial), 0.0, initial)
+
+    # Element stresses are (E/L)*b.u, so the stress changes of an iteration
+    # are a sparse matrix times its displacement step.
+    dofs = _element_dofs(connectivity)
+    stress_matrix = sparse.csr_matrix(
+        (((elasticities/lengths)[:, None]*directions).ravel(), (np.repeat(np.arange(len(connectivity)), 4), dofs.ravel())),
+        shape=(len(connectivity), len(known))
+    )
+    stresses = stress_matrix @ displacements
+
+    iterations, stress_change, converged = 0, 0.0, True
+    if len(free) > 0:
+        reduced = stiffness[free][:, free].tocsr()
+        free_stress_matrix = stress_matrix[:, free].tocsr()
+        precondition = _preconditioner(reduced, preconditioner)
+        x = displacements[free]
+        residual = forces[free] - stiffness[free] @ displacements
+        round_off = 1e-14*np.linalg.norm(forces[free] - stiffness[free] @ np.where(np.isnan(known), 0.0, known))
+        if max_iterations is None:
+            max_iterations = 2*len(free)
+
+        converged = np.linalg.norm(residual) <= round_off
+        if not converged:
+            z = precondition(residual)
+            direction = z.copy()
+            product = residual @ z
+        while not converged and iterations < max_iterations:
+            stiffness_direction = reduced @ direction
+            curvature = direction @ stiffness_direction
+            if not curvature > 0:
+                # Same error la.solve raises for a singular matrix.
+                raise la.LinAlgError("Singular matrix")
+            step = product/curvature
+            x += step*direction
+            residual -= step*stiffness_direction
+            stress_step = step*(free_stress_matrix @ direction)
+            stresses += stress_step
+            iterations += 1
+
+            stress_change = float(np.abs(stress_step).max(initial=0.0))
+            converged = stress_change <= tol*np.abs(stresses).max(initial=0.0) or np.linalg.norm(residual) <= round_off
+            if not converged:
+                z = precondition(residual)
+                next_product = residual @ z
+                direction = z + (next_product/product)*direction
+                product = next_product
+        displacements[free] = x
+
+    _record_size("solve_model_iterative.iterations", iterations)
+    if not converged:
+        _count("solve_model_iterative.unconverged")
+    nodal_forces = stiffness @ displacements
+    _write_results(truss_model, displacements, nodal_forces, connectivity, directions, stiffnesses, areas, free)
+    # Python types, since Swift can't convert numpy.bool_ and numpy integers.
+    return IterativeSolve(int(iterations), bool(converged), float(stress_change))
+
+# Function that applies a preconditioner of a symmetric positive definite
+# matrix to a vector. The conjugate gradient method needs the preconditioner to
+# be symmetric positive definite too, so "ilu" isn't the L*U of spilu, whose
+# column ordering and dropped entries make it non symmetric: the matrix is
+# factorized with a symmetric minimum degree ordering and no pivoting, and only
+# L and the diagonal D of U are kept, as M = P^T*L*|D|*L^T*P. Dropped entries
+# can make a pivot of D negative, so its absolute value keeps M positive.
+def _preconditioner(matrix, kind):
+    if kind == "jacobi":
+        diagonal = matrix.diagonal()
+        if not np.all(diagonal > 0):
+            raise la.LinAlgError("Singular matrix")
+        return lambda vector: vector/diagonal
+    if kind == "ilu":
+        try:
+            factorization = sparse_la.spilu(
+                matrix.tocsc(), drop_tol=1e-4, fill_factor=10, diag_pivot_thresh=0,
+                permc_spec="MMD_AT_PLUS_A", options=dict(SymmetricMode=True)
+            )
+        except RuntimeError:
+            raise la.LinAlgError("Singular matrix")
+        # Without pivoting, rows are permuted like the columns.
+        order = np.argsort(factorization.perm_c)
+        lower = factorization.L.tocsr()
+        upper = lower.T.tocsr()
+        pivots = np.abs(factorization.U.diagonal())
+        if not np.all(pivots > 0):
+            raise la.LinAlgError("Singular matrix")
+
+        def precondition(vector):
+            solution = sparse_la.spsolve_triangular(lower, vector[order], lower=True, unit_diagonal=True)
+            solution = sparse_la.spsolve_triangular(upper, solution/pivots, lower=False, unit_diagonal=True)
+            result = np.empty_like(solution)
+            result[order] = solution
+            return result
+        return precondition
+    raise ValueError("Unknown preconditioner {!r}".format(kind))
+
+# ---------------------------------------------------------------------------
+# Sizing.
+#
+# For a fixed topology, the lightest truss that respects a stress limit is
+# found much faster by resizing the members than by mutating their areas at
+# random: fully_stressed_design() repeats the classic fully stressed design
+# update A <- A*|σ|/σ_limit, with every member resized at once and the truss
+# solved again with the sparse solver, until the areas stop changing.
+# ---------------------------------------------------------------------------
+
+# Result of fully_stressed_design(). areas are the element areas of the last
+# solve, stresses their element stresses and mass the material mass of the
+# truss with them. converged is False if max_iterations was reached first.
+FullyStressedDesign = collections.namedtuple("FullyStressedDesign", ["areas", "mass", "iterations", "converged", "stresses", "max_stress"])
+
+# Sizes the elements of a truss model for a stress limit.
+#
+# - stress_limit: maximum absolute stress of any element.
+# - area_bounds: (minimum, maximum) area of an element. The minimum must be
+#   positive, so elements without stress keep a stiffness.
+# - tol: largest relative area change of an iteration for the areas to be
+#   considered converged.
+# - density: material density, used for the mass.
+# - weight_factor: if not zero, the self weight of the elements is part of the
+#   model forces, with density*weight_factor per unit of volume (gravity times
+#   any weight multiplier) split between the two nodes of each element, like
+#   Gene.addWeightForces() does. The weight is then updated with the areas.
+# - max_iterations: maximum number of solves, at least 1.
+#
+# With a stress limit below the minimum area stresses, or above the maximum
+# area stresses, the areas stay at the bound. The model itself isn't changed.
+@_instrumented("fully_stressed_design")
+def fully_stressed_design(truss_model, stress_limit, area_bounds, tol=1e-3, density=7850.0, weight_factor=0.0, max_iterations=100):
+    if max_iterations < 1:
+        raise ValueError("max_iterations must be at least 1")
+    coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+    minimum_area, maximum_area = area_bounds
+    _, _, lengths = _element_geometry(coords, connectivity, elasticities, areas)
+    dofs = _element_dofs(connectivity)
+
+    # Nodal weight forces (y only) of all elements for the given areas.
+    def weight_forces(element_areas):
+        halves = np.repeat(element_areas*lengths*density*weight_factor/2, 2)
+        return -np.bincount(dofs[:, 1::2].ravel(), weights=halves, minlength=len(forces))
+
+    base_forces = forces - weight_forces(areas) if weight_factor else forces
+    areas = np.clip(areas, minimum_area, maximum_area)
+    for iteration in range(1, max_iterations + 1):
+        loads = base_forces + weight_forces(areas) if weight_factor else forces
+        system = _LoadCasesSystem(coords, connectivity, elasticities, areas, known)
+        displacements = system.solve(loads[:, None], known[:, None])
+        stresses = system.element_stresses(displacements)[:, 0]
+
+        resized = np.clip(areas*np.abs(stresses)/stress_limit, minimum_area, maximum_area)
+        change = np.max(np.abs(resized - areas)/areas, initial=0.0)
+        _count("fully_stressed_design.iterations")
+        # The areas are only resized if they will be solved again, so the
+        # result pairs them with their own stresses.
+        if change <= tol or iteration == max_iterations:
+            break
+        areas = resized
+
+    mass = float(density*np.dot(areas, lengths))
+    max_stress = float(np.abs(stresses).max(initial=0.0))
+    return FullyStressedDesign(areas, mass, iteration, bool(change <= tol), stresses, max_stress)
+
+# ---------------------------------------------------------------------------
+# Sensitivities.
+#
+# Gradients of a stress measure with respect to every node coordinate and
+# element area, so mutations can move nodes and change areas where the fitness
+# improves instead of at random. With the adjoint method they cost one extra
+# solve with the factorization of the truss: for a measure J(u) of the
+# displacements of K*u = f,
+#
+#     K*λ = dJ/du,    dJ/dp = ∂J/∂p - λ^T*(dK/dp)*u
+#
+# for every coordinate or area p. The forces are taken as constant, so the self
+# weight of the elements isn't differentiated.
+# ---------------------------------------------------------------------------
+
+# Result of stress_sensitivities(). value is the measure, coordinates has the
+# gradient (d/dx, d/dy) of each node, in the order of the node labels, and
+# areas the gradient of each element area. For measure="mass", constraint is
+# max|σ|/stress_limit - 1 (positive when the stress limit is exceeded) and
+# constraint_coordinates and constraint_areas are its gradients. They are None
+# for the other measures.
+StressSensitivities = collections.namedtuple("StressSensitivities", ["value", "coordinates", "areas", "constraint", "constraint_coordinates", "constraint_areas"])
+
+# Gradients of a stress measure of a truss model, for its model forces.
+#
+# - measure: "max" for the maximum absolute stress, "top_mean" for the mean of
+#   the top_count largest absolute stresses (like stress_summary()) or "mass"
+#   for the material mass, with the maximum stress over stress_limit as its
+#   constraint.
+# - density: material density, for measure="mass".
+#
+# The maximum and the top stresses aren't smooth where the order of the
+# stresses changes, so their gradients only hold for small changes. Fixed
+# nodes get gradients too; callers decide which coordinates can move. The
+# factorization kept by check_and_solve() is used if there is one.
+@_instrumented("stress_sensitivities")
+def stress_sensitivities(truss_model, measure="top_mean", top_count=3, stress_limit=None, density=7850.0):
+    if measure not in ("max", "top_mean", "mass"):
+        raise ValueError("Unknown measure {!r}".format(measure))
+    if measure == "mass" and stress_limit is None:
+        raise ValueError("measure='mass' needs a stress_limit")
+
+    coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+    factorization = _checked_factorization(coords, connectivity, elasticities, areas, known)
+    system = _LoadCasesSystem(coords, connectivity, elasticities, areas, known, factorization)
+    displacements = system.solve(forces[:, None], known[:, None])[:, 0]
+    stresses = system.element_stresses(displacements[:, None])[:, 0]
+
+    if measure != "mass":
+        weights = _stress_weights(stresses, measure, top_count)
+        coordinate_gradients, area_gradients = _stress_gradients(system, len(coords), elasticities, displacements, weights)
+        return StressSensitivities(float(weights @ stresses), coordinate_gradients, area_gradients, None, None, None)
+
+    # Mass is density*sum(A*L), with dL/d(node j) = n = -dL/d(node i).
+    mass = float(density*np.dot(areas, system.lengths))
+    mass_coordinates = _node_gradients(connectivity, (density*areas)[:, None]*system.directions[:, 2:], len(coords))
+    weights = _stress_weights(stresses, "max", 1)/stress_limit
+    constraint_coordinates, constraint_areas = _stress_gradients(system, len(coords), elasticities, displacements, weights)
+    constraint = float(weights @ stresses) - 1.0
+    return StressSensitivities(mass, mass_coordinates, density*system.lengths, constraint, constraint_coordinates, constraint_areas)
+
+# Weights w of the element stresses such that the measure is w.σ: the sign of
+# the stress for the largest absolute stress ("max"), or the sign over the
+# count for each of the top_count largest ones ("top_mean").
+def _stress_weights(stresses, measure, top_count):
+    weights = np.zeros(len(stresses))
+    if len(stresses) == 0:
+        return weights
+    magnitudes = np.abs(stresses)
+    count = 1 if measure == "max" else max(1, min(int(top_count), len(stresses)))
+    top = np.argpartition(magnitudes, len(magnitudes) - count)[-count:]
+    weights[top] = np.sign(stresses[top])/count
+    return weights
+
+# Adjoint gradients of J = w.σ with respect to the node coordinates and the
+# element areas. With n the unit vector of an element, δ = u_j - u_i, L its
+# length and k = EA/L, its stress is σ = (E/L)*n.δ and λ^T*K_e*u is
+# k*(n.Δλ)*(n.δ). Their derivatives with respect to the element vector
+# d = x_j - x_i are
+#
+#     dσ/dd = (E/L²)*(δ - 2*n*(n.δ))
+#     d(λ^T*K_e*u)/dd = (EA/L²)*((n.δ)*Δλ + (n.Δλ)*δ - 3*n*(n.Δλ)*(n.δ))
+#
+# and σ doesn't depend on A, while d(λ^T*K_e*u)/dA = (E/L)*(n.Δλ)*(n.δ).
+# Known displacements don't change with the coordinates, so λ is zero there.
+def _stress_gradients(system, number_of_nodes, elasticities, displacements, weights):
+    dofs = _element_dofs(system.connectivity)
+    moduli = elasticities/system.lengths
+    rhs = np.bincount(dofs.ravel(), weights=((weights*moduli)[:, None]*system.directions).ravel(), minlength=len(displacements))
+    adjoint = np.zeros(len(displacements))
+    if system.factorization is not None:
+        adjoint[system.free] = system.factorization.solve(rhs[system.free])
+    _count("stress_sensitivities.adjoint_solves")
+
+    normals = system.directions[:, 2:]
+    element_displacements = displacements[dofs]
+    element_adjoints = adjoint[dofs]
+    delta = element_displacements[:, 2:] - element_displacements[:, :2]
+    adjoint_delta = element_adjoints[:, 2:] - element_adjoints[:, :2]
+    stretch = np.einsum("ij,ij->i", normals, delta)
+    adjoint_stretch = np.einsum("ij,ij->i", normals, adjoint_delta)
+
+    area_gradients = -moduli*adjoint_stretch*stretch
+    explicit = (weights*moduli/system.lengths)[:, None]*(delta - 2*normals*stretch[:, None])
+    implicit = (moduli*system.areas/system.lengths)[:, None]*(
+        stretch[:, None]*adjoint_delta + adjoint_stretch[:, None]*delta - 3*normals*(stretch*adjoint_stretch)[:, None]
+    )
+    return _node_gradients(system.connectivity, explicit - implicit, number_of_nodes), area_gradients
+
+# Adds gradients with respect to the element vectors x_j - x_i to the nodes
+# of the elements: + to node j and - to node i.
+def _node_gradients(connectivity, element_gradients, number_of_nodes):
+    gradients = np.zeros((number_of_nodes, 2))
+    np.add.at(gradients, connectivity[:, 1], element_gradients)
+    np.add.at(gradients, connectivity[:, 0], -element_gradients)
+    return gradients
+
+# ---------------------------------------------------------------------------
+# Incremental updates.
+#
+# Adding or removing an element, or changing its area, changes the stiffness
+# matrix K by a rank one term k*b*b^T, and moving a node changes it by two such
+# terms for each of its elements. With the Sherman-Morrison-Woodbury formula
+#
+#     (K + U*C*U^T)^-1 = K^-1 - K^-1*U*(C^-1 + U^T*K^-1*U)^-1*U^T*K^-1
+#
+# these changes are solved with the factorization of the original K and a
+# small dense "capacitance" matrix S = C^-1 + U^T*K^-1*U, instead of a new
+# factorization.
+# ---------------------------------------------------------------------------
+
+# A truss that keeps the factorization of its reduced stiffness matrix, so its
+# elements, areas and node positions can be changed and the solvability and
+# stresses of the changed truss are known without factorizing it again.
+#
+# Supports are degrees of freedom with zero displacement, like the ones of the
+# bridges and towers. Element indices never change: removed elements keep
+# their index (with zero stress) and added ones are appended.
+#
+# Each update adds columns to the capacitance matrix, which loses accuracy and
+# gets slower to use as it grows, so the stiffness matrix is factorized again
+# after max_updates columns. tolerance has the same meaning as in
+# check_solvability().
+class SolvedTruss:
+    def __init__(self, coords, connectivity, elasticities, areas, fixed_dofs, forces, tolerance=1e-12, max_updates=32):
+        self.coords = np.array(coords, dtype=float).reshape(-1, 2)
+        self.connectivity = np.array(connectivity, dtype=np.int64).reshape(-1, 2)
+        # A single elasticity or area applies to every element, like in
+        # TrussArrays.
+        self.elasticities = np.array(np.broadcast_to(np.asarray(elasticities, dtype=float), len(self.connectivity)))
+        self.areas = np.array(np.broadcast_to(np.asarray(areas, dtype=float), len(self.connectivity)))
+        self.active = np.ones(len(self.areas), dtype=bool)
+        self.forces = np.array(forces, dtype=float).reshape(-1)
+        self.tolerance = tolerance
+        self.max_updates = max_updates
+
+        fixed = np.zeros(2*len(self.coords), dtype=bool)
+        fixed[np.asarray(fixed_dofs, dtype=np.int64).reshape(-1)] = True
+        self.free = np.flatnonzero(~fixed)
+        self._reduced_dofs = np.full(len(fixed), -1)
+        self._reduced_dofs[self.free] = np.arange(len(self.free))
+        self.refactorize()
+
+    # Creates a solved truss from the arrays of a nusa TrussModel.
+    @classmethod
+    def from_model(cls, truss_model, **options):
+        coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+        return cls(coords, connectivity, elasticities, areas, np.flatnonzero(~np.isnan(known)), forces, **options)
+
+    # Assembles and factorizes the stiffness matrix of the current truss and
+    # forgets all pending updates.
+    def refactorize(self):
+        directions, stiffnesses, _ = _element_geometry(self.coords, self.connectivity, self.elasticities, self.areas)
+        stiffness = _assemble_stiffness(len(self._reduced_dofs), self.connectivity, directions, stiffnesses*self.active)
+        reduced_stiffness = stiffness[self.free][:, self.free]
+
+        self._columns = []
+        self._solved_columns = []
+        self._inverse_weights = []
+        self.refactorizations = getattr(self, "refactorizations", -1) + 1
+
+        # The condition number of the factorized matrix is kept to judge the
+        # solvability of the updated ones, see is_solvable.
+        self.factorization = None
+        self._condition = np.inf
+        if len(self.free) == 0:
+            self._condition = 1.0
+            return
+        largest = _largest_eigenvalue(reduced_stiffness)
+        try:
+            self.factorization = _Factorization(reduced_stiffness)
+        except la.LinAlgError:
+            return
+        smallest = _smallest_eigenpairs(reduced_stiffness, self.factorization, count=1)[0][0]
+        if smallest > self.tolerance*largest:
+            self._condition = largest/smallest
+        else:
+            self.factorization = None
+
+    # The updated truss is singular when the capacitance matrix is. Removing
+    # stiffness divides the condition number of the factorized matrix by about
+    # the smallest eigenvalue of the capacitance matrix, once it's scaled to a
+    # unit diagonal for C^-1, so that's compared with the tolerance.
+    @property
+    def is_solvable(self):
+        return self._is_solvable_with(self._columns, self._solved_columns, self._inverse_weights)
+
+    def _is_solvable_with(self, columns, solved_columns, inverse_weights):
+        if self.factorization is None:
+            return len(self.free) == 0
+        if len(columns) == 0:
+            return True
+        scale = 1/np.sqrt(np.abs(inverse_weights))
+        capacitance = self._capacitance(columns, solved_columns, inverse_weights) * np.outer(scale, scale)
+        smallest = np.abs(la.eigvalsh(capacitance)).min()
+        # A Python bool, since Swift can't convert a numpy.bool_.
+        return bool(smallest > self.tolerance*self._condition)
+
+    def _capacitance(self, columns, solved_columns, inverse_weights):
+        return np.diag(inverse_weights) + np.column_stack(columns).T @ np.column_stack(solved_columns)
+
+    # Displacements of all degrees of freedom of the current truss.
+    @property
+    def displacements(self):
+        displacements = np.zeros(len(self._reduced_dofs))
+        if self.factorization is not None and len(self.free) > 0:
+            displacements[self.free] = self._solve(self.forces[self.free])
+        return displacements
+
+    # Forces and stresses of all elements, zero for the removed ones.
+    @property
+    def element_forces(self):
+        directions, stiffnesses, _ = _element_geometry(self.coords, self.connectivity, self.elasticities, self.areas)
+        element_displacements = self.displacements[_element_dofs(self.connectivity)]
+        return self.active * stiffnesses * np.einsum("ij,ij->i", directions, element_displacements)
+
+    @property
+    def element_stresses(self):
+        return self.element_forces / self.areas
+
+    # Same as stress_summary() for the elements that were not removed.
+    def stress_summary(self, top_count=3):
+        return _summarize_stresses(self.element_stresses[self.active], top_count)
+
+    def _solve(self, rhs):
+        solution = self.factorization.solve(rhs)
+        if len(self._columns) > 0:
+            columns = np.column_stack(self._columns)
+            capacitance = self._capacitance(self._columns, self._solved_columns, self._inverse_weights)
+            solution -= np.column_stack(self._solved_columns) @ la.solve(capacitance, columns.T @ solution)
+        return solution
+
+    def set_forces(self, forces):
+        self.forces = np.array(forces, dtype=float).reshape(-1)
+
+    # Adds an element between two nodes and returns its index.
+    def add_edge(self, node_a, node_b, elasticity, area):
+        self.connectivity = np.vstack((self.connectivity, [node_a, node_b]))
+        self.elasticities = np.append(self.elasticities, elasticity)
+        self.areas = np.append(self.areas, area)
+        self.active = np.append(self.active, True)
+        index = len(self.areas) - 1
+        self._update([self._element_term(index)])
+        return index
+
+    def remove_edge(self, index):
+        if not self.active[index]:
+            return
+        column, stiffness = self._element_term(index)
+        self.active[index] = False
+        self._update([(column, -stiffness)])
+
+    def set_area(self, index, area):
+        column, old_stiffness = self._element_term(index)
+        self.areas[index] = area
+        if self.active[index]:
+            self._update([(column, self._element_term(index)[1] - old_stiffness)])
+
+    # Moves a node to a new position. Every element of the node is replaced by
+    # one with the new direction and length.
+    def move_node(self, node, position):
+        elements = np.flatnonzero(self.active & np.any(self.connectivity == node, axis=1))
+        old_terms = [self._element_term(index) for index in elements]
+        self.coords[node] = position
+        new_terms = [self._element_term(index) for index in elements]
+        self._update([(column, -stiffness) for column, stiffness in old_terms] + new_terms)
+
+    # Checks if the truss would still be solvable without an element, without
+    # removing it.
+    @_instrumented("SolvedTruss.is_solvable_without_edge")
+    def is_solvable_without_edge(self, index):
+        if not self.active[index] or self.factorization is None:
+            return self.is_solvable
+        column, stiffness = self._element_term(index)
+        return self._is_solvable_with(
+            self._columns + [column],
+            self._solved_columns + [self.factorization.solve(column)],
+            self._inverse_weights + [-1/stiffness]
+        )
+
+    # Direction vector of an element in the reduced degrees of freedom and its
+    # axial stiffness, so its stiffness matrix is stiffness*column*column^T.
+    def _element_term(self, index):
+        directions, stiffnesses, _ = _element_geometry(self.coords, self.connectivity[index:index+1], self.elasticities[index:index+1], self.areas[index:index+1])
+        dofs = self._reduced_dofs[_element_dofs(self.connectivity[index:index+1])[0]]
+        column = np.zeros(len(self.free))
+        column[dofs[dofs >= 0]] = directions[0][dofs >= 0]
+        return column, stiffnesses[0]
+
+    def _update(self, terms):
+        terms = [(column, stiffness) for column, stiffness in terms if stiffness != 0 and column.any()]
+        if self.factorization is None or len(self._columns) + len(terms) > self.max_updates:
+            _count("solved_truss.refactorizations")
+            self.refactorize()
+            return
+        _count("solved_truss.low_rank_updates", len(terms))
+        for column, stiffness in terms:
+            self._columns.append(column)
+            self._solved_columns.append(self.factorization.solve(column))
+            self._inverse_weights.append(1/stiffness)
+
+# ---------------------------------------------------------------------------
+# Batch evaluation.
+#
+# Fitness evaluation of a population is embarrassingly parallel, so whole
+# populations can be evaluated by a pool of worker processes. The trusses are
+# packed into shared memory blocks that the workers read directly, and the
+# workers write their results into another shared block, so nothing but small
+# task descriptions is pickled.
+# ---------------------------------------------------------------------------
+
+# Number of results of each truss for the objectives of evaluate_batch(), except
+# "stresses", which has one result per element.
+_BATCH_RESULT_SIZES = {"stress_summary": 3, "maximum_load": 2}
+
+# Evaluates many trusses at once with a persistent pool of processes.
+#
+# - trusses: sequence of (coords, connectivity, E, A, fixed_dofs, nodal_forces)
+#   tuples, the same arguments build_model_from_arrays() takes.
+# - objective: what is computed for each truss:
+#   * "stresses": array of element stresses.
+#   * "stress_summary": max, mean and top mean absolute stress, as in
+#     stress_summary(). params["top_count"] defaults to 3.
+#   * "maximum_load": load multiplier and max absolute stress at that load, as
+#     in maximum_load(). params["unit_forces"] holds one unit load vector per
+#     truss and params["stress_limit"] the stress limit.
+# - params: dictionary with the objective parameters. params["tolerance"] is
+#   the solvability tolerance, see check_solvability().
+# - processes: number of worker processes. Defaults to the number of cores,
+#   and 1 evaluates the trusses in this process.
+#
+# Results are returned in the order of the trusses: a list of arrays for
+# "stresses" and an array with one row per truss otherwise. Unsolvable trusses
+# get nan results.
+@_instrumented("evaluate_batch")
+def evaluate_batch(trusses, objective="stress_summary", params=None, processes=None):
+    if objective != "stresses" and objective not in _BATCH_RESULT_SIZES:
+        raise ValueError("Unknown objective: " + str(objective))
+    params = dict(params or {})
+    processes = processes or os.cpu_count() or 1
+    header, floats, integers = _pack_trusses(trusses, objective, params)
+    number_of_results = int(header[-1, 5] + _batch_result_size(header[-1], objective)) if len(header) > 0 else 0
+
+    if processes == 1 or len(header) < 2:
+        results = np.full(number_of_results, np.nan)
+        _evaluate_packed(header, floats, integers, results, objective, params, 0, len(header))
+    else:
+        results = _evaluate_in_pool(header, floats, integers, number_of_results, objective, params, processes)
+
+    if objective == "stresses":
+        return [results[row[5]:row[5] + row[1]] for row in header]
+    return results.reshape(-1, _BATCH_RESULT_SIZES[objective])
+
+# Flattens the trusses into a float and an integer array. Each row of the
+# header describes a truss: number of nodes, of elements and of fixed degrees
+# of freedom, followed by its offsets in the float, integer and result arrays.
+def _pack_trusses(trusses, objective, params):
+    unit_forces = params.pop("unit_forces", None)
+    header, floats, integers = [], [], []
+    float_offset = integer_offset = result_offset = 0
+    for index, (coords, connectivity, elasticities, areas, fixed_dofs, forces) in enumerate(trusses):
+        coords = np.asarray(coords, dtype=float).reshape(-1)
+        connectivity = np.asarray(connectivity, dtype=np.int64).reshape(-1)
+        areas = np.asarray(areas, dtype=float).reshape(-1)
+        elasticities = np.broadcast_to(np.asarray(elasticities, dtype=float), areas.shape)
+        fixed_dofs = np.asarray(fixed_dofs, dtype=np.int64).reshape(-1)
+        parts = [coords, elasticities, areas, np.asarray(forces, dtype=float).reshape(-1)]
+        if objective == "maximum_load":
+            parts.append(np.asarray(unit_forces[index], dtype=float).reshape(-1))
+
+        row = [len(coords)//2, len(areas), len(fixed_dofs), float_offset, integer_offset, result_offset]
+        header.append(row)
+        floats.extend(parts)
+        integers.extend((connectivity, fixed_dofs))
+        float_offset += sum(len(part) for part in parts)
+        integer_offset += len(connectivity) + len(fixed_dofs)
+        result_offset += _batch_result_size(row, objective)
+
+    header = np.array(header, dtype=np.int64).reshape(-1, 6)
+    floats = np.concatenate(floats) if floats else np.zeros(0)
+    integers = np.concatenate(integers) if integers else np.zeros(0, dtype=np.int64)
+    return header, floats, integers
+
+def _batch_result_size(row, objective):
+    return row[1] if objective == "stresses" else _BATCH_RESULT_SIZES[objective]
+
+# Evaluates the trusses from start to stop of packed arrays and writes their
+# results. Used both by the workers and by evaluate_batch() itself.
+def _evaluate_packed(header, floats, integers, results, objective, params, start, stop):
+    tolerance = params.get("tolerance", 1e-12)
+    for nodes, elements, fixed, float_offset, integer_offset, result_offset in header[start:stop]:
+        values = floats[float_offset:]
+        coords = values[:2*nodes].reshape(-1, 2)
+        elasticities = values[2*nodes:2*nodes + elements]
+        areas = values[2*nodes + elements:2*nodes + 2*elements]
+        forces = values[2*nodes + 2*elements:4*nodes + 2*elements]
+        connectivity = integers[integer_offset:integer_offset + 2*elements].reshape(-1, 2)
+        fixed_dofs = integers[integer_offset + 2*elements:integer_offset + 2*elements + fixed]
+        known = np.full(2*nodes, np.nan)
+        known[fixed_dofs] = 0.0
+
+        system = _solvable_system(coords, connectivity, elasticities, areas, known, tolerance)
+        if system is None:
+            continue
+
+        if objective == "maximum_load":
+            unit_forces = values[4*nodes + 2*elements:6*nodes + 2*elements]
+            prescribed = np.column_stack((known, known))
+            stresses = system.element_stresses(system.solve(np.column_stack((forces, unit_forces)), prescribed))
+            multiplier = maximum_load_multiplier(stresses[:,0], stresses[:,1], params["stress_limit"])
+            maximum_stress = np.abs(stresses[:,0] + multiplier*stresses[:,1]).max() if np.isfinite(multiplier) and elements > 0 else np.nan
+            results[result_offset:result_offset + 2] = (multiplier, maximum_stress)
+            continue
+
+        stresses = system.element_stresses(system.solve(forces[:,None], known[:,None]))[:,0]
+        if objective == "stresses":
+            results[result_offset:result_offset + elements] = stresses
+        else:
+            summary = _summarize_stresses(stresses, params.get("top_count", 3))
+            results[result_offset:result_offset + 3] = summary[1:]
+
+# Factorized system of a truss given by arrays, or None if the truss is not
+# solvable. Mechanisms are rejected by the pebble game before factorizing.
+def _solvable_system(coords, connectivity, elasticities, areas, known, tolerance):
+    if not check_rigidity(len(coords), connectivity, np.flatnonzero(~np.isnan(known))).is_rigid:
+        return None
+    try:
+        system = _LoadCasesSystem(coords, connectivity, elasticities, areas, known)
+    except la.LinAlgError:
+        return None
+    reduced_stiffness = system.stiffness[system.free][:, system.free]
+    if not _reduced_solvability(reduced_stiffness, system.free, tolerance, system.factorization).is_solvable:
+        return None
+    return system
+
+# Pool of worker processes kept between batches, since starting processes
+# (and importing nusa in them) takes much longer than evaluating most batches.
+_batch_pool = None
+_batch_pool_processes = 0
+
+def _evaluate_in_pool(header, floats, integers, number_of_results, objective, params, processes):
+    blocks = []
+    try:
+        names = {}
+        for key, array in (("header", header), ("floats", floats), ("integers", integers), ("results", np.full(number_of_results, np.nan))):
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            names[key] = (block.name, array.shape, array.dtype.str)
+
+        # A few chunks per process balance the load without much overhead.
+        bounds = np.linspace(0, len(header), min(len(header), 4*processes) + 1).astype(int)
+        tasks = [(names, objective, params, start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        _get_batch_pool(processes).map(_evaluate_chunk, tasks)
+
+        name, shape, dtype = names["results"]
+        return np.ndarray(shape, dtype=dtype, buffer=blocks[-1].buf).copy()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+# Worker side of _evaluate_in_pool().
+def _evaluate_chunk(task):
+    names, objective, params, start, stop = task
+    blocks = {key: _attach_shared_memory(name) for key, (name, _, _) in names.items()}
+    try:
+        arrays = {key: np.ndarray(shape, dtype=dtype, buffer=blocks[key].buf) for key, (_, shape, dtype) in names.items()}
+        _evaluate_packed(arrays["header"], arrays["floats"], arrays["integers"], arrays["results"], objective, params, start, stop)
+        del arrays
+    finally:
+        for block in blocks.values():
+            block.close()
+
+# The blocks belong to the process that created them, so workers don't ask
+# the resource tracker to clean them up (not possible before Python 3.13).
+def _attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _get_batch_pool(processes):
+    global _batch_pool, _batch_pool_processes
+    if _batch_pool is not None and _batch_pool_processes == processes:
+        return _batch_pool
+    shutdown_batch_pool()
+    context = _spawn_context()
+
+    # Each worker uses a single BLAS thread, the pool already uses all cores.
+    threads_variables = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+    environment = {key: os.environ.get(key) for key in threads_variables}
+    os.environ.update({key: "1" for key in threads_variables})
+    try:
+        _batch_pool = context.Pool(processes)
+    finally:
+        for key, value in environment.items():
+            if value is None:
+                del os.environ[key]
+            else:
+                os.environ[key] = value
+    _batch_pool_processes = processes
+    return _batch_pool
+
+# Workers are spawned instead of forked, which isn't safe in a process with
+# threads like the app. When Python is embedded, sys.executable is the app
+# itself, so the workers need the path of a real interpreter.
+def _spawn_context():
+    context = multiprocessing.get_context("spawn")
+    if not os.path.basename(sys.executable).startswith("python"):
+        context.set_executable(os.path.join(sys.exec_prefix, "bin", "python3"))
+    return context
+
+# Stops the worker processes of evaluate_batch(). A new pool is started by the
+# next batch.
+def shutdown_batch_pool():
+    global _batch_pool, _batch_pool_processes
+    if _batch_pool is not None:
+        _batch_pool.close()
+        _batch_pool.join()
+    _batch_pool = None
+    _batch_pool_processes = 0
+
+# ---------------------------------------------------------------------------
+# Fitness surrogate.
+#
+# Most offspring of a generation end up at the bottom of the ranking and are
+# replaced in the next one, so simulating them is wasted. FitnessSurrogate
+# learns the fitness of trusses from a few cheap features, with the
+# (features, fitness) pairs of the trusses a run already simulates, and finds
+# the offspring that are confidently not going to survive before they are
+# simulated. It's a nearest neighbors model: fitness penalties and other steps
+# don't bend it like they would a regression, and its confidence comes from
+# how much the neighbors of a truss agree.
+# ---------------------------------------------------------------------------
+
+# Names of the features returned by truss_features(), in order.
+TRUSS_FEATURES = ("members", "total_length", "mass", "span_height_ratio", "supported_dofs", "support_spread", "support_height")
+
+# Features of a truss model for FitnessSurrogate: number of elements, total
+# element length, mass (with `density`), span over height of the nodes bounding
+# box, number of known displacements, standard deviation of the supported
+# nodes x over the span and mean height of the supported nodes over the
+# height. The last two are 0 when the span or the height is 0.
+def truss_features(truss_model, density=7850.0):
+    coords, connectivity, elasticities, areas, known, forces = _model_arrays(truss_model)
+    if len(coords) == 0:
+        return np.zeros(len(TRUSS_FEATURES))
+    _, _, lengths = _element_geometry(coords, connectivity, elasticities, areas)
+    span, height = np.ptp(coords, axis=0)
+    supported = np.flatnonzero(~np.isnan(known.reshape(-1, 2)).all(axis=1))
+    support_coords = coords[supported] - coords.min(axis=0)
+    return np.array([
+        len(connectivity),
+        lengths.sum(),
+        density*np.dot(areas, lengths),
+        span/height if height > 0 else 0.0,
+        np.count_nonzero(~np.isnan(known)),
+        support_coords[:, 0].std()/span if span > 0 and len(supported) > 0 else 0.0,
+        support_coords[:, 1].mean()/height if height > 0 and len(supported) > 0 else 0.0,
+    ])
+
+# Result of FitnessSurrogate.screen(). hopeless tells which trusses are
+# confidently below the threshold and predictions has the predicted fitness of
+# every truss (nan before the surrogate has enough samples).
+SurrogateScreen = collections.namedtuple("SurrogateScreen", ["hopeless", "predictions"])
+
+# Nearest neighbors surrogate of a fitness, trained online.
+#
+# - neighbors: number of samples a prediction is made from.
+# - capacity: number of most recent samples kept. The population moves as the
+#   run goes, so old samples stop describing it.
+# - min_samples: number of samples below which no truss is found hopeless.
+#
+# Features are standardized with the mean and standard deviation of the kept
+# samples. The predicted fitness of a truss is the median fitness of its
+# neighbors.
+class FitnessSurrogate:
+    def __init__(self, neighbors=8, capacity=2000, min_samples=50):
+        self.neighbors = neighbors
+        self.capacity = capacity
+        self.min_samples = min_samples
+        self.features = np.empty((0, len(TRUSS_FEATURES)))
+        self.fitnesses = np.empty(0)
+
+    def __len__(self):
+        return len(self.fitnesses)
+
+    # Adds the features (one row per truss) and fitnesses of simulated
+    # trusses. Non finite fitnesses are skipped.
+    def add(self, features, fitnesses):
+        features = np.asarray(features, dtype=float).reshape(-1, self.features.shape[1])
+        fitnesses = np.asarray(fitnesses, dtype=float).ravel()
+        finite = np.isfinite(fitnesses)
+        self.features = np.concatenate((self.features, features[finite]))[-self.capacity:]
+        self.fitnesses = np.concatenate((self.fitnesses, fitnesses[finite]))[-self.capacity:]
+
+    # Finds the trusses (one row of features each) whose fitness is confidently
+    # below threshold: the ones whose neighbors all have a lower fitness and
+    # are closer to them than the typical distance between neighboring samples.
+    @_instrumented("surrogate_screen")
+    def screen(self, features, threshold):
+        features = np.asarray(features, dtype=float).reshape(-1, self.features.shape[1])
+        if len(self) < max(self.min_samples, self.neighbors + 1):
+            return SurrogateScreen(np.zeros(len(features), dtype=bool), np.full(len(features), np.nan))
+
+        mean = self.features.mean(axis=0)
+        scale = self.features.std(axis=0)
+        scale[scale == 0] = 1.0
+        samples = (self.features - mean)/scale
+        distances, indices = self._nearest((features - mean)/scale, samples, self.neighbors)
+        predictions = np.median(self.fitnesses[indices], axis=1)
+
+        # Typical distance of a sample to its farthest neighbor, leaving the
+        # sample itself out.
+        sample_distances, _ = self._nearest(samples, samples, self.neighbors + 1)
+        reach = np.median(sample_distances[:, -1])
+
+        hopeless = (self.fitnesses[indices] < threshold).all(axis=1) & (distances[:, -1] <= reach)
+        _count("surrogate.screened", len(features))
+        _count("surrogate.hopeless", int(hopeless.sum()))
+        return SurrogateScreen(hopeless, predictions)
+
+    # Distances to and indices of the `count` nearest samples of each point,
+    # nearest first.
+    @staticmethod
+    def _nearest(points, samples, count):
+        squared = (points**2).sum(axis=1)[:, None] + (samples**2).sum(axis=1)[None, :] - 2*points @ samples.T
+        distances = np.sqrt(np.maximum(squared, 0.0))
+        indices = np.argpartition(distances, count - 1, axis=1)[:, :count]
+        nearest = np.take_along_axis(distances, indices, axis=1)
+        order = np.argsort(nearest, axis=1)
+        return np.take_along_axis(nearest, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+# ---------------------------------------------------------------------------
+# Plates.
+#
+# Nusa's LinearTriangleModel needs a Node and a LinearTriangle object per mesh
+# entity and assembles a dense global matrix entry by entry, so it can't handle
+# more than a few thousand triangles. solve_plate() takes the points and
+# triangle cells of a mesh (like the ones pygmsh generates) and does the same
+# plane stress analysis with constant strain triangles, with every element
+# matrix computed at once and the system solved with scipy.sparse.
+# ---------------------------------------------------------------------------
+
+# Result of solve_plate(). displacements has the (ux, uy) of each point and
+# element_stresses the (sx, sy, sxy) of each cell. Nodal stresses are the mean
+# of the stresses of the cells around each point, like nusa's Node.sx, and the
+# von Mises stresses are computed from the element and the nodal stresses, like
+# nusa's Node.seqv.
+PlateSolution = collections.namedtuple("PlateSolution", ["displacements", "element_stresses", "nodal_stresses", "element_von_mises", "nodal_von_mises"])
+
+# Solves a plate meshed with triangles under plane stress.
+#
+# - points: (x, y) or (x, y, z) of each mesh point, z is ignored.
+# - cells: indices of the three points of each triangle.
+# - elasticity, poisson_ratio, thickness: one value for all cells or one per cell.
+# - fixed_dofs: degrees of freedom with zero displacement, 2*i for the x of
+#   point i and 2*i+1 for its y.
+# - forces: (fx, fy) of each point, or a flat array with 2 values per point.
+#
+# Points that belong to no cell (like the center of a meshed hole) are fixed,
+# as nusa does, so they don't make the system singular. Cells may have any
+# orientation. Raises la.LinAlgError if the plate is not held enough.
+@_instrumented("solve_plate")
+def solve_plate(points, cells, elasticity, poisson_ratio, thickness, fixed_dofs, forces):
+    points = np.asarray(points, dtype=float)
+    coords = points.reshape(len(points), -1)[:, :2]
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, 3)
+    forces = np.asarray(forces, dtype=float).reshape(-1)
+    number_of_dofs = 2*len(coords)
+    _record_size("plate.cells", len(cells))
+
+    gradients, areas = _triangle_gradients(coords, cells)
+    elasticities = _plane_stress_elasticities(elasticity, poisson_ratio, len(cells))
+    thicknesses = np.broadcast_to(np.asarray(thickness, dtype=float), (len(cells),))
+
+    # K_e = t*|A|*B^T*D*B for all cells at once.
+    blocks = np.einsum("e,eki,ekl,elj->eij", thicknesses*areas, gradients, elasticities, gradients)
+    dofs = _triangle_dofs(cells)
+    stiffness = sparse.coo_matrix(
+        (blocks.ravel(), (np.repeat(dofs, 6, axis=1).ravel(), np.tile(dofs, (1, 6)).ravel())),
+        shape=(number_of_dofs, number_of_dofs)
+    ).tocsr()
+
+    fixed = np.zeros(number_of_dofs, dtype=bool)
+    fixed[np.asarray(fixed_dofs, dtype=np.int64)] = True
+    unused = np.bincount(cells.ravel(), minlength=len(coords)) == 0
+    fixed[np.flatnonzero(np.repeat(unused, 2))] = True
+    free = np.flatnonzero(~fixed)
+
+    displacements = np.zeros(number_of_dofs)
+    if len(free) > 0:
+        factorization = _Factorization(stiffness[free][:, free], ordering="minimum_degree")
+        displacements[free] = factorization.solve(forces[free])
+
+    # Stresses D*B*u of each cell and their mean around each point.
+    element_stresses = np.einsum("eij,ejk,ek->ei", elasticities, gradients, displacements[dofs])
+    counts = np.bincount(cells.ravel(), minlength=len(coords))
+    nodal_stresses = np.column_stack([
+        np.bincount(cells.ravel(), weights=np.repeat(element_stresses[:, component], 3), minlength=len(coords))
+        for component in range(3)
+    ]) / np.maximum(counts, 1)[:, None]
+
+    return PlateSolution(displacements.reshape(-1, 2), element_stresses, nodal_stresses,
+                         _von_mises(element_stresses), _von_mises(nodal_stresses))
+
+# Strain displacement matrices B of all triangles, with shape (cells, 3, 6),
+# and the absolute areas. B is the same as nusa's LinearTriangle.B, whose
+# signed area makes it right for both orientations.
+def _triangle_gradients(coords, cells):
+    x, y = coords[cells, 0], coords[cells, 1]
+    betas = y[:, [1, 2, 0]] - y[:, [2, 0, 1]]
+    gammas = x[:, [2, 0, 1]] - x[:, [1, 2, 0]]
+    signed_areas = (x[:, 0]*betas[:, 0] + x[:, 1]*betas[:, 1] + x[:, 2]*betas[:, 2]) / 2
+    gradients = np.zeros((len(cells), 3, 6))
+    gradients[:, 0, 0::2] = betas
+    gradients[:, 1, 1::2] = gammas
+    gradients[:, 2, 0::2] = gammas
+    gradients[:, 2, 1::2] = betas
+    gradients /= (2*signed_areas)[:, None, None]
+    return gradients, np.abs(signed_areas)
+
+# Plane stress constitutive matrices D of all cells, with shape (cells, 3, 3).
+def _plane_stress_elasticities(elasticity, poisson_ratio, count):
+    elasticity = np.broadcast_to(np.asarray(elasticity, dtype=float), (count,))
+    nu = np.broadcast_to(np.asarray(poisson_ratio, dtype=float), (count,))
+    matrices = np.zeros((count, 3, 3))
+    matrices[:, 0, 0] = matrices[:, 1, 1] = 1
+    matrices[:, 0, 1] = matrices[:, 1, 0] = nu
+    matrices[:, 2, 2] = (1 - nu)/2
+    return matrices * (elasticity/(1 - nu**2))[:, None, None]
+
+# Global degrees of freedom of each triangle, ux and uy of each of its points.
+def _triangle_dofs(cells):
+    return np.stack((2*cells, 2*cells + 1), axis=2).reshape(-1, 6)
+
+# Von Mises stresses from rows of (sx, sy, sxy) plane stresses.
+def _von_mises(stresses):
+    sx, sy, sxy = stresses[:, 0], stresses[:, 1], stresses[:, 2]
+    return np.sqrt(sx**2 - sx*sy + sy**2 + 3*sxy**2)
+
+# Plate meshes, with the points (x, y) and the point indices of each triangle.
+PlateMesh = collections.namedtuple("PlateMesh", ["points", "cells"])
+
+# Folder and size limit of the mesh cache of plate_mesh().
+MESH_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "BridgeBuilder", "Meshes")
+MESH_CACHE_MAX_BYTES = 256*1024**2
+
+# Part of every mesh key, to be increased when meshes are generated differently.
+_MESH_CACHE_VERSION = 1
+
+# Meshes a plate described by a dictionary, or gets the mesh from an on-disk
+# cache when the same description was meshed before, since meshing with gmsh
+# (and its boolean operations) often takes longer than solving the plate.
+#
+# The description of the default generator, _generate_plate_mesh(), is:
+#   {"rectangle": (x, y, width, height),
+#    "disks": [(x, y, radius), ...],           holes, optional
+#    "polygons": [[(x, y), ...], ...],         holes, optional
+#    "characteristic_length_min": 0.1,         optional
+#    "characteristic_length_max": 0.1}         optional
+# Other geometries can be meshed by a `generate` function, which takes the
+# description and returns points and triangle cells; it must be part of the
+# description somehow (like a "kind" entry), since only the description is
+# hashed.
+#
+# Each mesh is kept as .npy files in a folder named by the hash of its
+# description and the arrays of cached meshes are memory-mapped, not read.
+# When the cache gets larger than max_bytes, the least recently used meshes are
+# removed.
+@_instrumented("plate_mesh")
+def plate_mesh(description, generate=None, cache_path=None, max_bytes=MESH_CACHE_MAX_BYTES):
+    cache_path = cache_path or MESH_CACHE_PATH
+    key = _mesh_key(description)
+    folder = os.path.join(cache_path, key)
+    try:
+        mesh = PlateMesh(np.load(os.path.join(folder, "points.npy"), mmap_mode="r"),
+                         np.load(os.path.join(folder, "cells.npy"), mmap_mode="r"))
+        os.utime(folder)
+        _count("mesh_cache.hits")
+        return mesh
+    except (OSError, ValueError):
+        _count("mesh_cache.misses")
+
+    points, cells = (generate or _generate_plate_mesh)(description)
+    mesh = PlateMesh(np.ascontiguousarray(points, dtype=float), np.ascontiguousarray(cells, dtype=np.int64).reshape(-1, 3))
+    _store_mesh(cache_path, key, mesh, max_bytes)
+    return mesh
+
+# Removes every mesh of the cache.
+def clear_mesh_cache(cache_path=None):
+    shutil.rmtree(cache_path or MESH_CACHE_PATH, ignore_errors=True)
+
+def _mesh_key(description):
+    text = json.dumps([_MESH_CACHE_VERSION, description], sort_keys=True, default=lambda value: np.asarray(value).tolist())
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+# Meshes are written into a hidden folder that is renamed when complete, so
+# other processes never see half written meshes.
+def _store_mesh(cache_path, key, mesh, max_bytes):
+    os.makedirs(cache_path, exist_ok=True)
+    temporary = tempfile.mkdtemp(prefix=".", dir=cache_path)
+    np.save(os.path.join(temporary, "points.npy"), mesh.points)
+    np.save(os.path.join(temporary, "cells.npy"), mesh.cells)
+    try:
+        os.rename(temporary, os.path.join(cache_path, key))
+    except OSError:
+        # Another process stored the same mesh first.
+        shutil.rmtree(temporary, ignore_errors=True)
+    _evict_meshes(cache_path, max_bytes)
+
+def _evict_meshes(cache_path, max_bytes):
+    entries = []
+    for entry in os.scandir(cache_path):
+        if entry.name.startswith(".") or not entry.is_dir():
+            continue
+        size = sum(file.stat().st_size for file in os.scandir(entry.path))
+        entries.append((entry.stat().st_mtime, size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+# Meshes a rectangular plate with holes with pygmsh, see plate_mesh().
+def _generate_plate_mesh(description):
+    import pygmsh
+
+    with pygmsh.occ.Geometry() as geometry:
+        for name in ("characteristic_length_min", "characteristic_length_max"):
+            if name in description:
+                setattr(geometry, name, description[name])
+        x, y, width, height = description["rectangle"]
+        plate = geometry.add_rectangle([x, y, 0.0], width, height)
+        holes = [geometry.add_disk([x, y, 0.0], radius) for x, y, radius in description.get("disks", ())]
+        holes += [geometry.add_polygon([[x, y, 0.0] for x, y in polygon]) for polygon in description.get("polygons", ())]
+        if holes:
+            geometry.boolean_difference(plate, holes)
+        mesh = geometry.generate_mesh()
+
+    cells = [cell.data for cell in mesh.cells if cell.type == "triangle"]
+    return mesh.points[:, :2], np.concatenate(cells)
+
+# ---------------------------------------------------------------------------
+# Snapshots.
+# ---------------------------------------------------------------------------
+
+# Arrays used to plot a truss, with one row per node label or per element.
+# fixed tells which displacements are constrained and stresses may be None when
+# they are not needed. Snapshots are plain arrays, so they can be sent to other
+# processes to be plotted (see NusaPlus' render_views()) or logged.
+TrussSnapshot = collections.namedtuple("TrussSnapshot", ["coords", "displacements", "forces", "fixed", "connectivity", "areas", "stresses"])
+
+# Displacements of the nodes as a (n, 2) array. Like in nusa, they are nan for
+# the free degrees of freedom of an unsolved model.
+def _node_displacements(truss_model):
+    if isinstance(truss_model, TrussArrays):
+        values = truss_model.displacements if truss_model.is_solved else truss_model.known_displacements
+        return values.reshape(-1, 2).copy()
+    nodes = sorted(truss_model.get_nodes(), key=lambda node: node.label)
+    return np.array([(node.ux, node.uy) for node in nodes], dtype=float).reshape(-1, 2)
+
+# Element stresses of a solved model, from the sparse solver arrays if possible.
+# They are nan for an unsolved TrussArrays, like nusa's element.s.
+def _model_stresses(truss_model):
+    stresses = getattr(truss_model, "element_stresses", None)
+    if stresses is None and isinstance(truss_model, TrussArrays):
+        stresses = np.full(len(truss_model.connectivity), np.nan)
+    elif stresses is None:
+        stresses = [element.s for element in truss_model.get_elements()]
+    return np.asarray(stresses, dtype=float)
+
+# Snapshot of a truss model for NusaPlus' render_views() and run logs. Unlike
+# the one used by the plot functions, forces are the applied forces (never the
+# reactions) and constraints are the fixed degrees of freedom. Displacements
+# and stresses are only there if the model is solved, otherwise they are nan
+# and None.
+def truss_snapshot(truss_model):
+    coords, connectivity, _, areas, known, forces = _model_arrays(truss_model)
+    displacements = _node_displacements(truss_model)
+    stresses = None if np.isnan(displacements).any() else _model_stresses(truss_model)
+    return TrussSnapshot(np.array(coords, dtype=float), displacements, np.array(forces, dtype=float).reshape(-1, 2),
+                         (known == 0).reshape(-1, 2), np.array(connectivity), np.array(areas, dtype=float), stresses)
+
+# ---------------------------------------------------------------------------
+# Run logs.
+#
+# A run log is an append-only binary file with the fitness statistics of every
+# generation of an evolution and the solved trusses of its best bridges, so a
+# run doesn't need to save any image. Plots of any generation, statistics and
+# animation frames can be rendered afterwards from the log, at any resolution,
+# with NusaPlus' replay_run_log(), plot_run_statistics() and replay_animation(),
+# or from the command line with `python NusaPlus.py`.
+#
+# The file starts with a 16 bytes header (magic and version) followed by the
+# records. Each record has a 24 bytes header (tag, generation and payload size)
+# and a payload that is a multiple of 8 bytes, so all arrays are aligned and
+# the log can be memory mapped and read without copying.
+#
+# - b"GENS" records hold the best fitness, fitness mean and fitness standard
+#   deviation of the generation, as float64.
+# - b"TRUS" records hold the fitness, number of nodes n, number of elements m
+#   and whether load forces are present, followed by the coordinates,
+#   displacements, forces and load forces (n*2 float64 each), connectivity
+#   (m*2 int64), areas and stresses (m float64 each) and the fixed degrees of
+#   freedom (n*2 bytes, padded).
+# ---------------------------------------------------------------------------
+
+_RUN_LOG_MAGIC = b"BBRUNLOG"
+_RUN_LOG_VERSION = 1
+_RUN_LOG_HEADER = struct.Struct("<8sI4x")
+_RUN_LOG_RECORD = struct.Struct("<4s4xqQ")
+_RUN_LOG_GENERATION = struct.Struct("<ddd")
+_RUN_LOG_TRUSS = struct.Struct("<dqqq")
+
+# Writes a run log, creating the file (and its folder) or appending to an
+# existing log.
+class RunLogWriter:
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # A run that crashed may have left an incomplete record at the end,
+        # which is removed so new records can be read.
+        end = _run_log_end(path) if os.path.exists(path) else 0
+        self._file = open(path, "r+b" if end else "wb")
+        if end:
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file.write(_RUN_LOG_HEADER.pack(_RUN_LOG_MAGIC, _RUN_LOG_VERSION))
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    # Records the fitness statistics of a generation.
+    def log_generation(self, generation, best_fitness, fitness_mean, fitness_standard_deviation):
+        self._write_record(b"GENS", generation, [_RUN_LOG_GENERATION.pack(best_fitness, fitness_mean, fitness_standard_deviation)])
+
+    # Records a truss model, usually a new best bridge, with its results if it
+    # is solved. load_forces are nodal forces, as in build_model_from_arrays(),
+    # that replay_run_log() draws in its load forces plots.
+    def log_truss(self, generation, fitness, truss_model, load_forces=None):
+        snapshot = truss_snapshot(truss_model)
+        n, m = len(snapshot.coords), len(snapshot.connectivity)
+        stresses = snapshot.stresses if snapshot.stresses is not None else np.full(m, np.nan)
+        arrays = [snapshot.coords, snapshot.displacements, snapshot.forces]
+        if load_forces is not None:
+            arrays.append(np.asarray(load_forces, dtype=float).reshape(n, 2))
+        arrays += [snapshot.connectivity.astype(np.int64), snapshot.areas, stresses]
+        fixed = np.zeros(-(-2*n // 8) * 8, dtype=np.uint8)
+        fixed[:2*n] = snapshot.fixed.ravel()
+        parts = [_RUN_LOG_TRUSS.pack(fitness, n, m, load_forces is not None)]
+        parts += [np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<")).tobytes() for array in arrays]
+        self._write_record(b"TRUS", generation, parts + [fixed.tobytes()])
+
+    # Records are written with a single call and flushed, so a log is complete
+    # up to its last record even if the run stops.
+    def _write_record(self, tag, generation, parts):
+        payload = b"".join(parts)
+        self._file.write(_RUN_LOG_RECORD.pack(tag, int(generation), len(payload)) + payload)
+        self._file.flush()
+
+# Fitness statistics of a run log, with one value per logged generation.
+RunStatistics = collections.namedtuple("RunStatistics", ["generations", "best_fitnesses", "fitness_means", "fitness_standard_deviations"])
+
+# Truss of a run log. load_forces is None if no load forces were logged.
+LoggedTruss = collections.namedtuple("LoggedTruss", ["generation", "fitness", "snapshot", "load_forces"])
+
+# Reads a run log. The file is memory mapped, so opening a long log only reads
+# the record headers and the arrays of a truss are read when it's used.
+class RunLog:
+
+    def __init__(self, path):
+        self.path = path
+        end = _run_log_end(path)
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r", shape=(end,))
+
+        statistics = []
+        self._trusses = []
+        for tag, generation, offset, size in _run_log_records(self._buffer, end):
+            if tag == b"GENS":
+                statistics.append((generation,) + _RUN_LOG_GENERATION.unpack_from(self._buffer, offset))
+            elif tag == b"TRUS":
+                self._trusses.append((generation, offset))
+        statistics = np.array(statistics, dtype=float).reshape(-1, 4)
+        self.statistics = RunStatistics(statistics[:,0].astype(np.int64), statistics[:,1], statistics[:,2], statistics[:,3])
+        self.truss_generations = np.array([generation for generation, _ in self._trusses], dtype=np.int64)
+
+    def __len__(self):
+        return len(self._trusses)
+
+    # Truss at an index, in the order they were logged. Its arrays are read
+    # only views of the file.
+    def truss(self, index):
+        generation, offset = self._trusses[index]
+        fitness, n, m, has_load_forces = _RUN_LOG_TRUSS.unpack_from(self._buffer, offset)
+        offset += _RUN_LOG_TRUSS.size
+
+        def read(dtype, count, shape):
+            nonlocal offset
+            array = np.frombuffer(self._buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += array.nbytes
+            return array
+
+        coords = read("<f8", 2*n, (n, 2))
+        displacements = read("<f8", 2*n, (n, 2))
+        forces = read("<f8", 2*n, (n, 2))
+        load_forces = read("<f8", 2*n, (n, 2)) if has_load_forces else None
+        connectivity = read("<i8", 2*m, (m, 2))
+        areas = read("<f8", m, (m,))
+        stresses = read("<f8", m, (m,))
+        fixed = read(np.uint8, 2*n, (n, 2)).astype(bool)
+        stresses = None if np.isnan(stresses).any() else stresses
+        snapshot = TrussSnapshot(coords, displacements, forces, fixed, connectivity, areas, stresses)
+        return LoggedTruss(generation, fitness, snapshot, load_forces)
+
+    # Index of the best truss at a generation, which is the last truss logged
+    # at that generation or before it. Trusses logged with negative generations
+    # (like the ones of the initial population) are not considered. None if
+    # there is no truss yet.
+    def best_truss_index(self, generation):
+        indices = np.flatnonzero((self.truss_generations >= 0) & (self.truss_generations <= generation))
+        return int(indices[-1]) if len(indices) > 0 else None
+
+# Reads the header of a run log and gets where its last complete record ends.
+def _run_log_end(path):
+    with open(path, "rb") as file:
+        data = file.read(_RUN_LOG_HEADER.size)
+        if len(data) < _RUN_LOG_HEADER.size:
+            raise ValueError("Not a run log: " + str(path))
+        magic, version = _RUN_LOG_HEADER.unpack(data)
+        if magic != _RUN_LOG_MAGIC:
+            raise ValueError("Not a run log: " + str(path))
+        if version != _RUN_LOG_VERSION:
+            raise ValueError("Unsupported run log version: " + str(version))
+
+        end = _RUN_LOG_HEADER.size
+        size = os.fstat(file.fileno()).st_size
+        while end + _RUN_LOG_RECORD.size <= size:
+            file.seek(end)
+            _, _, payload_size = _RUN_LOG_RECORD.unpack(file.read(_RUN_LOG_RECORD.size))
+            if end + _RUN_LOG_RECORD.size + payload_size > size:
+                break
+            end += _RUN_LOG_RECORD.size + payload_size
+        return end
+
+# Yields the tag, generation, payload offset and payload size of the records.
+def _run_log_records(buffer, end):
+    offset = _RUN_LOG_HEADER.size
+    while offset < end:
+        tag, generation, size = _RUN_LOG_RECORD.unpack_from(buffer, offset)
+        yield tag, generation, offset + _RUN_LOG_RECORD.size, size
+        offset += _RUN_LOG_RECORD.size + size
@@ -0,0 +1,415 @@
+'''
+Benchmarks NusaPlus on parametric bridge trusses of growing size, so changes to
+the solver, the solvability check or the plots can be measured.
+
+Each truss is built like the bridges of Bridge.init(floorSupports:): a floor
+line between supports at y = 0, the first one fixed on x and y and the others
+only on y, with edge weights and an evenly distributed load on the floor.
+Trusses are Warren, Pratt or random triangulated, from 10 to 10k members. Long
+trusses get a floor support every SUPPORT_SPACING panels, like a bridge with
+several spans, so they don't become too flexible to be solved.
+
+For each truss, these stages are timed separately (best of a few repeats) and
+their peak Python memory is recorded with tracemalloc:
+    assembly      build_model_from_arrays() and the sparse stiffness matrix
+    solvability   isModelSolvable()
+    solve         solve_model(), without the solve cache
+    stresses      stress_summary()
+    check_and_solve check_and_solve(), solvability and solve with one factorization
+    plot_model    plot_model(), drawn on an agg canvas
+    plot_deformed plot_deformed_shape(), drawn on an agg canvas
+    nusa_solve    nusa's own TrussModel.solve(), only for small trusses
+
+Usage:
+    python3 nusaplus-benchmark.py --output baseline.json
+    python3 nusaplus-benchmark.py --compare baseline.json --tolerance 0.3
+
+Compare mode runs the same cases as the baseline and exits with status 1 if a
+stage got slower (or used more memory) than the tolerance allows.
+
+The import budget check imports NusaPlusCore and NusaPlus in fresh processes
+and exits with status 1 if an import takes longer than IMPORT_BUDGETS allows or
+loads a module of LAZY_MODULES, which only plots and nusa models need:
+    python3 nusaplus-benchmark.py --import-budget
+'''
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import matplotlib
+matplotlib.use("agg")
+import matplotlib.pyplot as plt
+import scipy
+from scipy.spatial import Delaunay
+from nusa import *
+
+import NusaPlus
+import NusaPlusCore
+
+
+# Values used by Gene and the bridges of AppDelegate.
+ELASTICITY = 210e9
+AREA = 10e-3
+DENSITY = 7850
+GRAVITY = 9.80665
+TOTAL_LOAD = 6e6
+PANEL_LENGTH = 5.0
+PANEL_HEIGHT = 5.0
+SUPPORT_SPACING = 40
+
+# nusa's solve() assembles and solves a dense matrix, so it's only timed for
+# trusses up to this number of members.
+NUSA_MEMBER_LIMIT = 1000
+
+BASELINE_VERSION = 1
+
+# Seconds each module may take to import in a fresh process (best of a few
+# imports), with NumPy and SciPy included. nusa imports matplotlib.pyplot,
+# which alone takes longer than these.
+IMPORT_BUDGETS = {"NusaPlusCore": 0.6, "NusaPlus": 0.7}
+LAZY_MODULES = ("nusa", "matplotlib")
+
+
+# ---------------------------------------------------------------------------
+# Trusses.
+#
+# Generators return the arguments of NusaPlus.build_model_from_arrays():
+# coords, connectivity, E, A, fixed_dofs and nodal_forces.
+# ---------------------------------------------------------------------------
+
+# Warren truss: a floor of `panels` panels and a top chord with one node above
+# the middle of each panel, so it has 4*panels - 1 members.
+def warren_truss(panels):
+    floor = np.column_stack([np.arange(panels + 1) * PANEL_LENGTH, np.zeros(panels + 1)])
+    top = np.column_stack([(np.arange(panels) + 0.5) * PANEL_LENGTH, np.full(panels, PANEL_HEIGHT)])
+    coords = np.vstack([floor, top])
+
+    floor_indices = np.arange(panels + 1)
+    top_indices = panels + 1 + np.arange(panels)
+    connectivity = np.vstack([
+        np.column_stack([floor_indices[:-1], floor_indices[1:]]),
+        np.column_stack([top_indices[:-1], top_indices[1:]]),
+        np.column_stack([floor_indices[:-1], top_indices]),
+        np.column_stack([top_indices, floor_indices[1:]]),
+    ])
+    return _bridge_truss(coords, connectivity, floor_indices)
+
+# Pratt truss: a floor of `panels` panels, verticals above the inner floor
+# nodes, a top chord between them and diagonals going down towards the middle,
+# so it has 4*panels - 3 members.
+def pratt_truss(panels):
+    floor = np.column_stack([np.arange(panels + 1) * PANEL_LENGTH, np.zeros(panels + 1)])
+    top = np.column_stack([np.arange(1, panels) * PANEL_LENGTH, np.full(panels - 1, PANEL_HEIGHT)])
+    coords = np.vstack([floor, top])
+
+    floor_indices = np.arange(panels + 1)
+    # Top node above floor node i, for 0 < i < panels.
+    top_indices = np.r_[-1, panels + np.arange(1, panels), -1]
+    edges = [(i, i + 1) for i in range(panels)]
+    edges += [(top_indices[i], top_indices[i + 1]) for i in range(1, panels - 1)]
+    edges += [(i, top_indices[i]) for i in range(1, panels)]
+    edges += [(0, top_indices[1]), (panels, top_indices[panels - 1])]
+    for i in range(1, panels - 1):
+        if i < panels / 2:
+            edges.append((top_indices[i], i + 1))
+        else:
+            edges.append((i, top_indices[i + 1]))
+    return _bridge_truss(coords, np.array(edges), floor_indices)
+
+# Random triangulated truss: random floor spacings and a few rows of jittered
+# nodes above the floor, connected by a Delaunay triangulation like the mostly
+# triangulated random bridges. `rows` rows give about 3*rows members per column.
+def random_truss(columns, rows=3, seed=0):
+    random = np.random.default_rng(seed)
+    spacings = random.uniform(0.6, 1.4, columns) * PANEL_LENGTH
+    floor_x = np.r_[0, np.cumsum(spacings)]
+    coords = [np.column_stack([floor_x, np.zeros(columns + 1)])]
+    for row in range(1, rows + 1):
+        x = floor_x[:-1] + spacings * random.uniform(0.3, 0.7, columns)
+        y = row * PANEL_HEIGHT + random.uniform(-0.2, 0.2, columns) * PANEL_HEIGHT
+        coords.append(np.column_stack([x, y]))
+    coords = np.vstack(coords)
+
+    triangles = Delaunay(coords).simplices
+    edges = np.sort(np.vstack([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [0, 2]]]), axis=1)
+    return _bridge_truss(coords, np.unique(edges, axis=0), np.arange(columns + 1))
+
+# Truss of a given kind with about `members` members.
+def make_truss(kind, members, seed=0):
+    if kind == "warren":
+        return warren_truss(max(2, round((members + 1) / 4)))
+    if kind == "pratt":
+        return pratt_truss(max(3, round((members + 3) / 4)))
+    if kind == "random":
+        return random_truss(max(2, round(members / 9)), rows=3, seed=seed)
+    raise ValueError("Unknown truss kind: " + str(kind))
+
+# Supports, weight forces and load forces like Bridge.init(floorSupports:) and
+# MinMaterialBridge.fitness(). floor_indices are the floor nodes, from left to
+# right.
+def _bridge_truss(coords, connectivity, floor_indices):
+    n = len(coords)
+    supports = np.unique(np.r_[floor_indices[::SUPPORT_SPACING], floor_indices[-1]])
+    fixed_dofs = [2*supports[0]] + list(2*supports + 1)
+
+    forces = np.zeros((n, 2))
+    lengths = np.linalg.norm(coords[connectivity[:, 1]] - coords[connectivity[:, 0]], axis=1)
+    weights = lengths * AREA * DENSITY * GRAVITY
+    np.add.at(forces[:, 1], connectivity.ravel(), -np.repeat(weights / 2, 2))
+    loaded = np.setdiff1d(floor_indices, supports)
+    forces[loaded, 1] -= TOTAL_LOAD / len(loaded)
+    return coords, connectivity, ELASTICITY, np.full(len(connectivity), AREA), fixed_dofs, forces
+
+
+# ---------------------------------------------------------------------------
+# Stages.
+# ---------------------------------------------------------------------------
+
+def _assembly(truss):
+    model = NusaPlus.build_model_from_arrays(*truss)
+    coords, connectivity, elasticities, areas, _, _ = NusaPlusCore._model_arrays(model)
+    directions, stiffnesses, _ = NusaPlusCore._element_geometry(coords, connectivity, elasticities, areas)
+    NusaPlusCore._assemble_stiffness(2*len(coords), connectivity, directions, stiffnesses)
+    return model
+
+def _draw(figure):
+    figure.canvas.draw()
+    plt.close("all")
+
+def _nusa_solve(truss):
+    coords, connectivity, E, A, fixed_dofs, forces = truss
+    model = TrussModel("Benchmark")
+    nodes = [Node((x, y)) for x, y in coords]
+    for node in nodes:
+        model.add_node(node)
+    for area, (i, j) in zip(A, connectivity):
+        model.add_element(Truss((nodes[i], nodes[j]), E, area))
+    for dof in fixed_dofs:
+        model.add_constraint(nodes[dof // 2], **{("ux", "uy")[dof % 2]: 0})
+    for node, (fx, fy) in zip(nodes, forces):
+        if fx != 0 or fy != 0:
+            model.add_force(node, (fx, fy))
+    model.solve()
+
+# Runs the stages of a truss once and returns {stage: (seconds, peak bytes)}.
+# Peak memory is only measured when tracemalloc is tracing.
+def _run_stages(truss, plots):
+    stages = [
+        ("assembly", lambda state: state.update(model=_assembly(truss))),
+        ("solvability", lambda state: NusaPlus.isModelSolvable(state["model"])),
+        ("solve", lambda state: NusaPlus.solve_model(state["model"], use_cache=False)),
+        ("stresses", lambda state: NusaPlus.stress_summary(state["model"])),
+        ("check_and_solve", lambda state: NusaPlus.check_and_solve(state["model"], use_cache=False)),
+    ]
+    if plots:
+        stages += [
+            ("plot_model", lambda state: _draw(NusaPlus.plot_model(state["model"]))),
+            ("plot_deformed", lambda state: _draw(NusaPlus.plot_deformed_shape(state["model"], shows_stresses=True))),
+        ]
+    if len(truss[1]) <= NUSA_MEMBER_LIMIT:
+        stages.append(("nusa_solve", lambda state: _nusa_solve(truss)))
+
+    results = {}
+    state = {}
+    for name, stage in stages:
+        gc.collect()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        stage(state)
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] - start if tracemalloc.is_tracing() else 0
+        results[name] = (seconds, peak)
+    return results
+
+# Benchmarks one truss: the best time of `repeats` runs and the peak memory of
+# an extra run with tracemalloc, which slows Python code down too much to be
+# timed.
+def benchmark_truss(kind, members, repeats=3, plots=True, seed=0):
+    truss = make_truss(kind, members, seed)
+    times = {}
+    for _ in range(repeats):
+        for name, (seconds, _) in _run_stages(truss, plots).items():
+            times[name] = min(seconds, times.get(name, np.inf))
+
+    tracemalloc.start()
+    try:
+        memory = {name: peak for name, (_, peak) in _run_stages(truss, plots).items()}
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "kind": kind,
+        "members": len(truss[1]),
+        "nodes": len(truss[0]),
+        "stages": {name: {"seconds": times[name], "peak_bytes": memory[name]} for name in times},
+    }
+
+def run_benchmarks(kinds, sizes, repeats=3, plots=True, seed=0):
+    cases = {}
+    for kind in kinds:
+        for size in sizes:
+            name = "%s-%d" % (kind, size)
+            cases[name] = benchmark_truss(kind, size, repeats, plots, seed)
+            cases[name]["size"] = size
+            _print_case(name, cases[name])
+    return {
+        "version": BASELINE_VERSION,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "max_rss_bytes": _max_rss_bytes(),
+        "repeats": repeats,
+        "seed": seed,
+        "cases": cases,
+    }
+
+# Maximum resident memory of the whole process so far, in bytes.
+def _max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes and Linux kilobytes.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+def _print_case(name, case):
+    stages = "  ".join("%s %.4fs %.1fMB" % (stage, result["seconds"], result["peak_bytes"] / 2**20)
+                       for stage, result in case["stages"].items())
+    print("%-14s %6d members  %s" % (name, case["members"], stages))
+
+
+# ---------------------------------------------------------------------------
+# Regressions.
+# ---------------------------------------------------------------------------
+
+# Compares results with a baseline and returns the regressions, as (case,
+# stage, metric, baseline value, new value) tuples. Times below min_seconds and
+# memory below min_bytes are too noisy to be compared.
+def compare_results(baseline, results, tolerance=0.3, min_seconds=5e-3, min_bytes=2**20):
+    regressions = []
+    for name, case in results["cases"].items():
+        baseline_case = baseline["cases"].get(name)
+        if baseline_case is None:
+            continue
+        for stage, result in case["stages"].items():
+            baseline_result = baseline_case["stages"].get(stage)
+            if baseline_result is None:
+                continue
+            for metric, minimum in (("seconds", min_seconds), ("peak_bytes", min_bytes)):
+                old, new = baseline_result[metric], result[metric]
+                if new > max(old, minimum) * (1 + tolerance):
+                    regressions.append((name, stage, metric, old, new))
+    return regressions
+
+def _print_comparison(baseline, results):
+    print()
+    print("%-14s %-14s %12s %12s %8s" % ("case", "stage", "baseline", "current", "ratio"))
+    for name, case in results["cases"].items():
+        baseline_case = baseline["cases"].get(name, {"stages": {}})
+        for stage, result in case["stages"].items():
+            old = baseline_case["stages"].get(stage, {}).get("seconds")
+            if old is None:
+                continue
+            print("%-14s %-14s %11.4fs %11.4fs %7.2fx" % (name, stage, old, result["seconds"], result["seconds"] / old))
+
+
+# ---------------------------------------------------------------------------
+# Import time.
+# ---------------------------------------------------------------------------
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import %s
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, sorted({name.split(".")[0] for name in sys.modules})]))
+"""
+
+# Imports a module in fresh processes and returns the best time in seconds and
+# the top level modules it loaded.
+def measure_import(module, repeats=5):
+    import subprocess
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    best, modules = None, []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_PROBE % module], cwd=directory,
+                                check=True, capture_output=True, text=True).stdout
+        seconds, modules = json.loads(output.splitlines()[-1])
+        best = seconds if best is None else min(best, seconds)
+    return best, modules
+
+# Returns the import budget violations, as (module, problem) tuples.
+def check_import_budgets(budgets=IMPORT_BUDGETS, repeats=5):
+    violations = []
+    for module, budget in budgets.items():
+        seconds, modules = measure_import(module, repeats)
+        print("%-14s %.3fs (budget %.3fs)" % (module, seconds, budget))
+        if seconds > budget:
+            violations.append((module, "takes %.3fs to import, over its %.3fs budget" % (seconds, budget)))
+        for lazy_module in LAZY_MODULES:
+            if lazy_module in modules:
+                violations.append((module, "imports %s" % lazy_module))
+    return violations
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks NusaPlus on parametric bridge trusses.")
+    parser.add_argument("--kinds", nargs="+", default=["warren", "pratt", "random"], choices=["warren", "pratt", "random"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000, 10000], help="approximate number of members")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random trusses")
+    parser.add_argument("--no-plots", action="store_true", help="skips the plot stages")
+    parser.add_argument("--output", help="saves the results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline to compare the results with; its cases are used by default")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative slowdown before a stage is a regression")
+    parser.add_argument("--min-seconds", type=float, default=5e-3, help="stage times below this are too noisy to be compared")
+    parser.add_argument("--import-budget", action="store_true", help="only checks the import time budgets")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.import_budget:
+        violations = check_import_budgets()
+        for module, problem in violations:
+            print("IMPORT BUDGET %s %s" % (module, problem))
+        return 1 if violations else 0
+
+    baseline = None
+    kinds, sizes = arguments.kinds, arguments.sizes
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        if baseline.get("version") != BASELINE_VERSION:
+            parser.error("unsupported baseline version: %s" % baseline.get("version"))
+        kinds = list(dict.fromkeys(case["kind"] for case in baseline["cases"].values()))
+        sizes = list(dict.fromkeys(case["size"] for case in baseline["cases"].values()))
+
+    results = run_benchmarks(kinds, sizes, arguments.repeats, not arguments.no_plots, arguments.seed)
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if baseline is not None:
+        _print_comparison(baseline, results)
+        regressions = compare_results(baseline, results, arguments.tolerance, arguments.min_seconds)
+        for name, stage, metric, old, new in regressions:
+            print("REGRESSION %s %s %s: %.4g -> %.4g" % (name, stage, metric, old, new))
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
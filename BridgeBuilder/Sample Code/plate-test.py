@@ -25,12 +25,14 @@ Dependencies:
     pip3 install -Iv meshio==3.3.1
 '''
 
-from nusa import *
-import nusa.mesh as nmsh
+import os
+import sys
 
-import pygmsh
+import matplotlib.pyplot as plt
+import numpy as np
 
-#md = nmsh.Modeler()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import NusaPlus
 
 # # Com With
 # with pygmsh.occ.Geometry() as geom:
@@ -46,29 +48,17 @@ import pygmsh
 # print(msh)
 # geom2.__exit__()
 
-with pygmsh.occ.Geometry() as geom:
-
-    geom.characteristic_length_min = 0.1
-    geom.characteristic_length_max = 0.1
-    rect = geom.add_rectangle([0.0, 0.0, 0.0], 1.0, 1.0)
-    circ = geom.add_disk([0.3,0.4,0.0], 0.2)
-    trapez = geom.add_polygon([[0.1,0.1,0.0], [0.4,0.1,0.0], [0.3, 0.3, 0.0], [0.2,0.3,0.0]])
-
-    toRemove = geom.boolean_union([circ, trapez])
-
-    geom.boolean_difference(rect, toRemove)
-
-    msh = geom.generate_mesh()
-
-for cell in msh.cells:
-    if cell.type == "triangle":
-        triangle_cells = cell.data
-    # elif  cell.type == "tetra":
-        # tetra_cells = cell.data
-
-#print(mesh)
-nc = msh.points
-ec = triangle_cells
+# A square plate with a disk and a trapezoid removed, meshed by
+# NusaPlus.plate_mesh() with pygmsh only the first time. Afterwards the mesh is
+# read from the mesh cache until the description changes.
+plate = {
+    "rectangle": (0.0, 0.0, 1.0, 1.0),
+    "disks": [(0.3, 0.4, 0.2)],
+    "polygons": [[(0.1, 0.1), (0.4, 0.1), (0.3, 0.3), (0.2, 0.3)]],
+    "characteristic_length_min": 0.1,
+    "characteristic_length_max": 0.1,
+}
+nc, ec = NusaPlus.plate_mesh(plate)
 
 '''
 geom = pygmsh.occ.Geometry()
@@ -90,39 +80,17 @@ x,y = nc[:,0], nc[:,1]
 
 print(x)
 
-nodos = []
-elementos = []
-
-for k,nd in enumerate(nc):
-    cn = Node((x[k],y[k]))
-    nodos.append(cn)
-
-for k,elm in enumerate(ec):
-    i,j,m = int(elm[0]),int(elm[1]),int(elm[2])
-    ni,nj,nm = nodos[i],nodos[j],nodos[m]
-    ce = LinearTriangle((ni,nj,nm),200e9,0.3,0.1)
-    elementos.append(ce)
-
-m = LinearTriangleModel()
-for node in nodos: m.add_node(node)
-for elm in elementos: m.add_element(elm)
-
-# Boundary conditions and loads
+# Boundary conditions and loads. NusaPlus solves the mesh arrays directly,
+# instead of creating a nusa Node and LinearTriangle for each point and cell,
+# so much finer meshes can be analysed.
 minx, maxx = min(x), max(x)
-miny, maxy = min(y), max(y)
-
-for node in nodos:
 
-    if node.x == minx:
-        m.add_constraint(node, ux=0, uy=0)
-    if node.x == maxx:
-        m.add_force(node, (10e3,0))
+fixed_dofs = [dof for k in np.flatnonzero(x == minx) for dof in (2*k, 2*k+1)]
+forces = np.zeros((len(nc), 2))
+forces[x == maxx, 0] = 10e3
 
-m.plot_model()
-m.solve()
-solvedNodes = m.get_nodes()
-for node in solvedNodes:
-    print(node.seqv)
+solution = NusaPlus.solve_plate(nc, ec, 200e9, 0.3, 0.1, fixed_dofs, forces)
+print(solution.nodal_von_mises)
 
-m.plot_nsol("seqv")
+NusaPlus.plot_plate(nc, ec, solution.nodal_von_mises, "seqv")
 plt.show()
@@ -11,14 +11,51 @@ import CoreGraphics
 import PythonKit
 
 
-/// Abstraction that translates a truss graph into a Nusa TrussModel and allows it's simulation, plots and
+/// Abstraction that translates a truss graph into a NusaPlus truss model and allows it's simulation, plots and
 /// more without the need to interact with PythonObjects on other abstraction layers.
 class Simulation {
 
-    /// Nusa's TrussModel. The core model that holds, nodes, elements, forces and much more. Used to
-    /// plot the truss, simulate forces, displacements and stresses.
+    /// NusaPlus `TrussArrays`. The core model that holds nodes, elements, forces and much more, as a
+    /// few contiguous arrays instead of a nusa object per node and element. Used to plot the truss,
+    /// simulate forces, displacements and stresses. Every NusaPlus function accepts it, and
+    /// `model.to_model()` converts it into a nusa TrussModel when nusa objects are needed.
     var model: PythonObject
 
+    /// Preconditioners of the NusaPlus iterative solver.
+    enum Preconditioner: String {
+        /// Incomplete LU factorization of the stiffness matrix.
+        case ilu
+        /// Diagonal of the stiffness matrix. Free to build, but long trusses
+        /// need many more iterations with it.
+        case jacobi
+    }
+
+    /// Solvers that `solve()` can use.
+    enum Solver {
+        /// Sparse direct solver, which factorizes the stiffness matrix.
+        case direct
+        /// Preconditioned conjugate gradient, starting from the displacements
+        /// the vertices had in their last simulation. It stops once an
+        /// iteration changes no edge stress by more than `tolerance` times the
+        /// largest stress. If it doesn't converge, the model is solved again
+        /// with the direct solver.
+        case iterative(preconditioner: Preconditioner, tolerance: Double)
+    }
+
+    /// Solver used by `solve()`. Mutated and crossed over genes keep the
+    /// displacements of their parents in their vertices, so the iterative
+    /// solver starts close to their solution. Defaults to `.direct`.
+    static var solver: Solver = .direct
+
+    /// Number of iterations of the last `solve()` with the iterative solver.
+    /// Nil if the model wasn't solved iteratively.
+    private(set) var iterations: Int?
+
+    /// False if the iterative solver of the last `solve()` reached its maximum
+    /// number of iterations, so the model was solved again with the direct
+    /// solver. Nil if the model wasn't solved iteratively.
+    private(set) var converged: Bool?
+
     /// Used for maintaining a fixed frame across multiple plots, for example
     /// for creating an evolution animation. It should have 4 values which
     /// represent [minX, maxX, minY, maxY].
@@ -32,51 +69,69 @@ class Simulation {
     /// metrics evolution, like best fitness for each generation.
     static let specialPlotsPath = #"/Users/hugo/Desktop/Special Plots"#
 
+    /// Path to folder that will contain the run logs, from which plots of any
+    /// run can be rendered afterwards.
+    static let runLogsPath = #"/Users/hugo/Desktop/Run Logs"#
+
+    /// Vertices of the simulated graph in the order of the nusa nodes, so the
+    /// vertex at index i is the node with label i.
+    let vertices: [Vertex]
+
+    /// Edges of the simulated graph in the order of the nusa elements, so the
+    /// edge at index i is the element with label i.
+    let edges: [Edge]
+
     init(graph: Graph) {
-        // Dictionary that associates a vertex id to respective nusa node.
-        var nusaNodes: [UUID:PythonObject] = [:] // [Vertex.id:Nusa.Node]
-        // Stores vertices from graphs as Nusa Nodes dictionary.
-        for vertex in graph.allVertices {
-            let node = Nusa.Node([vertex.position.x, vertex.position.y])
-            nusaNodes[vertex.id] = node
+        vertices = Simulation.orderedVertices(of: graph)
+        // Dictionary that associates a vertex id to respective nusa node label.
+        var nodeLabels: [UUID:Int] = [:] // [Vertex.id:Label]
+        for (label, vertex) in vertices.enumerated() {
+            nodeLabels[vertex.id] = label
         }
 
-        // Stores edges of the graph as Nusa (Truss) Elements.
-        var nusaElements: [PythonObject] = [] // [Nusa.Truss]
-        for edge in graph.allEgdes {
-            let vertices = Array(edge.vertices)
-            let nodeA = nusaNodes[vertices[0].id] // nusa node
-            let nodeB = nusaNodes[vertices[1].id] // nusa node
-            let element = Nusa.Truss([nodeA, nodeB], edge.elasticity, edge.area)
-            nusaElements.append(element)
+        // Flat buffers with the vertices positions, forces and fixed
+        // coordinates, which become nusa nodes, forces and constraints.
+        var coordinates: [Double] = []
+        var forces: [Double] = []
+        var fixedDOFs: [Int] = []
+        for (label, vertex) in vertices.enumerated() {
+            coordinates += [Double(vertex.position.x), Double(vertex.position.y)]
+            forces += [Double(vertex.force?.dx ?? 0), Double(vertex.force?.dy ?? 0)]
+            if vertex.isXSimulationFixed { fixedDOFs.append(2*label) }
+            if vertex.isYSimulationFixed { fixedDOFs.append(2*label + 1) }
         }
 
-        // Adds nodes and elements to the nusa model.
-        model = Nusa.TrussModel()
-        for node in Array(nusaNodes.values) {
-            model.add_node(node)
-        }
-        for element in nusaElements {
-            model.add_element(element)
+        // Edges of the graph become Nusa (Truss) elements, sorted by their
+        // node labels.
+        let labeledEdges = graph.allEgdes
+            .map { edge in (labels: edge.vertices.map { nodeLabels[$0.id]! }.sorted(), edge: edge) }
+            .sorted { $0.labels.lexicographicallyPrecedes($1.labels) }
+        edges = labeledEdges.map { $0.edge }
+        var connectivity: [Int] = []
+        var elasticities: [Double] = []
+        var areas: [Double] = []
+        for (labels, edge) in labeledEdges {
+            connectivity += labels
+            elasticities.append(edge.elasticity)
+            areas.append(edge.area)
         }
 
-        // Adds forces and constraints to the nusa model.
-        for vertex in graph.allVertices {
-            if let force = vertex.force {
-                model.add_force(nusaNodes[vertex.id], [force.dx, force.dy])
-            }
+        // Builds the whole model with a single Python call.
+        model = NusaPlus.TrussArrays.from_arrays(coordinates, connectivity, elasticities, areas, fixedDOFs, forces)
+    }
 
-            if vertex.isXSimulationFixed && vertex.isYSimulationFixed{
-                model.add_constraint(nusaNodes[vertex.id], ux: 0, uy: 0)
-            }
-            else if vertex.isXSimulationFixed {
-                model.add_constraint(nusaNodes[vertex.id], ux: 0)
-            }
-            else if vertex.isYSimulationFixed {
-                model.add_constraint(nusaNodes[vertex.id], uy: 0)
-            }
+    /// Vertices of a graph in a deterministic order, unlike `graph.allVertices`
+    /// which follows the dictionary order of the adjacency list. They are sorted
+    /// by position and then by id, so the same graph always gives the same
+    /// nusa model and reproducible results.
+    /// - Parameter graph: Graph with the vertices to be sorted.
+    /// - Returns: Sorted vertices of the graph.
+    static func orderedVertices(of graph: Graph) -> [Vertex] {
+        return graph.allVertices.sorted { a, b in
+            if a.position.x != b.position.x { return a.position.x < b.position.x }
+            if a.position.y != b.position.y { return a.position.y < b.position.y }
+            return a.id.uuidString < b.id.uuidString
         }
-
     }
 
 
@@ -87,28 +142,306 @@ class Simulation {
         return Bool(NusaPlus.isModelSolvable(model))!
     }
 
+    /// Checks if the truss model is solvable and, if it is, solves it with the
+    /// same factorization of the stiffness matrix, in a single NusaPlus call.
+    /// NusaPlus keeps the factorization, so solving a model of the same truss
+    /// later, even with other forces, doesn't factorize it again.
+    /// - Returns: True, if the model is solvable and was solved. False, otherwise.
+    func checkAndSolve() -> Bool {
+        let result = NusaPlus.check_and_solve(model)
+        cachedStressSummary = nil
+        return String(result.status)! == "solved"
+    }
+
+    /// Creates a NusaPlus `SolvedTruss` from the model. It keeps the stiffness
+    /// matrix factorized, so edges can be added, removed or changed and the
+    /// solvability and stresses of the result are known with low rank updates
+    /// instead of a new simulation. Its element indices are the indices of
+    /// `edges`.
+    /// - Returns: Python `SolvedTruss` object of the model.
+    func solvedTruss() -> PythonObject {
+        return NusaPlus.SolvedTruss.from_model(model)
+    }
+
+    /// Checks if a graph is solvable without creating its truss model unless needed.
+    ///
+    /// Most graphs that are not solvable are mechanisms, which are rejected by
+    /// `isRigid(graph:)` from their topology and supports alone. Only rigid
+    /// graphs are converted into a truss model for the numeric check, which is
+    /// done by `checkAndSolve()`, so the fitness evaluation of an accepted
+    /// graph reuses the factorization of its check.
+    /// - Parameter graph: Graph to be checked.
+    /// - Returns: True, if the graph is solvable. False, otherwise.
+    static func isSolvable(graph: Graph) -> Bool {
+        guard isRigid(graph: graph) else { return false }
+        return Simulation(graph: graph).checkAndSolve()
+    }
+
+    /// Checks if a graph is rigid and well supported from its edges and fixed
+    /// coordinates only, with the NusaPlus pebble game. It doesn't look at the
+    /// vertices positions, so a rigid graph may still be unsolvable because of
+    /// collinear or parallel edges.
+    /// - Parameter graph: Graph to be checked.
+    /// - Returns: True, if the graph is generically rigid. False, otherwise.
+    static func isRigid(graph: Graph) -> Bool {
+        let vertices = orderedVertices(of: graph)
+        var indices: [UUID:Int] = [:] // [Vertex.id:Index]
+        for (index, vertex) in vertices.enumerated() {
+            indices[vertex.id] = index
+        }
+
+        let edges = graph.allEgdes.map { edge in edge.vertices.map { indices[$0.id]! } }
+
+        var constrainedDOFs: [Int] = []
+        for (index, vertex) in vertices.enumerated() {
+            if vertex.isXSimulationFixed { constrainedDOFs.append(2*index) }
+            if vertex.isYSimulationFixed { constrainedDOFs.append(2*index + 1) }
+        }
+
+        return Bool(NusaPlus.check_rigidity(vertices.count, edges, constrainedDOFs).is_rigid)!
+    }
+
+    /// Gets the counters of the NusaPlus solve cache, which keeps the results of
+    /// solved trusses so identical ones (like unchanged copies of elite
+    /// individuals) are not solved again.
+    /// - Returns: Number of cache hits and misses since the cache was cleared.
+    static func solveCacheInfo() -> (hits: Int, misses: Int) {
+        let info = NusaPlus.solve_cache_info()
+        return (Int(info.hits)!, Int(info.misses)!)
+    }
+
+    /// Turns the NusaPlus instrumentation on or off. While on, NusaPlus records
+    /// call counts and times of its main functions, matrix sizes, solvability
+    /// rejects and solve cache hits. While off, it costs next to nothing.
+    /// - Parameter enabled: True to record, false to stop. Defaults to true.
+    static func enableInstrumentation(_ enabled: Bool = true) {
+        NusaPlus.enable_instrumentation(enabled)
+    }
+
+    /// Gets a text report of what the NusaPlus instrumentation recorded, with
+    /// one line per function and a line with counters and rates.
+    /// - Parameter reset: Starts recording from scratch after the report, so
+    ///   each report covers a single generation. Defaults to true.
+    /// - Returns: Instrumentation report.
+    static func instrumentationReport(reset: Bool = true) -> String {
+        let snapshot = NusaPlus.instrumentation_snapshot(reset: reset)
+        return String(NusaPlus.format_instrumentation(snapshot))!
+    }
+
     /// Simulates the nusa model. Required before retrieving stresses, displacements and other simulated
     /// attributes.
+    ///
+    /// Uses the NusaPlus sparse solver, which gives the same results as nusa's `solve()` without
+    /// assembling and solving a dense stiffness matrix, or its iterative solver (see `solver`).
+    /// Afterwards, each vertex keeps its displacement, so copies of the graph start from it.
     func solve() {
-        model.solve()
+        switch Simulation.solver {
+        case .direct:
+            NusaPlus.solve_model(model)
+            iterations = nil
+            converged = nil
+        case .iterative(let preconditioner, let tolerance):
+            // Vertices without a displacement, like new ones, start from zero.
+            let initialDisplacements = vertices.flatMap { vertex -> [Double] in
+                guard let displacement = vertex.displacement else { return [.nan, .nan] }
+                return [Double(displacement.dx), Double(displacement.dy)]
+            }
+            let result = NusaPlus.solve_model_iterative(model, initialDisplacements, preconditioner.rawValue, tolerance)
+            iterations = Int(result.iterations)!
+            converged = Bool(result.converged)!
+
+            // Displacements of an unconverged solve would be read as solved.
+            if converged == false {
+                NusaPlus.solve_model(model)
+            }
+        }
+        cachedStressSummary = nil
+
+        let displacements = [Double](numpy: model.displacements)!
+        for (label, vertex) in vertices.enumerated() {
+            vertex.displacement = CGVector(dx: displacements[2*label], dy: displacements[2*label + 1])
+        }
+    }
+
+    /// Finds the largest multiple of a load that the truss supports on top of its
+    /// current forces, without any edge stress going above a limit. The current
+    /// forces and the load are solved with a single factorization and the
+    /// multiple is calculated in closed form by NusaPlus, so this costs about
+    /// the same as `solve()`. Afterwards, the model is solved for the current
+    /// forces plus the maximum load.
+    /// - Parameters:
+    ///   - unitLoads: Load forces of each vertex id, usually a load of 1 N.
+    ///     Vertices not in the dictionary receive no load.
+    ///   - stressLimit: Maximum stress an edge can handle.
+    /// - Returns: Maximum multiplier of the load. Minus infinity if the truss
+    ///   fails even without the load, and infinity if the load doesn't stress
+    ///   any edge.
+    func maximumLoad(unitLoads: [UUID:CGVector], stressLimit: Double) -> Double {
+        let multiplier = Double(NusaPlus.maximum_load(model, nodalForces(unitLoads), stressLimit))!
+        cachedStressSummary = nil
+        return multiplier
+    }
+
+    /// Areas found by `fullyStressedDesign(stressLimit:areaRange:tolerance:density:weightFactor:)`.
+    struct FullyStressedDesign {
+        /// Areas of the edges, in the order of `edges`.
+        let areas: [Double]
+        /// Mass of the truss with these areas, in kg.
+        let mass: Double
+        /// Number of times the truss was solved.
+        let iterations: Int
+        /// False if the areas were still changing after the maximum number of
+        /// iterations.
+        let converged: Bool
+        /// Maximum absolute stress of an edge with these areas.
+        let maxStress: Double
+    }
+
+    /// Sizes every edge of the truss for a stress limit with the NusaPlus fully
+    /// stressed design loop: each edge area is repeatedly multiplied by its
+    /// stress over the limit, within the area range, and the truss is solved
+    /// again until the areas stop changing. The whole loop runs in a single
+    /// Python call and the model itself isn't changed.
+    /// - Parameters:
+    ///   - stressLimit: Maximum stress an edge can handle.
+    ///   - areaRange: Range of possible edge areas.
+    ///   - tolerance: Relative area change below which the areas are
+    ///     considered converged. Defaults to 1e-3.
+    ///   - density: Density of the edges material, for the mass. Defaults to
+    ///     `Gene.edgeDensity`.
+    ///   - weightFactor: Weight force per unit of mass of the edges, when the
+    ///     model forces include the edges weights (see `Gene.addWeightForces()`),
+    ///     so they are updated with the areas. Defaults to 0, no weights.
+    /// - Returns: Sized areas and their results.
+    func fullyStressedDesign(stressLimit: Double, areaRange: ClosedRange<CGFloat>, tolerance: Double = 1e-3, density: CGFloat = Gene.edgeDensity, weightFactor: CGFloat = 0) -> FullyStressedDesign {
+        let design = NusaPlus.fully_stressed_design(
+            model,
+            stressLimit,
+            [Double(areaRange.lowerBound), Double(areaRange.upperBound)],
+            tolerance,
+            Double(density),
+            Double(weightFactor)
+        )
+        return FullyStressedDesign(
+            areas: [Double](numpy: design.areas)!,
+            mass: Double(design.mass)!,
+            iterations: Int(design.iterations)!,
+            converged: Bool(design.converged)!,
+            maxStress: Double(design.max_stress)!
+        )
+    }
+
+    /// Measure of a truss whose sensitivities are computed by
+    /// `sensitivities(measure:density:)`.
+    enum SensitivityMeasure {
+        /// Maximum absolute stress of an edge.
+        case maxStress
+        /// Mean of the `count` largest absolute stresses.
+        case topMeanStress(count: Int)
+        /// Mass of the edges, constrained by a maximum stress.
+        case mass(stressLimit: Double)
+    }
+
+    /// Value of a measure and its gradients with respect to the vertices
+    /// positions and the edge areas.
+    struct Sensitivities {
+        /// Value of the measure.
+        let value: Double
+        /// Gradients of the vertices positions, in the order of `vertices`.
+        let vertexGradients: [CGVector]
+        /// Gradients of the edge areas, in the order of `edges`.
+        let areaGradients: [Double]
+    }
+
+    /// Computes how a measure of the truss changes when its vertices move or
+    /// its edge areas change, for the current forces. NusaPlus solves the
+    /// model and one adjoint system with the same factorization, so all
+    /// gradients cost about two solves. The forces are taken as constant, so
+    /// weight forces aren't differentiated. Only valid for solvable models.
+    /// - Parameters:
+    ///   - measure: Measure to be differentiated.
+    ///   - density: Density of the edges material, for the mass. Defaults to
+    ///     `Gene.edgeDensity`.
+    /// - Returns: Sensitivities of the measure and, for the mass, of the stress
+    ///   constraint, whose value is the maximum stress over the limit minus one
+    ///   (positive when the limit is exceeded).
+    func sensitivities(measure: SensitivityMeasure, density: CGFloat = Gene.edgeDensity) -> (objective: Sensitivities, constraint: Sensitivities?) {
+        let result: PythonObject
+        switch measure {
+        case .maxStress:
+            result = NusaPlus.stress_sensitivities(model, measure: "max")
+        case .topMeanStress(let count):
+            result = NusaPlus.stress_sensitivities(model, measure: "top_mean", top_count: count)
+        case .mass(let stressLimit):
+            result = NusaPlus.stress_sensitivities(model, measure: "mass", stress_limit: stressLimit, density: Double(density))
+        }
+
+        func makeSensitivities(value: PythonObject, coordinates: PythonObject, areas: PythonObject) -> Sensitivities {
+            let gradients = [Double](numpy: coordinates.ravel())!
+            return Sensitivities(
+                value: Double(value)!,
+                vertexGradients: stride(from: 0, to: gradients.count, by: 2).map { CGVector(dx: gradients[$0], dy: gradients[$0 + 1]) },
+                areaGradients: [Double](numpy: areas)!
+            )
+        }
+
+        let objective = makeSensitivities(value: result.value, coordinates: result.coordinates, areas: result.areas)
+        guard result.constraint != Python.None else { return (objective, nil) }
+        let constraint = makeSensitivities(value: result.constraint, coordinates: result.constraint_coordinates, areas: result.constraint_areas)
+        return (objective, constraint)
+    }
+
+    /// Stresses of a solved model, read from NusaPlus with a single call.
+    struct StressSummary {
+        /// Stresses of the elements, in the order of the nusa elements.
+        let stresses: [Double]
+        /// Maximum absolute stress.
+        let maxStress: Double
+        /// Mean absolute stress.
+        let meanStress: Double
+        /// Number of largest absolute stresses averaged in `topMeanStress`.
+        let topCount: Int
+        /// Mean of the `topCount` largest absolute stresses.
+        let topMeanStress: Double
+    }
+
+    /// Summary of the last solution, so fitness functions that need several
+    /// stress metrics don't read all element stresses again for each one.
+    private var cachedStressSummary: StressSummary?
+
+    /// Gets all element stresses and their metrics after simulation with a
+    /// single call to Python. The result is kept until the model is solved again.
+    /// - Parameter topCount: Number of largest stresses averaged in
+    ///   `topMeanStress`. Defaults to 3.
+    /// - Returns: Stresses summary of the solved model.
+    func stressSummary(topCount: Int = 3) -> StressSummary {
+        if let summary = cachedStressSummary, summary.topCount == topCount {
+            return summary
+        }
+
+        let summary = NusaPlus.stress_summary(model, topCount)
+        let stressSummary = StressSummary(
+            stresses: [Double](numpy: summary.stresses)!,
+            maxStress: Double(summary.max_stress)!,
+            meanStress: Double(summary.mean_stress)!,
+            topCount: topCount,
+            topMeanStress: Double(summary.top_mean_stress)!
+        )
+        cachedStressSummary = stressSummary
+        return stressSummary
     }
 
     /// Gets the maximum stress of an edge after simulation.
     /// - Returns: Maximum stress of an edge.
     func maxStress() -> Double {
-        let solvedElements = Array(model.get_elements())
-        let stresses = solvedElements.map { abs(Double($0.s)!) }
-        return stresses.max()!
+        return (cachedStressSummary ?? stressSummary()).maxStress
     }
 
     /// Gets a mean stress from the N most stressed elements.
     /// - Parameter count: Number of element stresses consider.
     /// - Returns: Mean stress of the N most stresses elements.
     func maxStressesMean(count: Int) -> Double {
-        let solvedElements = Array(model.get_elements())
-        let stresses = solvedElements.map { abs(Double($0.s)!) }
-        let maxStresses = Array(stresses.sorted().reversed()[...(count-1)])
-        return maxStresses.reduce(0.0, +)/Double(count)
+        return stressSummary(topCount: count).topMeanStress
     }
 
     /*
@@ -141,9 +474,7 @@ class Simulation {
     /// Gets the mean stress of the edges after simulation.
     /// - Returns: Mean stress of the edges.
     func meanStress() -> Double {
-        let solvedElements = Array(model.get_elements())
-        let stresses = solvedElements.map { abs(Double($0.s)!) }
-        return stresses.reduce(0, +)/Double(stresses.count)
+        return (cachedStressSummary ?? stressSummary()).meanStress
     }
 
 
@@ -208,6 +539,88 @@ class Simulation {
         let _ = NusaPlus.plot_deformed_shape(model, deformingFactor, isProportional, showsStresses)
     }
 
+    /// A plot of the model saved by `savePlotsInBackground(_:)`.
+    struct PlotView {
+        enum Kind: String {
+            /// Model with forces and areas, like `saveModelPlot`.
+            case model
+            /// Model and deformed shape, like `saveDeformedShapePlot`. Requires
+            /// a solved model.
+            case deformed
+        }
+
+        enum Forces {
+            /// Forces of the simulated graph.
+            case applied
+            /// No forces.
+            case hidden
+            /// Other forces of each vertex id. Vertices not in the dictionary
+            /// have no force.
+            case custom([UUID:CGVector])
+        }
+
+        var kind: Kind = .model
+        /// Path to folder where the images should be saved.
+        var path: String
+        /// Name of the images. It will be appended by the current date.
+        var name: String
+        /// Forces shown by model plots.
+        var forces: Forces = .applied
+        var isProportional: Bool = true
+        var showsStresses: Bool = false
+        var deformingFactor: Double = 1
+        var stressLimit: CGFloat = 0
+        var plotFrame: [CGFloat] = []
+    }
+
+    /// Saves images of several plots of the model, like `saveModelPlot` and
+    /// `saveDeformedShapePlot`, without waiting for them to be drawn. The model
+    /// is read once and NusaPlus draws and writes the images in a background
+    /// process, so this only blocks when many plots are already waiting.
+    /// - Parameter views: Plots to be saved.
+    func savePlotsInBackground(_ views: [PlotView]) {
+        let pythonViews: [PythonObject] = views.map { view in
+            let forces: PythonObject
+            switch view.forces {
+            case .applied: forces = "applied"
+            case .hidden: forces = "none"
+            case .custom(let vertexForces): forces = PythonObject(nodalForces(vertexForces))
+            }
+
+            let pythonView: [String:PythonObject] = [
+                "kind": PythonObject(view.kind.rawValue),
+                "path": PythonObject(Simulation.figurePath(toPath: view.path, withName: view.name)),
+                "forces": forces,
+                "is_proportional": PythonObject(view.isProportional),
+                "shows_stresses": PythonObject(view.showsStresses),
+                "deform_factor": PythonObject(view.deformingFactor),
+                "maximum_stress": PythonObject(view.stressLimit),
+                "fixed_frame": PythonObject(view.plotFrame),
+            ]
+            return PythonObject(pythonView)
+        }
+        NusaPlus.render_views(model, pythonViews)
+    }
+
+    /// Waits until all plots of `savePlotsInBackground(_:)` are saved.
+    static func waitForBackgroundPlots() {
+        NusaPlus.wait_for_renders()
+    }
+
+    /// Flat array with the forces of the vertices in the order of the nusa
+    /// nodes, [fx0, fy0, fx1, fy1, ...].
+    /// - Parameter vertexForces: Forces of each vertex id. Vertices not in the
+    ///   dictionary have no force.
+    /// - Returns: Nodal forces of the model vertices.
+    func nodalForces(_ vertexForces: [UUID:CGVector]) -> [Double] {
+        var forces: [Double] = []
+        for vertex in vertices {
+            let force = vertexForces[vertex.id] ?? CGVector()
+            forces += [Double(force.dx), Double(force.dy)]
+        }
+        return forces
+    }
+
     /// Plots lines from two arrays of numbers: X and Y and saves it.
     static func saveXYPlot(x: [CGFloat], y: [CGFloat], xLabel: String, yLabel: String, showsMarkers: Bool, path: String, name: String) {
         let figure = Pyplot.figure()
@@ -238,9 +651,19 @@ class Simulation {
     ///     "/Users/hugo/Desktop/evolution"
     ///   - name: Name of the image. It will be appended by the current date.
     static func saveFigure(toPath path: String, withName name: String) {
+        let filePath = figurePath(toPath: path, withName: name)
+        Pyplot.savefig("\(filePath).pdf", dpi: 300)
+        Pyplot.savefig("\(filePath).png", dpi: 300)
+    }
+
+    /// Path of an image on disk, without the extension.
+    /// - Parameters:
+    ///   - path: Path to folder where the image should be saved.
+    ///   - name: Name of the image. It will be appended by the current date.
+    /// - Returns: Path of the image, with the current date before its name.
+    static func figurePath(toPath path: String, withName name: String) -> String {
         let currentDate = String(Date().timeIntervalSinceReferenceDate).replacingOccurrences(of: ".", with: "")
-        Pyplot.savefig("\(path)/\(currentDate) \(name).pdf", dpi: 300)
-        Pyplot.savefig("\(path)/\(currentDate) \(name).png", dpi: 300)
+        return "\(path)/\(currentDate) \(name)"
     }
 
     /// Shows the plots by calling `Pyplot.show()`. Make sure matplotlib is not
@@ -251,3 +674,56 @@ class Simulation {
     }
 
 }
+
+
+/// Append-only binary log of an evolution run, written by NusaPlus. It keeps
+/// the fitness statistics of every generation and the solved trusses of the
+/// logged bridges, so their plots, statistics plots and animation frames can be
+/// rendered afterwards at any resolution, with `python NusaPlus.py <log>
+/// <folder>`, instead of during the run.
+class RunLog {
+
+    /// NusaPlus `RunLogWriter` of the log.
+    private let writer: PythonObject
+
+    /// Path of the log file.
+    let path: String
+
+    /// Creates a new run log file named with the current date.
+    /// - Parameter folder: Path to folder where the log is created, which is
+    ///   created too if it doesn't exist. Defaults to `Simulation.runLogsPath`.
+    init(folder: String = Simulation.runLogsPath) {
+        path = Simulation.figurePath(toPath: folder, withName: "Run") + ".bblog"
+        writer = NusaPlus.RunLogWriter(path)
+    }
+
+    /// Records the fitness statistics of a generation.
+    /// - Parameters:
+    ///   - generation: Generation number.
+    ///   - bestFitness: Best fitness so far.
+    ///   - fitnessMean: Fitness mean of the generation.
+    ///   - fitnessStandardDeviation: Fitness standard deviation of the
+    ///     generation.
+    func logGeneration(_ generation: Int, bestFitness: CGFloat, fitnessMean: CGFloat, fitnessStandardDeviation: CGFloat) {
+        writer.log_generation(generation, bestFitness, fitnessMean, fitnessStandardDeviation)
+    }
+
+    /// Records the truss of a simulation, with its results if it is solved.
+    /// - Parameters:
+    ///   - simulation: Simulation of the truss.
+    ///   - generation: Generation number of the truss. Used for metadata.
+    ///   - fitness: Fitness of the truss.
+    ///   - loadForces: Load forces of each vertex id, shown by load forces
+    ///     plots. Defaults to nil, for no load forces plots.
+    func logTruss(of simulation: Simulation, generation: Int, fitness: CGFloat, loadForces: [UUID:CGVector]? = nil) {
+        let nodalLoadForces = loadForces.map { PythonObject(simulation.nodalForces($0)) } ?? Python.None
+        writer.log_truss(generation, fitness, simulation.model, nodalLoadForces)
+    }
+
+    /// Closes the log file. Records are written as soon as they are logged,
+    /// so this only releases the file.
+    func close() {
+        writer.close()
+    }
+
+}
@@ -52,7 +52,7 @@ class Tower: Gene {
         
         // To be safe, if the graph still not solvable, keep adding random
         // vertices until it becomes solvable. This is probably not needed.
-        while !Simulation(graph: graph).isSolvable() {
+        while !Simulation.isSolvable(graph: graph) {
             proxyGene.addRandomVertex(shouldIgnoreSolvability: true)
         }
 